@@ -0,0 +1,53 @@
+"""
+Shared request dependencies
+"""
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from core.database import get_async_db
+from services.auth import AuthService
+
+# Security
+security = HTTPBearer(auto_error=False)
+
+auth_service = AuthService()
+
+# Dependency to get current user
+async def get_current_user(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> Optional[dict]:
+    """Get current user from session or token"""
+    # Check session first
+    user_id = request.session.get("user_id")
+    if user_id:
+        return {"user_id": user_id, "email": request.session.get("email")}
+    
+    # Check token if provided
+    if credentials:
+        try:
+            payload = auth_service.verify_token(credentials.credentials)
+            return payload
+        except:
+            pass
+    
+    return None
+
+async def require_user_id(
+    current_user: Optional[dict] = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> int:
+    """Id of the signed-in user; 401 for anonymous requests
+    
+    Bearer tokens only carry the email, so those are resolved to an id
+    through the user cache.
+    """
+    if current_user:
+        if current_user.get("user_id"):
+            return current_user["user_id"]
+        user = await auth_service.get_cached_user(db, current_user["email"])
+        if user and user.is_active:
+            return user.id
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
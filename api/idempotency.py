@@ -0,0 +1,48 @@
+"""
+Idempotency-Key support for API routes that change state
+"""
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Awaitable, Callable, Optional
+
+from api.responses import FastJSONResponse
+from services.idempotency import IdempotencyConflict, idempotency_store
+
+MAX_KEY_LENGTH = 255
+
+async def idempotent(
+    request: Request,
+    db: AsyncSession,
+    user_id: int,
+    key: Optional[str],
+    call: Callable[[], Awaitable[Response]]
+) -> Response:
+    """Run call once per Idempotency-Key; retries get the stored response
+    
+    Without a key the call simply runs. Errors raised as HTTPException
+    are stored only if a retry would get the same one (400, 422); others,
+    such as an out-of-stock 409, leave the key free for the retry.
+    Replayed responses carry an Idempotent-Replayed header.
+    """
+    if key is None:
+        return await call()
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    
+    async def handle():
+        try:
+            response = await call()
+        except HTTPException as e:
+            response = FastJSONResponse({"detail": e.detail}, status_code=e.status_code)
+        return response.status_code, bytes(response.body)
+    
+    request_hash = idempotency_store.fingerprint(request.method, request.url.path, await request.body())
+    try:
+        status_code, body, replayed = await idempotency_store.run(db, user_id, key, request_hash, handle)
+    except IdempotencyConflict as e:
+        # 409 while the first request is running (retry later), 422 for a
+        # key reused with a different request
+        raise HTTPException(status_code=409 if e.in_progress else 422, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
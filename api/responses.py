@@ -0,0 +1,59 @@
+"""
+Fast JSON responses and sparse fieldsets for the API
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, List, Optional, Sequence, Type
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered straight from plain Python data
+    
+    Uses orjson when installed and skips FastAPI's response_model
+    validation and jsonable_encoder pass, so callers must hand it
+    already-projected dicts, lists and scalars.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> List[str]:
+    """Resolve a ?fields=a,b,c parameter against a schema's fields
+    
+    Returns every schema field when fields is empty. Raises a 400 for
+    names the schema does not define.
+    """
+    allowed = list(schema.model_fields)
+    if not fields:
+        return allowed
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    return requested
+
+def project(obj: Any, fields: Sequence[str]) -> dict:
+    """Copy the named attributes of an ORM object into a dict"""
+    return {name: getattr(obj, name) for name in fields}
+
+def project_all(objects: Iterable[Any], fields: Sequence[str]) -> List[dict]:
+    """Project every object in objects"""
+    return [{name: getattr(obj, name) for name in fields} for obj in objects]
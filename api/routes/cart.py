@@ -0,0 +1,97 @@
+"""
+Shopping cart API routes
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional
+
+from api.deps import require_user_id
+from api.idempotency import idempotent
+from api.responses import FastJSONResponse
+from core.database import get_async_db
+from models.schemas import CartAdd, CartUpdate, CartRemove, CartBatch, CartSummary
+from services.cart import CartService
+from services.inventory import OutOfStockError
+
+router = APIRouter(prefix="/api/cart", tags=["cart"], default_response_class=FastJSONResponse)
+
+cart_service = CartService()
+
+async def apply_operations(
+    request: Request,
+    db: AsyncSession,
+    user_id: int,
+    idempotency_key: Optional[str],
+    operations: List[Dict[str, Any]]
+):
+    """Apply operations in one transaction and respond with the new cart
+    
+    A retry sent with the same Idempotency-Key gets the first response
+    instead of applying the operations again.
+    """
+    async def apply():
+        try:
+            cart_items = await cart_service.apply_cart_operations(db, user_id, operations)
+        except OutOfStockError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return FastJSONResponse(cart_service.summarize(cart_items))
+    
+    return await idempotent(request, db, user_id, idempotency_key, apply)
+
+@router.get("", response_model=CartSummary)
+async def get_cart(
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Current cart with totals"""
+    cart_items = await cart_service.get_cart_items(db, user_id)
+    return FastJSONResponse(cart_service.summarize(cart_items))
+
+@router.post("/add", response_model=CartSummary)
+async def add_to_cart(
+    item: CartAdd,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Add a product to the cart"""
+    return await apply_operations(request, db, user_id, idempotency_key, [{"op": "add", **item.model_dump()}])
+
+@router.put("/update", response_model=CartSummary)
+async def update_cart_item(
+    item: CartUpdate,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Change a cart line's quantity (0 removes it)"""
+    return await apply_operations(request, db, user_id, idempotency_key, [{"op": "update", **item.model_dump()}])
+
+@router.delete("/remove", response_model=CartSummary)
+async def remove_from_cart(
+    item: CartRemove,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Remove a cart line"""
+    return await apply_operations(request, db, user_id, idempotency_key, [{"op": "remove", **item.model_dump()}])
+
+@router.post("/batch", response_model=CartSummary)
+async def batch_update_cart(
+    batch: CartBatch,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Apply many add/update/remove operations in one transaction
+    
+    Either every operation is applied or none is.
+    """
+    return await apply_operations(request, db, user_id, idempotency_key, [op.model_dump() for op in batch.operations])
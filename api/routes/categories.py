@@ -0,0 +1,25 @@
+"""
+Category API routes
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from api.responses import FastJSONResponse, parse_fields, project_all
+from core.database import get_async_db
+from models.schemas import Category
+from services.product import ProductService
+
+router = APIRouter(prefix="/api/categories", tags=["categories"], default_response_class=FastJSONResponse)
+
+product_service = ProductService()
+
+@router.get("", response_model=List[Category])
+async def list_categories(
+    fields: Optional[str] = Query(None, description="Comma-separated category fields to return"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List all categories"""
+    selected = parse_fields(fields, Category)
+    categories = await product_service.get_categories(db)
+    return FastJSONResponse(project_all(categories, selected))
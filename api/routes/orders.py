@@ -0,0 +1,70 @@
+"""
+Order history API routes
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from api.deps import require_user_id
+from api.idempotency import idempotent
+from api.responses import FastJSONResponse
+from core.database import get_async_db
+from models.schemas import Order, OrderBase, OrderHistoryPage
+from services.inventory import OutOfStockError
+from services.order import OrderService
+from app.config import settings
+
+router = APIRouter(prefix="/api/orders", tags=["orders"], default_response_class=FastJSONResponse)
+
+order_service = OrderService()
+
+@router.get("", response_model=OrderHistoryPage)
+async def list_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=settings.MAX_PAGE_SIZE),
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Order history, newest first, as summary rows"""
+    try:
+        page = await order_service.get_order_history(db, user_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"items": page.items, "next_cursor": page.next_cursor})
+
+@router.post("", response_model=Order, status_code=201)
+async def checkout(
+    checkout: OrderBase,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Place an order for everything in the cart
+    
+    Send an Idempotency-Key so a retried checkout returns the order it
+    already placed rather than failing on the now empty cart.
+    """
+    async def place_order():
+        try:
+            order = await order_service.create_order_from_cart(db, user_id, checkout.shipping_address)
+        except OutOfStockError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        order = await order_service.get_order(db, order.id)
+        return FastJSONResponse(Order.model_validate(order).model_dump(mode="json"), status_code=201)
+    
+    return await idempotent(request, db, user_id, idempotency_key, place_order)
+
+@router.get("/{order_id}", response_model=Order)
+async def get_order(
+    order_id: int,
+    user_id: int = Depends(require_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """One of the user's orders with its items"""
+    order = await order_service.get_order(db, order_id, user_id=user_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return Order.model_validate(order)
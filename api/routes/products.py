@@ -0,0 +1,103 @@
+"""
+Product catalog API routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from api.responses import FastJSONResponse, parse_fields, project, project_all
+from core.database import get_async_db
+from models.schemas import Product, ProductPage, ProductFacets, ProductAvailability
+from services.inventory import reservation_service
+from services.product import ProductService
+from app.config import settings
+
+router = APIRouter(prefix="/api/products", tags=["products"], default_response_class=FastJSONResponse)
+
+product_service = ProductService()
+
+FIELDS_DESCRIPTION = "Comma-separated product fields to return, e.g. id,name,price"
+
+@router.get("", response_model=ProductPage)
+async def list_products(
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PRODUCTS_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = False,
+    price: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    featured: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List products one keyset page at a time"""
+    selected = parse_fields(fields, Product)
+    try:
+        page = await product_service.get_product_page(
+            db,
+            category=category,
+            search=search,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            with_total=with_total,
+            price=price,
+            in_stock=in_stock,
+            featured=featured
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return FastJSONResponse({
+        "items": project_all(page.items, selected),
+        "sort": page.sort,
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+        "total": page.total,
+    })
+
+@router.get("/facets", response_model=ProductFacets)
+async def product_facets(
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    price: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    featured: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Facet values and product counts for a filter selection"""
+    try:
+        return FastJSONResponse(await product_service.get_facets(
+            db,
+            category=category,
+            search=search,
+            price=price,
+            in_stock=in_stock,
+            featured=featured
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{product_id}/availability", response_model=ProductAvailability)
+async def get_product_availability(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Units not held in anyone's cart, from the in-memory counters when hot"""
+    available = await reservation_service.available(db, product_id)
+    return FastJSONResponse({"product_id": product_id, "available": available})
+
+@router.get("/{product_id}", response_model=Product)
+async def get_product(
+    product_id: int,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a single active product"""
+    selected = parse_fields(fields, Product)
+    product = await product_service.get_product(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return FastJSONResponse(project(product, selected))
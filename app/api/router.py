@@ -13,9 +13,7 @@ health_router = APIRouter()
 @health_router.get("/health", tags=["health"])
 async def get_health_status():
     try:
-        app_logger.info("Health check endpoint called")
         result = HealthCheck.check_all()
-        app_logger.info(f"Health check completed with status: {result.get('status', 'unknown')}")
         return JSONResponse(content=result)
     except Exception as e:
         app_logger.error(f"Error in health endpoint: {e}")
@@ -9,15 +9,104 @@ class Settings:
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./luxecloth.db")
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
     
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # Password hashing: bcrypt cost, worker threads and how many requests
+    # may wait for a worker before new ones are turned away
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+    
+    # Verified bearer tokens are cached until they expire; user records
+    # for a few seconds
+    TOKEN_CACHE_MAX_ENTRIES: int = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096"))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "30"))  # seconds
+    USER_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", "1024"))
+    
     # Application
     APP_NAME: str = "LuxeCloth"
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    # Create missing tables and seed sample data when the app starts. Turn
+    # off where `python -m scripts.init_db` runs before the server does.
+    INIT_DB_ON_STARTUP: bool = os.getenv("INIT_DB_ON_STARTUP", "True").lower() == "true"
+    # Requests whose SQL profile /debug/sql keeps (DEBUG only)
+    SQL_PROFILE_MAX_REQUESTS: int = int(os.getenv("SQL_PROFILE_MAX_REQUESTS", "200"))
+    
+    # Catalog cache
+    CATALOG_CACHE_TTL: int = int(os.getenv("CATALOG_CACHE_TTL", "300"))  # seconds
+    CATALOG_CACHE_MAX_ENTRIES: int = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "256"))
+    
+    # Rendered page cache (anonymous visitors only)
+    PAGE_CACHE_MAX_ENTRIES: int = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "128"))
+    
+    # Inventory holds taken when items are added to a cart
+    RESERVATION_HOLD_SECONDS: int = int(os.getenv("RESERVATION_HOLD_SECONDS", "900"))
+    RESERVATION_SWEEP_INTERVAL: float = float(os.getenv("RESERVATION_SWEEP_INTERVAL", "5"))
+    INVENTORY_COUNTER_TTL: float = float(os.getenv("INVENTORY_COUNTER_TTL", "2"))  # seconds
+    INVENTORY_COUNTER_MAX_ENTRIES: int = int(os.getenv("INVENTORY_COUNTER_MAX_ENTRIES", "1024"))
+    
+    # Cart storage: "database" writes every change through; "write_behind"
+    # keeps carts in memory and flushes quantity changes every
+    # CART_FLUSH_INTERVAL seconds (single worker only)
+    CART_STORE: str = os.getenv("CART_STORE", "database")
+    CART_FLUSH_INTERVAL: float = float(os.getenv("CART_FLUSH_INTERVAL", "1"))
+    CART_STORE_IDLE_SECONDS: float = float(os.getenv("CART_STORE_IDLE_SECONDS", "60"))
+    
+    # Idempotency-Key responses: kept IDEMPOTENCY_TTL seconds; an unfinished
+    # request's claim on its key lapses after IDEMPOTENCY_CLAIM_SECONDS
+    IDEMPOTENCY_TTL: float = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+    IDEMPOTENCY_CLAIM_SECONDS: float = float(os.getenv("IDEMPOTENCY_CLAIM_SECONDS", "60"))
+    IDEMPOTENCY_CACHE_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", "1024"))
+    IDEMPOTENCY_SWEEP_INTERVAL: float = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "60"))
+    
+    # Per-client rate limiting (token bucket of RATE_LIMIT_REQUESTS per
+    # RATE_LIMIT_WINDOW seconds). RATE_LIMIT_BACKEND "shared" keeps buckets
+    # in a memory-mapped file used by every worker on the host.
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "False").lower() == "true"
+    RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", "120"))
+    RATE_LIMIT_WINDOW: float = float(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_MAX_CLIENTS: int = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+    RATE_LIMIT_SHARED_PATH: Optional[str] = os.getenv("RATE_LIMIT_SHARED_PATH")
+    # Where the client address comes from: a header the proxy sets (e.g.
+    # Fly-Client-IP), else the X-Forwarded-For entry added by the outermost
+    # of RATE_LIMIT_TRUSTED_PROXIES proxies, else the peer address
+    RATE_LIMIT_CLIENT_IP_HEADER: Optional[str] = os.getenv("RATE_LIMIT_CLIENT_IP_HEADER")
+    RATE_LIMIT_TRUSTED_PROXIES: int = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+    # Tokens charged per "METHOD /path/prefix"; everything else costs 1.
+    # Password hashing and checkout are the expensive requests.
+    RATE_LIMIT_COSTS = {
+        "POST /login": 10,
+        "POST /register": 10,
+        "POST /api/orders": 5,
+        "POST /api/cart/batch": 2,
+    }
+    
+    # Logging: records are queued and written by a background thread, as
+    # JSON lines unless LOG_FORMAT is "text". LOG_SAMPLE_RATE is the share
+    # of requests whose DEBUG/INFO lines are kept (warnings always are).
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_FILE: Optional[str] = os.getenv("LOG_FILE")
+    
+    # Health checks: system figures are sampled every HEALTH_SAMPLE_INTERVAL
+    # seconds; readiness fails when the database doesn't answer in time
+    HEALTH_SAMPLE_INTERVAL: float = float(os.getenv("HEALTH_SAMPLE_INTERVAL", "15"))
+    HEALTH_DB_TIMEOUT: float = float(os.getenv("HEALTH_DB_TIMEOUT", "1"))  # seconds
+    
+    # Prometheus metrics at /metrics (requests, SQL, connection pools, caches)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    
+    # Pagination
+    PRODUCTS_PAGE_SIZE: int = 24
+    MAX_PAGE_SIZE: int = 100
     
     # File upload
     UPLOAD_DIR: str = "static/uploads"
@@ -27,4 +116,14 @@ class Settings:
     STRIPE_PUBLISHABLE_KEY: Optional[str] = os.getenv("STRIPE_PUBLISHABLE_KEY")
     STRIPE_SECRET_KEY: Optional[str] = os.getenv("STRIPE_SECRET_KEY")
 
-settings = Settings()
\ No newline at end of file
+def _async_database_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:") or url.startswith("postgres:"):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+settings = Settings()
+if not settings.ASYNC_DATABASE_URL:
+    settings.ASYNC_DATABASE_URL = _async_database_url(settings.DATABASE_URL)
\ No newline at end of file
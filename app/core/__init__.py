@@ -27,7 +27,7 @@ imported and used by other modules as needed.
 
 # Import core modules for easy access
 from app.core.config import settings
-from app.core.logging import app_logger, get_logger
+from app.core.logging import app_logger, get_logger, setup_logging
 from app.core.exceptions import (
     AppException,
     NotFoundError,
@@ -65,6 +65,7 @@ __all__ = [
     
     "app_logger",
     "get_logger",
+    "setup_logging",
     "AppException",
     "NotFoundError",
     "ValidationError",
@@ -1,44 +1,30 @@
-import os
 import time
-import platform
-import psutil
 from typing import Dict, Any
 
 from app.core.logging import app_logger
+from core.health import system_sampler
 
 class HealthCheck:
     """Health check utility for the application.
     
     This class provides methods to check the health of various components
-    of the application, focusing on system resources.
+    of the application, focusing on system resources. Probes are frequent,
+    so successful checks are not logged.
     """
     
     @staticmethod
     def check_system() -> Dict[str, Any]:
         """Check system health (CPU, memory, disk, process).
         
+        Returns the latest snapshot of the background sampler
+        (core.health.system_sampler), so no measurement is taken on the
+        request path.
+        
         Returns:
             Dict with system health information
         """
         try:
-            app_logger.info("Starting system health check")
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage(os.getcwd())
-            process = psutil.Process(os.getpid())
-            process_memory_mb = process.memory_info().rss / (1024 * 1024)
-            
-            result = {
-                "status": "healthy",
-                "cpu": {"percent": cpu_percent, "status": "warning" if cpu_percent > 80 else "healthy"},
-                "memory": {"percent": memory.percent, "status": "warning" if memory.percent > 80 else "healthy"},
-                "disk": {"percent": disk.percent, "status": "warning" if disk.percent > 80 else "healthy"},
-                "process": {"memory_mb": round(process_memory_mb, 2), "status": "warning" if process_memory_mb > 500 else "healthy"},
-                "platform": platform.platform(),
-                "python_version": platform.python_version(),
-            }
-            app_logger.info("System health check completed successfully")
-            return result
+            return system_sampler.snapshot()
         except Exception as e:
             app_logger.error(f"Error checking system health: {e}")
             return {"status": "error", "message": str(e)}
@@ -51,7 +37,6 @@ class HealthCheck:
             Dict with all health check information
         """
         try:
-            app_logger.info("Starting all health checks")
             start_time = time.time()
             
             system_health = HealthCheck.check_system()
@@ -66,7 +51,6 @@ class HealthCheck:
                 "response_time_ms": response_time_ms,
                 "system": system_health,
             }
-            app_logger.info("All health checks completed successfully")
             return result
         except Exception as e:
             app_logger.error(f"Error in check_all: {e}")
@@ -82,7 +66,6 @@ def is_healthy(component: str = "all") -> bool:
         True if the component is healthy, False otherwise
     """
     try:
-        app_logger.info(f"Checking health for component: {component}")
         if component == "system":
             return HealthCheck.check_system().get("status") == "healthy"
         elif component == "all":
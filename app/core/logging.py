@@ -1,19 +1,13 @@
+import atexit
 import logging
 import os
-import sys
-from logging.handlers import RotatingFileHandler
 from typing import Optional, Dict, Any
 
+from core.logs import log_pipeline
+
 # CRITICAL: Always define __all__ at the top of the module to explicitly declare exports
 # This prevents ImportError when other modules try to import specific functions
-__all__ = ["app_logger", "get_logger", "log_structured"]
-
-# Configure the root logger
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+__all__ = ["app_logger", "get_logger", "log_structured", "setup_logging"]
 
 # Create a logger for the application
 app_logger = logging.getLogger("app")
@@ -21,39 +15,29 @@ app_logger = logging.getLogger("app")
 # Set the default level
 app_logger.setLevel(logging.INFO)
 
-# Create a formatter
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
-
-# Create a console handler
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(formatter)
-app_logger.addHandler(console_handler)
-
-# Create a file handler if LOG_FILE is set in environment
-log_file = os.getenv("LOG_FILE")
-if log_file:
-    # Create logs directory if it doesn't exist
-    log_dir = os.path.dirname(log_file)
-    if log_dir and not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # Create a rotating file handler (10 MB max size, keep 5 backup files)
-    file_handler = RotatingFileHandler(
-        log_file,
-        maxBytes=10 * 1024 * 1024,  # 10 MB
-        backupCount=5,
-    )
-    file_handler.setFormatter(formatter)
-    app_logger.addHandler(file_handler)
-
 # Set log level from environment variable if provided
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
 if log_level in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
     app_logger.setLevel(getattr(logging, log_level))
 
+_stop_registered = False
+
+def setup_logging() -> None:
+    """Start the log pipeline for a process that does not run the app
+    
+    Records go through a queue to a background writer thread (stdout and,
+    when LOG_FILE is set, a rotating file) as JSON lines with request ids;
+    see core.logs. The app's lifespan starts and stops the pipeline
+    itself, and importing this module starts nothing, so scripts and
+    migrations get no writer thread unless they call this. Safe to call
+    more than once.
+    """
+    global _stop_registered
+    if not _stop_registered:
+        atexit.register(log_pipeline.stop)
+        _stop_registered = True
+    log_pipeline.start()
+
 # Helper function to create a logger for a specific module
 def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     """Create a logger for a specific module.
@@ -67,21 +51,13 @@ def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     """
     logger = logging.getLogger(name)
     
-    # Set level from parameter or environment
+    # Set level from parameter or environment; records reach the queue
+    # through the root logger, so no handlers are added here
     if level and level.upper() in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
         logger.setLevel(getattr(logging, level.upper()))
     else:
         logger.setLevel(app_logger.level)
     
-    # Add handlers if not already present
-    if not logger.handlers:
-        # Add console handler
-        logger.addHandler(console_handler)
-        
-        # Add file handler if available
-        if log_file and 'file_handler' in locals():
-            logger.addHandler(file_handler)
-    
     return logger
 
 # Helper function to log structured data
@@ -92,19 +68,15 @@ def log_structured(logger: logging.Logger, level: str, message: str, data: Dict[
         logger: The logger instance
         level: The log level (debug, info, warning, error, critical)
         message: The log message
-        data: Dictionary of structured data to include
+        data: Dictionary of structured data to include; keys must not
+            be LogRecord attributes (such as "name" or "message")
     """
-    if level.lower() == "debug":
-        logger.debug(f"{message} - {data}")
-    elif level.lower() == "info":
-        logger.info(f"{message} - {data}")
-    elif level.lower() == "warning":
-        logger.warning(f"{message} - {data}")
-    elif level.lower() == "error":
-        logger.error(f"{message} - {data}")
-    elif level.lower() == "critical":
-        logger.critical(f"{message} - {data}")
+    levelno = logging.getLevelName(level.upper())
+    # Nothing is built for a disabled level; otherwise each data key
+    # becomes a field of the JSON line, written once
+    if isinstance(levelno, int) and logger.isEnabledFor(levelno):
+        logger.log(levelno, message, extra=data)
 
 # CRITICAL: Always explicitly define __all__ at the end of the module as well
 # This ensures it's not forgotten during module updates
-__all__ = ["app_logger", "get_logger", "log_structured"]
\ No newline at end of file
+__all__ = ["app_logger", "get_logger", "log_structured", "setup_logging"]
\ No newline at end of file
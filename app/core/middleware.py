@@ -1,13 +1,16 @@
-import time
 from typing import Dict, List, Optional, Set
 
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.core.config import settings
 from app.core.logging import app_logger
+# Token bucket limiter: O(1) per request, bounded client state, per-route
+# costs, and a backend that can be shared by the workers on one host
+from core.rate_limit import RateLimiter, RateLimitMiddleware, make_backend
+from core.timing import TimingMiddleware
 
 def setup_middleware(app: FastAPI) -> None:
     """Set up global middleware for the FastAPI application."""
@@ -38,94 +41,22 @@ def setup_middleware(app: FastAPI) -> None:
     else:
         app_logger.info("Session middleware disabled as authentication is not enabled.")
 
-    # Request Timing Middleware
-    @app.middleware("http")
-    async def add_process_time_header(request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        app_logger.debug(f"Request processed in {process_time:.4f} seconds.",
-                         extra={"path": request.url.path, "method": request.method, "process_time": process_time})
-        return response
+    # Request Timing Middleware (X-Process-Time header, per-route latency histograms)
+    app.add_middleware(TimingMiddleware)
     app_logger.info("Request timing middleware enabled.")
 
 # Custom middleware classes
 
-class RateLimitMiddleware:
-    """Simple rate limiting middleware.
-    
-    This is a basic implementation. For production, consider using a more
-    robust solution with Redis or another distributed cache.
-    """
-    def __init__(
-        self,
-        app,
-        limit: int = 100,
-        window: int = 60,
-        exempt_paths: List[str] = None,
-    ):
-        self.app = app
-        self.limit = limit  # requests per window
-        self.window = window  # window in seconds
-        self.exempt_paths = exempt_paths or []
-        self.requests = {}
-    
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            return await self.app(scope, receive, send)
-        
-        # Get client IP
-        client_ip = self._get_client_ip(scope)
-        path = scope["path"]
-        
-        # Skip rate limiting for exempt paths
-        if any(path.startswith(exempt) for exempt in self.exempt_paths):
-            return await self.app(scope, receive, send)
-        
-        # Check rate limit
-        current_time = time.time()
-        if client_ip in self.requests:
-            requests_info = self.requests[client_ip]
-            # Clean up old requests
-            requests_info = [r for r in requests_info if current_time - r < self.window]
-            
-            if len(requests_info) >= self.limit:
-                # Rate limit exceeded
-                return await self._rate_limit_response(scope, receive, send)
-            
-            requests_info.append(current_time)
-            self.requests[client_ip] = requests_info
-        else:
-            self.requests[client_ip] = [current_time]
-        
-        return await self.app(scope, receive, send)
-    
-    def _get_client_ip(self, scope):
-        """Extract client IP from scope."""
-        headers = dict(scope.get("headers", []))
-        forwarded = headers.get(b"x-forwarded-for", b"").decode("utf8").split(",")[0].strip()
-        if forwarded:
-            return forwarded
-        return scope.get("client", ("", 0))[0] or "unknown"
-    
-    async def _rate_limit_response(self, scope, receive, send):
-        """Send rate limit exceeded response."""
-        await send({
-            "type": "http.response.start",
-            "status": 429,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"retry-after", str(self.window).encode()],
-            ],
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"detail":"Rate limit exceeded. Please try again later."}',
-        })
-
 # Helper function to add rate limiting
-def add_rate_limiting(app: FastAPI, limit: int = 100, window: int = 60, exempt_paths: List[str] = None) -> None:
+def add_rate_limiting(
+    app: FastAPI,
+    limit: int = 100,
+    window: int = 60,
+    exempt_paths: List[str] = None,
+    costs: Optional[Dict[str, float]] = None,
+    backend: str = "memory",
+    max_clients: int = 10000,
+) -> None:
     """Add rate limiting middleware to the application.
     
     Args:
@@ -133,11 +64,19 @@ def add_rate_limiting(app: FastAPI, limit: int = 100, window: int = 60, exempt_p
         limit: Maximum number of requests per window
         window: Time window in seconds
         exempt_paths: List of path prefixes to exempt from rate limiting
+        costs: Tokens charged per "METHOD /path/prefix" (default 1 each)
+        backend: "memory" (per process) or "shared" (all workers on the host)
+        max_clients: Number of client buckets kept
     """
-    app.add_middleware(
-        RateLimitMiddleware,
+    limiter = RateLimiter(
         limit=limit,
         window=window,
+        costs=costs,
+        backend=make_backend(backend, max_clients=max_clients),
+    )
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=limiter,
         exempt_paths=exempt_paths or ["/static", "/docs", "/redoc", "/openapi.json"],
     )
-    app_logger.info(f"Rate limiting configured: {limit} requests per {window} seconds")
\ No newline at end of file
+    app_logger.info(f"Rate limiting configured: {limit} requests per {window} seconds ({backend} backend)")
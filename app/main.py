@@ -1,95 +1,206 @@
 """
 Main FastAPI application with routes and templates
 """
+import time
+# How long importing this module takes is logged at startup (see lifespan)
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, Request, Depends, HTTPException, Form, File, UploadFile, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from functools import partial
 from typing import Optional, List
+from urllib.parse import urlencode
+import asyncio
+import logging
 import os
 from pathlib import Path
 
-from core.database import get_db, init_db
+from core.database import async_engine, get_async_db, init_db
+from core.health import check_database, system_sampler
+from core.logs import RequestIdMiddleware, log_pipeline
+from core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from core.query_counter import QueryCountMiddleware
+from core.sql_profiler import ProfileStore, SqlProfilerMiddleware
+from core.timing import TimingMiddleware
+from core.page_cache import PageCache
 from models.schemas import Product, User, CartItem, Order
-from services.auth import AuthService
-from services.product import ProductService
-from services.cart import CartService
+from services.product import ProductService, catalog_cache
+from services.cart import CartService, cart_store
 from services.order import OrderService
+from services.inventory import inventory_counters, reservation_sweeper
+from services.idempotency import idempotency_store
+from services.auth import HasherBusyError, password_hasher, token_cache, user_cache
+from api.deps import auth_service, get_current_user
+from api.responses import FastJSONResponse
+from api.routes.products import router as products_api_router
+from api.routes.categories import router as categories_api_router
+from api.routes.cart import router as cart_api_router
+from api.routes.orders import router as orders_api_router
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Prepare the database, then run background tasks while serving"""
+    # Log records are written by a background thread from here on
+    log_pipeline.start()
+    started = time.perf_counter()
+    if settings.INIT_DB_ON_STARTUP:
+        await asyncio.to_thread(init_db)
+    logger.info(
+        "Startup: app imported in %.0f ms, database ready in %.0f ms",
+        (_import_finished - _import_started) * 1000, (time.perf_counter() - started) * 1000
+    )
+    # Release cart stock holds once they expire
+    reservation_sweeper.start()
+    # Flush write-behind carts in batches (when enabled)
+    cart_store.start()
+    # Delete expired Idempotency-Key responses
+    idempotency_store.start()
+    # CPU, memory and disk figures for /health, sampled off the request path
+    system_sampler.start()
+    try:
+        yield
+    finally:
+        # Pending cart changes are written before the process exits
+        await cart_store.stop()
+        await reservation_sweeper.stop()
+        await idempotency_store.stop()
+        await system_sampler.stop()
+        password_hasher.shutdown()
+        # Writes whatever is still queued
+        log_pipeline.stop()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="LuxeCloth - Luxury Fashion",
     description="Premium luxury clothing e-commerce platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Security
-security = HTTPBearer(auto_error=False)
-
 # Static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Initialize database
-init_db()
+def query_link(params, **changes) -> str:
+    """Relative link to the current page with some query parameters changed
+    
+    A None value removes the parameter. request.url would give an
+    absolute URL built from the client's Host header, which must not end
+    up in pages shared through page_cache.
+    """
+    items = [(key, value) for key, value in params.multi_items() if key not in changes]
+    items += [(key, value) for key, value in changes.items() if value is not None]
+    return "?" + urlencode(items)
+
+# JSON API
+app.include_router(products_api_router)
+app.include_router(categories_api_router)
+app.include_router(cart_api_router)
+app.include_router(orders_api_router)
 
 # Services
-auth_service = AuthService()
 product_service = ProductService()
 cart_service = CartService()
 order_service = OrderService()
 
-# Dependency to get current user
-async def get_current_user(
-    request: Request,
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
-) -> Optional[dict]:
-    """Get current user from session or token"""
-    # Check session first
-    user_id = request.session.get("user_id")
-    if user_id:
-        return {"user_id": user_id, "email": request.session.get("email")}
-    
-    # Check token if provided
-    if credentials:
-        try:
-            payload = auth_service.verify_token(credentials.credentials)
-            return payload
-        except:
-            pass
-    
-    return None
+# Rendered pages for anonymous visitors, who all see the same bytes.
+# Signed-in visitors get a personalised header and bypass the cache.
+# Pages expire with the catalog cache, so writes made by other workers
+# or catalog imports show up within CATALOG_CACHE_TTL.
+page_cache = PageCache(max_entries=settings.PAGE_CACHE_MAX_ENTRIES, ttl=settings.CATALOG_CACHE_TTL)
+
+# Caches and worker pools reported by /metrics
+metrics.add_cache("catalog", catalog_cache.stats)
+metrics.add_cache("page", page_cache.stats)
+metrics.add_cache("idempotency", idempotency_store.stats)
+metrics.add_cache("token", token_cache.stats)
+metrics.add_cache("user", user_cache.stats)
+metrics.add_cache("inventory", inventory_counters.stats)
+metrics.add_component("password_hasher", password_hasher.stats)
+metrics.add_component("cart_store", cart_store.stats)
+metrics.add_component("logging", log_pipeline.stats)
 
-# Health check
+# Health checks. None of them measures anything on the request path:
+# /health serves the latest background sample, /health/live only shows
+# the event loop is answering and /health/ready adds a database round trip.
 @app.get("/health")
 async def health_check():
     """Health check endpoint for deployment"""
-    return {"status": "healthy", "service": "LuxeCloth E-commerce"}
+    return {"status": "healthy", "service": "LuxeCloth E-commerce", "system": system_sampler.snapshot()}
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: the database answers, so requests can be served (503 if not)"""
+    database = await check_database(async_engine, timeout=settings.HEALTH_DB_TIMEOUT)
+    ready = database["status"] == "healthy"
+    return FastJSONResponse(
+        {"status": "ready" if ready else "unavailable", "database": database},
+        status_code=200 if ready else 503
+    )
+
+# Recent requests' SQL, grouped by statement (debug mode only)
+sql_profiles = ProfileStore(max_entries=settings.SQL_PROFILE_MAX_REQUESTS)
+
+if settings.DEBUG:
+    @app.get("/debug/sql", response_class=HTMLResponse, include_in_schema=False)
+    async def debug_sql(request: Request):
+        """Slowest recent requests with their SQL and N+1 suspects"""
+        return templates.TemplateResponse("debug/sql.html", {
+            "request": request,
+            "profiles": sql_profiles.slowest(),
+            "recorded": len(sql_profiles.profiles),
+            "page_title": "SQL Profile"
+        })
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        """Prometheus metrics for this process"""
+        return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 # Home page
 @app.get("/", response_class=HTMLResponse)
 async def home(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[dict] = Depends(get_current_user)
 ):
     """Home page with featured products"""
+    catalog_version = catalog_cache.version
+    if not current_user:
+        cached = page_cache.get(request, catalog_version)
+        if cached:
+            return page_cache.respond(request, cached)
+    
     try:
-        featured_products = product_service.get_featured_products(db, limit=8)
-        categories = product_service.get_categories(db)
+        featured_products = await product_service.get_featured_products(db, limit=8)
+        categories = await product_service.get_categories(db)
         
-        return templates.TemplateResponse("home.html", {
+        response = templates.TemplateResponse("home.html", {
             "request": request,
             "products": featured_products,
             "categories": categories,
             "current_user": current_user,
             "page_title": "LuxeCloth - Luxury Fashion"
         })
+        if not current_user:
+            cached = page_cache.store(request, response.body, catalog_version)
+            return page_cache.respond(request, cached)
+        return response
     except Exception as e:
-        print(f"Error loading home page: {e}")
+        logger.exception("Error loading home page")
         return templates.TemplateResponse("error.html", {
             "request": request,
             "error": "Unable to load products",
@@ -102,27 +213,67 @@ async def products(
     request: Request,
     category: Optional[str] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    price: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    featured: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[dict] = Depends(get_current_user)
 ):
     """Products listing page with filtering"""
+    catalog_version = catalog_cache.version
+    if not current_user:
+        cached = page_cache.get(request, catalog_version)
+        if cached:
+            return page_cache.respond(request, cached)
+    
     try:
-        products_list = product_service.get_products(
-            db, category=category, search=search
+        try:
+            page = await product_service.get_product_page(
+                db,
+                category=category,
+                search=search,
+                sort=sort,
+                cursor=cursor,
+                limit=settings.PRODUCTS_PAGE_SIZE,
+                price=price,
+                in_stock=in_stock,
+                featured=featured
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        facets = await product_service.get_facets(
+            db,
+            category=category,
+            search=search,
+            price=price,
+            in_stock=in_stock,
+            featured=featured
         )
-        categories = product_service.get_categories(db)
+        page.total = facets["total"]
+        categories = await product_service.get_categories(db)
         
-        return templates.TemplateResponse("products.html", {
+        response = templates.TemplateResponse("products.html", {
             "request": request,
-            "products": products_list,
+            "products": page.items,
+            "page": page,
+            "facets": facets,
             "categories": categories,
             "current_category": category,
             "search_query": search,
+            "query_link": partial(query_link, request.query_params),
             "current_user": current_user,
             "page_title": f"Products - {category or 'All'}"
         })
+        if not current_user:
+            cached = page_cache.store(request, response.body, catalog_version)
+            return page_cache.respond(request, cached)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error loading products: {e}")
+        logger.exception("Error loading products")
         return templates.TemplateResponse("error.html", {
             "request": request,
             "error": "Unable to load products",
@@ -134,17 +285,17 @@ async def products(
 async def product_detail(
     request: Request,
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[dict] = Depends(get_current_user)
 ):
     """Individual product detail page"""
     try:
-        product = product_service.get_product(db, product_id)
+        product = await product_service.get_product(db, product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        related_products = product_service.get_related_products(
-            db, product.category, exclude_id=product_id, limit=4
+        related_products = await product_service.get_related_products(
+            db, product.category_id, exclude_id=product_id, limit=4
         )
         
         return templates.TemplateResponse("product_detail.html", {
@@ -157,7 +308,7 @@ async def product_detail(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error loading product detail: {e}")
+        logger.exception("Error loading product %s", product_id)
         return templates.TemplateResponse("error.html", {
             "request": request,
             "error": "Unable to load product",
@@ -178,11 +329,11 @@ async def login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Process login"""
     try:
-        user = auth_service.authenticate_user(db, email, password)
+        user = await auth_service.authenticate_user(db, email, password)
         if not user:
             return templates.TemplateResponse("auth/login.html", {
                 "request": request,
@@ -195,8 +346,14 @@ async def login(
         request.session["email"] = user.email
         
         return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
+    except HasherBusyError:
+        return templates.TemplateResponse("auth/login.html", {
+            "request": request,
+            "error": "We are handling a lot of sign-ins right now, please try again in a moment",
+            "page_title": "Login"
+        }, status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Login error: {e}")
+        logger.exception("Login failed")
         return templates.TemplateResponse("auth/login.html", {
             "request": request,
             "error": "Login failed",
@@ -218,12 +375,12 @@ async def register(
     email: str = Form(...),
     password: str = Form(...),
     full_name: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Process registration"""
     try:
         # Check if user exists
-        if auth_service.get_user_by_email(db, email):
+        if await auth_service.get_user_by_email(db, email):
             return templates.TemplateResponse("auth/register.html", {
                 "request": request,
                 "error": "Email already registered",
@@ -231,15 +388,21 @@ async def register(
             })
         
         # Create user
-        user = auth_service.create_user(db, email, password, full_name)
+        user = await auth_service.create_user(db, email, password, full_name)
         
         # Set session
         request.session["user_id"] = user.id
         request.session["email"] = user.email
         
         return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
+    except HasherBusyError:
+        return templates.TemplateResponse("auth/register.html", {
+            "request": request,
+            "error": "We are handling a lot of sign-ups right now, please try again in a moment",
+            "page_title": "Register"
+        }, status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Registration error: {e}")
+        logger.exception("Registration failed")
         return templates.TemplateResponse("auth/register.html", {
             "request": request,
             "error": "Registration failed",
@@ -257,7 +420,7 @@ async def logout(request: Request):
 @app.get("/cart", response_class=HTMLResponse)
 async def cart_page(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Shopping cart page"""
@@ -265,7 +428,7 @@ async def cart_page(
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
     
     try:
-        cart_items = cart_service.get_cart_items(db, current_user["user_id"])
+        cart_items = await cart_service.get_cart_items(db, current_user["user_id"])
         total = cart_service.calculate_total(cart_items)
         
         return templates.TemplateResponse("cart.html", {
@@ -276,7 +439,7 @@ async def cart_page(
             "page_title": "Shopping Cart"
         })
     except Exception as e:
-        print(f"Cart error: {e}")
+        logger.exception("Error loading cart")
         return templates.TemplateResponse("error.html", {
             "request": request,
             "error": "Unable to load cart",
@@ -287,6 +450,18 @@ async def cart_page(
 from starlette.middleware.sessions import SessionMiddleware
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
 
+# Per-request SQL statement count (X-Query-Count header) and profile
+# (X-SQL-* headers, /debug/sql) in debug mode
+if settings.DEBUG:
+    app.add_middleware(QueryCountMiddleware)
+    app.add_middleware(SqlProfilerMiddleware, store=sql_profiles, exempt_paths=["/static", "/debug/sql"])
+
+# X-Process-Time header and per-route latency histograms
+app.add_middleware(TimingMiddleware)
+
+# X-Request-ID on every response and request_id on every log line
+app.add_middleware(RequestIdMiddleware)
+
 # CORS middleware for API calls
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
@@ -295,4 +470,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-)
\ No newline at end of file
+)
+
+# Per-client rate limiting; added last so it runs first and turns limited
+# requests away before any other work
+if settings.RATE_LIMIT_ENABLED:
+    from core.rate_limit import RateLimiter, RateLimitMiddleware, make_backend
+    rate_limiter = RateLimiter(
+        limit=settings.RATE_LIMIT_REQUESTS,
+        window=settings.RATE_LIMIT_WINDOW,
+        costs=settings.RATE_LIMIT_COSTS,
+        backend=make_backend(
+            settings.RATE_LIMIT_BACKEND,
+            max_clients=settings.RATE_LIMIT_MAX_CLIENTS,
+            path=settings.RATE_LIMIT_SHARED_PATH
+        )
+    )
+    metrics.add_component("rate_limit", rate_limiter.stats)
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        exempt_paths=["/static", "/health", "/metrics"],
+        client_ip_header=settings.RATE_LIMIT_CLIENT_IP_HEADER,
+        trusted_proxies=settings.RATE_LIMIT_TRUSTED_PROXIES
+    )
+
+_import_finished = time.perf_counter()
@@ -1,23 +1,54 @@
 """
 Database configuration and connection
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, LargeBinary, ForeignKey, Index, text, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime
+from typing import AsyncGenerator
 import os
 
 from app.config import settings
+from core.metrics import sql_metrics, timed_pool_class
+from core.query_counter import install_query_counter
+from core.sql_profiler import install_sql_profiler
 
 # Database setup
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+    poolclass=timed_pool_class(settings.DATABASE_URL, "sync")
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async database setup used by the request handlers
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    poolclass=timed_pool_class(settings.ASYNC_DATABASE_URL, "async")
+)
+
+# Objects stay usable after commit so templates can render them without
+# triggering an implicit (and, under asyncio, illegal) refresh.
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+install_query_counter(engine)
+install_query_counter(async_engine.sync_engine)
+# Statement and pool checkout timings for /metrics
+sql_metrics.install(engine, "sync")
+sql_metrics.install(async_engine.sync_engine, "async")
+# Per-request statement profiles (X-SQL-* headers, /debug/sql)
+if settings.DEBUG:
+    install_sql_profiler(engine)
+    install_sql_profiler(async_engine.sync_engine)
+
 # Database models
 class User(Base):
     __tablename__ = "users"
@@ -47,12 +78,16 @@ class Product(Base):
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Merchant stock-keeping unit; the key catalog imports upsert on
+    sku = Column(String)
     name = Column(String, nullable=False)
     description = Column(Text)
     price = Column(Float, nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"))
     image_url = Column(String)
     stock_quantity = Column(Integer, default=0)
+    # Units held by unexpired cart reservations (see services.inventory)
+    reserved_quantity = Column(Integer, default=0, server_default="0", nullable=False)
     is_featured = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -61,6 +96,29 @@ class Product(Base):
     category = relationship("Category", back_populates="products")
     cart_items = relationship("CartItem", back_populates="product")
     order_items = relationship("OrderItem", back_populates="product")
+    
+    # Partial indexes over active products, one per listing sort order
+    # (see ProductService.get_product_page). Mirrored by migration 0003.
+    __table_args__ = (
+        Index(
+            "ix_products_active_created", "created_at", "id",
+            sqlite_where=is_active == True, postgresql_where=is_active == True
+        ),
+        Index(
+            "ix_products_active_price", "price", "id",
+            sqlite_where=is_active == True, postgresql_where=is_active == True
+        ),
+        Index(
+            "ix_products_active_category_created", "category_id", "created_at", "id",
+            sqlite_where=is_active == True, postgresql_where=is_active == True
+        ),
+        Index(
+            "ix_products_featured", "created_at",
+            sqlite_where=(is_featured == True) & (is_active == True),
+            postgresql_where=(is_featured == True) & (is_active == True)
+        ),
+        Index("uq_products_sku", "sku", unique=True),
+    )
 
 class CartItem(Base):
     __tablename__ = "cart_items"
@@ -74,6 +132,27 @@ class CartItem(Base):
     # Relationships
     user = relationship("User", back_populates="cart_items")
     product = relationship("Product", back_populates="cart_items")
+    
+    # One row per user and product; also serves the per-user cart lookup
+    __table_args__ = (
+        Index("uq_cart_items_user_product", "user_id", "product_id", unique=True),
+    )
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # One hold per user and product; the sweeper scans by expiry
+    __table_args__ = (
+        Index("uq_stock_reservations_user_product", "user_id", "product_id", unique=True),
+        Index("ix_stock_reservations_expires_at", "expires_at"),
+    )
 
 class Order(Base):
     __tablename__ = "orders"
@@ -88,6 +167,10 @@ class Order(Base):
     # Relationships
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
+    
+    __table_args__ = (
+        Index("ix_orders_user_created", "user_id", "created_at"),
+    )
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -101,6 +184,30 @@ class OrderItem(Base):
     # Relationships
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
+    
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    # Keys are scoped to the user who sent them
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # SHA-256 of method, path and body; a reused key must match it
+    request_hash = Column(LargeBinary(32), nullable=False)
+    # NULL while the first request is still being handled
+    status_code = Column(Integer)
+    body = Column(LargeBinary)
+    expires_at = Column(DateTime, nullable=False)
+    
+    # Looked up by primary key only, so SQLite stores rows in that index
+    # rather than beside a rowid; the sweeper scans by expiry
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+        {"sqlite_with_rowid": False},
+    )
 
 def get_db() -> Session:
     """Get database session"""
@@ -110,9 +217,109 @@ def get_db() -> Session:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Full-text index over product name, description and category name.
+# SQLite only; rowid mirrors products.id and triggers keep it in sync.
+PRODUCT_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, description, category_name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description, category_name)
+        VALUES (
+            new.id, new.name, new.description,
+            (SELECT name FROM categories WHERE id = new.category_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description, category_id ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+        INSERT INTO products_fts (rowid, name, description, category_name)
+        VALUES (
+            new.id, new.name, new.description,
+            (SELECT name FROM categories WHERE id = new.category_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER categories_fts_update AFTER UPDATE OF name ON categories BEGIN
+        UPDATE products_fts SET category_name = new.name
+        WHERE rowid IN (SELECT id FROM products WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO products_fts (rowid, name, description, category_name)
+    SELECT p.id, p.name, p.description, c.name
+    FROM products p LEFT JOIN categories c ON c.id = p.category_id
+    """,
+]
+
+def create_search_index(bind=engine):
+    """Create and backfill the product full-text index if missing"""
+    if bind.dialect.name != "sqlite":
+        return
+    
+    with bind.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )).first()
+        if exists:
+            return
+        for statement in PRODUCT_SEARCH_DDL:
+            conn.execute(text(statement))
+
+def _alembic_config():
+    from alembic.config import Config
+    
+    config = Config(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini"))
+    config.attributes["configure_logger"] = False
+    return config
+
+def stamp_schema_head():
+    """Mark a freshly created schema as up to date for Alembic"""
+    from alembic import command
+    
+    command.stamp(_alembic_config(), "head")
+
+def upgrade_unversioned_schema():
+    """Migrate a database created before migrations existed to head
+    
+    Such a database has the initial schema (and maybe the search index)
+    but no alembic_version table. create_all would add missing tables
+    but not the columns later migrations added to existing ones.
+    """
+    from alembic import command
+    
+    config = _alembic_config()
+    command.stamp(config, "0001_initial_schema")
+    command.upgrade(config, "head")
+
 def init_db():
     """Initialize database with sample data"""
+    inspector = inspect(engine)
+    fresh_schema = not inspector.has_table("products")
+    if not fresh_schema and not inspector.has_table("alembic_version"):
+        upgrade_unversioned_schema()
     Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    if fresh_schema:
+        # create_all already matches the latest migration
+        stamp_schema_head()
     
     # Add sample data
     db = SessionLocal()
@@ -0,0 +1,126 @@
+"""
+Health checks: background system sampling and database readiness
+"""
+import asyncio
+import logging
+import os
+import platform
+import shutil
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional; disk usage only without it
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Resource use above these is reported as "warning"
+WARNING_PERCENT = 80
+WARNING_PROCESS_MB = 500
+
+def _level(value: float, limit: float) -> str:
+    return "warning" if value > limit else "healthy"
+
+class SystemSampler:
+    """CPU, memory, disk and process figures refreshed every interval seconds
+    
+    Health checks read the latest snapshot, so a probe never waits for a
+    measurement. CPU is the average since the previous sample rather
+    than over a sleep, so taking a sample never blocks either.
+    """
+    
+    def __init__(self, interval: float = 15, path: Optional[str] = None):
+        self.interval = interval
+        self.path = path or os.getcwd()
+        self.samples = 0
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._process = psutil.Process(os.getpid()) if psutil else None
+        self._task: Optional[asyncio.Task] = None
+    
+    def sample(self) -> Dict[str, Any]:
+        """Measure now and keep the result as the snapshot"""
+        try:
+            disk = shutil.disk_usage(self.path)
+            disk_percent = round(disk.used / disk.total * 100, 1) if disk.total else 0.0
+            snapshot = {
+                "status": "healthy",
+                "disk": {"percent": disk_percent, "status": _level(disk_percent, WARNING_PERCENT)},
+                "platform": platform.platform(),
+                "python_version": platform.python_version(),
+            }
+            if psutil is not None:
+                cpu_percent = psutil.cpu_percent(interval=None)
+                memory = psutil.virtual_memory()
+                process_memory_mb = self._process.memory_info().rss / (1024 * 1024)
+                snapshot["cpu"] = {"percent": cpu_percent, "status": _level(cpu_percent, WARNING_PERCENT)}
+                snapshot["memory"] = {"percent": memory.percent, "status": _level(memory.percent, WARNING_PERCENT)}
+                snapshot["process"] = {
+                    "memory_mb": round(process_memory_mb, 2),
+                    "status": _level(process_memory_mb, WARNING_PROCESS_MB),
+                }
+        except Exception as e:
+            logger.exception("Sampling system health failed")
+            snapshot = {"status": "error", "message": str(e)}
+        snapshot["sampled_at"] = time.time()
+        # One assignment, so readers never see half a sample
+        self._snapshot = snapshot
+        self.samples += 1
+        return snapshot
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """The latest sample and its age
+        
+        Without the background task (start() not called) a sample older
+        than interval is retaken here; that costs well under a millisecond.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or (self._task is None and time.time() - snapshot["sampled_at"] >= self.interval):
+            snapshot = self.sample()
+        return {**snapshot, "age_seconds": round(time.time() - snapshot["sampled_at"], 3)}
+    
+    def start(self):
+        """Sample now, then every interval seconds on the running event loop"""
+        if self._task is None:
+            # Also primes the CPU counter, whose first reading is meaningless
+            self.sample()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the sampling task and wait for it to finish"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Off the event loop: disk usage can stall on a slow mount
+            await asyncio.to_thread(self.sample)
+
+async def check_database(engine, timeout: float = 1.0) -> Dict[str, Any]:
+    """Run SELECT 1 on an async engine within timeout seconds"""
+    started = time.perf_counter()
+    
+    async def select_one():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    try:
+        await asyncio.wait_for(select_one(), timeout)
+    except asyncio.TimeoutError:
+        return {"status": "error", "message": f"No answer within {timeout}s"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "healthy", "response_time_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+system_sampler = SystemSampler(interval=settings.HEALTH_SAMPLE_INTERVAL)
@@ -0,0 +1,231 @@
+"""
+Queued, structured and sampled logging
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+MAX_REQUEST_ID_LENGTH = 128
+# uvicorn gives these their own (synchronous) handlers; they are routed
+# through the queue instead
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.access")
+
+# Attributes every record has; any others were passed in extra= and are
+# written as fields of their own
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "taskName",
+}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= values as fields"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", "-") != "-":
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the current request id and samples DEBUG/INFO ones
+    
+    A request's lines are kept or dropped together (the decision hashes
+    its id), so the requests that are kept read whole. Warnings and
+    errors are always kept.
+    """
+    
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        record.request_id = request_id or "-"
+        if self.sample_rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if request_id is not None:
+            keep = zlib.crc32(request_id.encode()) % 10000 < self.sample_rate * 10000
+        else:
+            keep = random.random() < self.sample_rate
+        if not keep:
+            self.sampled_out += 1
+        return keep
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread as they are
+    
+    QueueHandler formats each record in the logging thread before
+    queueing it; here the writer thread does, so %-style arguments are
+    only turned into text off the request path. Arguments should be plain
+    values (not ORM objects), since they are read later from another
+    thread. A full queue drops the record rather than blocking the caller.
+    """
+    
+    def __init__(self, records: "queue.Queue[logging.LogRecord]"):
+        super().__init__(records)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogPipeline:
+    """Root and uvicorn logging through a bounded queue to a writer thread
+    
+    The writer thread prints to stdout and, if log_file is set, a
+    rotating file. Logging a record costs the level check, the context filter and a
+    queue put. Records still queued are written by stop(); those queued
+    when the process is killed are lost.
+    """
+    
+    def __init__(
+        self,
+        level: str = "INFO",
+        json_lines: bool = True,
+        sample_rate: float = 1.0,
+        queue_size: int = 10000,
+        log_file: Optional[str] = None
+    ):
+        self.level = level
+        self.json_lines = json_lines
+        self.queue_size = queue_size
+        self.log_file = log_file
+        self.filter = ContextFilter(sample_rate)
+        self.handler: Optional[DroppingQueueHandler] = None
+        self._listener: Optional[QueueListener] = None
+        self._saved: List[Tuple[logging.Logger, list, int, bool]] = []
+    
+    def _writers(self) -> List[logging.Handler]:
+        writers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+        if self.log_file:
+            os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+            writers.append(RotatingFileHandler(self.log_file, maxBytes=10 * 1024 * 1024, backupCount=5))
+        formatter = JsonFormatter() if self.json_lines else logging.Formatter(TEXT_FORMAT)
+        for writer in writers:
+            writer.setFormatter(formatter)
+        return writers
+    
+    def start(self):
+        """Install the queue handler and start the writer thread"""
+        if self._listener is not None:
+            return
+        records: "queue.Queue[logging.LogRecord]" = queue.Queue(self.queue_size)
+        self.handler = DroppingQueueHandler(records)
+        self.handler.addFilter(self.filter)
+        self._listener = QueueListener(records, *self._writers())
+        self._listener.start()
+        
+        root = logging.getLogger()
+        loggers = [root] + [logging.getLogger(name) for name in UVICORN_LOGGERS]
+        self._saved = [(logger, logger.handlers[:], logger.level, logger.propagate) for logger in loggers]
+        root.handlers = [self.handler]
+        root.setLevel(self.level)
+        for logger in loggers[1:]:
+            logger.handlers = []
+            logger.propagate = True
+    
+    def stop(self):
+        """Restore the previous handlers, then write what is still queued"""
+        listener, self._listener = self._listener, None
+        if listener is None:
+            return
+        for logger, handlers, level, propagate in self._saved:
+            logger.handlers = handlers
+            logger.setLevel(level)
+            logger.propagate = propagate
+        self._saved = []
+        listener.stop()
+        for writer in listener.handlers:
+            writer.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and records dropped or sampled out"""
+        return {
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+            "dropped": self.handler.dropped if self.handler else 0,
+            "sampled_out": self.filter.sampled_out,
+        }
+
+class RequestIdMiddleware:
+    """ASGI middleware giving each request an id for its log lines
+    
+    A well-formed X-Request-ID from the proxy in front is reused, so its
+    logs and ours line up; otherwise a new id is made. The id is sent
+    back in the X-Request-ID response header.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if 0 < len(candidate) <= MAX_REQUEST_ID_LENGTH and candidate.isprintable():
+                    request_id = candidate
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+log_pipeline = LogPipeline(
+    level=settings.LOG_LEVEL,
+    json_lines=settings.LOG_FORMAT != "text",
+    sample_rate=settings.LOG_SAMPLE_RATE,
+    queue_size=settings.LOG_QUEUE_SIZE,
+    log_file=settings.LOG_FILE
+)
@@ -0,0 +1,263 @@
+"""
+Prometheus metrics for requests, SQL statements, connection pools and caches
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from core.timing import BUCKETS, SUBBUCKETS, LatencyHistogram, RouteTimings, route_timings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Exported histogram buckets: every second doubling of the recorded ones
+# (0.2ms .. 52s), so a histogram is a dozen series rather than BUCKETS.
+# The last recorded bucket also holds everything slower, so it has no
+# finite bound.
+EXPORTED_BUCKETS = list(range(SUBBUCKETS * 2 - 1, BUCKETS - 1, SUBBUCKETS * 2))
+
+STATEMENT_KINDS = frozenset(["SELECT", "INSERT", "UPDATE", "DELETE"])
+
+def statement_kind(statement: str) -> str:
+    """SELECT, INSERT, UPDATE, DELETE or OTHER"""
+    kind = statement.lstrip()[:6].upper()
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+class SqlMetrics:
+    """Statement and pool checkout timings, by engine
+    
+    Statements are timed from SQLAlchemy cursor events and checkouts by
+    the pool class from timed_pool_class(). Both run in whichever thread
+    uses the connection, so updates take a lock; each is one histogram
+    bucket increment.
+    """
+    
+    def __init__(self):
+        self.engines: Dict[str, Any] = {}
+        self.statements: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.statement_errors: Dict[Tuple[str, str], int] = {}
+        self.checkouts: Dict[str, LatencyHistogram] = {}
+        self.checkout_errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def install(self, engine, name: str):
+        """Time statements run on a (sync) engine and report its pool as name"""
+        self.engines[name] = engine
+        
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context._metrics_started = time.perf_counter()
+        
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "_metrics_started", None)
+            if started is not None:
+                self.record_statement(name, statement, time.perf_counter() - started)
+        
+        def handle_error(exception_context):
+            if exception_context.statement is not None:
+                self.record_statement_error(name, exception_context.statement)
+        
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+    
+    def record_statement(self, name: str, statement: str, seconds: float):
+        key = (name, statement_kind(statement))
+        with self._lock:
+            histogram = self.statements.get(key)
+            if histogram is None:
+                histogram = self.statements[key] = LatencyHistogram()
+            histogram.record(seconds)
+    
+    def record_statement_error(self, name: str, statement: str):
+        key = (name, statement_kind(statement))
+        with self._lock:
+            self.statement_errors[key] = self.statement_errors.get(key, 0) + 1
+    
+    def record_checkout(self, name: str, seconds: float, failed: bool = False):
+        with self._lock:
+            if failed:
+                self.checkout_errors[name] = self.checkout_errors.get(name, 0) + 1
+                return
+            histogram = self.checkouts.get(name)
+            if histogram is None:
+                histogram = self.checkouts[name] = LatencyHistogram()
+            histogram.record(seconds)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Consistent copies of the counters, for rendering"""
+        with self._lock:
+            return {
+                "statements": {key: _copy(histogram) for key, histogram in self.statements.items()},
+                "statement_errors": dict(self.statement_errors),
+                "checkouts": {key: _copy(histogram) for key, histogram in self.checkouts.items()},
+                "checkout_errors": dict(self.checkout_errors),
+            }
+
+def _copy(histogram: LatencyHistogram) -> LatencyHistogram:
+    copy = LatencyHistogram()
+    copy.counts = list(histogram.counts)
+    copy.count = histogram.count
+    copy.sum = histogram.sum
+    copy.max = histogram.max
+    return copy
+
+sql_metrics = SqlMetrics()
+
+class TimedCheckout:
+    """Pool mixin timing how long each checkout waits for (or opens) a connection"""
+    
+    metrics_name = "default"
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            sql_metrics.record_checkout(self.metrics_name, time.perf_counter() - started, failed=True)
+            raise
+        sql_metrics.record_checkout(self.metrics_name, time.perf_counter() - started)
+        return connection
+
+def timed_pool_class(url: str, name: str) -> type:
+    """The pool class an engine for url would use, with checkouts timed as name
+    
+    Pass it as create_engine(poolclass=...). A disposed engine's new pool
+    is of the same class, so it stays timed.
+    """
+    url = make_url(url)
+    base = url.get_dialect().get_pool_class(url)
+    return type(f"Timed{base.__name__}", (TimedCheckout, base), {"metrics_name": name})
+
+class MetricsRegistry:
+    """Everything /metrics reports, rendered in the Prometheus text format
+    
+    Nothing is computed per request beyond the counters the sources keep
+    anyway; rendering only reads them, so a scrape costs about a
+    millisecond however busy the app is. Counters are per process.
+    """
+    
+    def __init__(self, timings: RouteTimings, sql: SqlMetrics):
+        self.timings = timings
+        self.sql = sql
+        self.caches: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.components: Dict[str, Callable[[], Dict[str, Any]]] = {}
+    
+    def add_cache(self, name: str, stats: Callable[[], Dict[str, Any]]):
+        """Report a cache whose stats() has hits, misses and entries (or size)"""
+        self.caches[name] = stats
+    
+    def add_component(self, name: str, stats: Callable[[], Dict[str, Any]]):
+        """Report every numeric value of stats() as a luxecloth_<name>_<key> gauge"""
+        self.components[name] = stats
+    
+    def render(self) -> str:
+        out = _Writer()
+        self._render_http(out)
+        self._render_sql(out)
+        self._render_caches(out)
+        for name, stats in self.components.items():
+            for key, value in stats().items():
+                if isinstance(value, (bool, int, float)):
+                    out.metric(f"luxecloth_{name}_{key}", "gauge", f"{name} {key}".replace("_", " "))
+                    out.sample(f"luxecloth_{name}_{key}", {}, float(value))
+        return out.text()
+    
+    def _render_http(self, out: "_Writer"):
+        out.metric("luxecloth_http_request_duration_seconds", "histogram", "Time to the end of each response, by route template")
+        for (method, route), histogram in list(self.timings.histograms.items()):
+            out.histogram("luxecloth_http_request_duration_seconds", {"method": method, "route": route}, histogram)
+        out.metric("luxecloth_http_responses_total", "counter", "Responses by route template and status code")
+        for (method, route, status), count in list(self.timings.responses.items()):
+            out.sample("luxecloth_http_responses_total", {"method": method, "route": route, "status": str(status)}, count)
+    
+    def _render_sql(self, out: "_Writer"):
+        snapshot = self.sql.snapshot()
+        out.metric("luxecloth_db_statement_duration_seconds", "histogram", "SQL statement execution time, by engine and statement kind")
+        for (engine, kind), histogram in snapshot["statements"].items():
+            out.histogram("luxecloth_db_statement_duration_seconds", {"engine": engine, "kind": kind}, histogram)
+        out.metric("luxecloth_db_statement_errors_total", "counter", "SQL statements that raised, by engine and statement kind")
+        for (engine, kind), count in snapshot["statement_errors"].items():
+            out.sample("luxecloth_db_statement_errors_total", {"engine": engine, "kind": kind}, count)
+        
+        out.metric("luxecloth_db_pool_checkout_wait_seconds", "histogram", "Time to get a connection from the pool")
+        for engine, histogram in snapshot["checkouts"].items():
+            out.histogram("luxecloth_db_pool_checkout_wait_seconds", {"engine": engine}, histogram)
+        out.metric("luxecloth_db_pool_checkout_errors_total", "counter", "Pool checkouts that failed or timed out")
+        for engine, count in snapshot["checkout_errors"].items():
+            out.sample("luxecloth_db_pool_checkout_errors_total", {"engine": engine}, count)
+        
+        gauges = [
+            ("size", "Connections the pool keeps open", lambda pool: pool.size()),
+            ("checked_out", "Connections in use", lambda pool: pool.checkedout()),
+            ("idle", "Open connections waiting in the pool", lambda pool: pool.checkedin()),
+            ("overflow", "Connections open beyond the pool size", lambda pool: max(pool.overflow(), 0)),
+        ]
+        pools = [(engine, self.sql.engines[engine].pool) for engine in self.sql.engines]
+        for name, help_text, read in gauges:
+            out.metric(f"luxecloth_db_pool_{name}", "gauge", help_text)
+            for engine, pool in pools:
+                # Only queue pools have a size; SQLite's memory pools don't
+                if isinstance(pool, QueuePool):
+                    out.sample(f"luxecloth_db_pool_{name}", {"engine": engine}, read(pool))
+    
+    def _render_caches(self, out: "_Writer"):
+        rows = [(name, stats()) for name, stats in self.caches.items()]
+        series = [
+            ("hits_total", "counter", "Cache lookups answered from the cache", lambda stats: stats["hits"]),
+            ("misses_total", "counter", "Cache lookups that missed", lambda stats: stats["misses"]),
+            ("entries", "gauge", "Entries held", lambda stats: stats.get("entries", stats.get("size", 0))),
+            ("hit_ratio", "gauge", "Hits over lookups since the process started", _hit_ratio),
+        ]
+        for suffix, kind, help_text, read in series:
+            out.metric(f"luxecloth_cache_{suffix}", kind, help_text)
+            for name, stats in rows:
+                out.sample(f"luxecloth_cache_{suffix}", {"cache": name}, read(stats))
+
+def _hit_ratio(stats: Dict[str, Any]) -> float:
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+class _Writer:
+    """Prometheus text exposition format (version 0.0.4)"""
+    
+    def __init__(self):
+        self.lines: List[str] = []
+    
+    def metric(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+    
+    def sample(self, name: str, labels: Dict[str, str], value: float):
+        if labels:
+            rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            self.lines.append(f"{name}{{{rendered}}} {_number(value)}")
+        else:
+            self.lines.append(f"{name} {_number(value)}")
+    
+    def histogram(self, name: str, labels: Dict[str, str], histogram: LatencyHistogram):
+        cumulative = 0
+        previous = -1
+        for index in EXPORTED_BUCKETS:
+            cumulative += sum(histogram.counts[previous + 1:index + 1])
+            previous = index
+            self.sample(f"{name}_bucket", {**labels, "le": f"{LatencyHistogram.upper_bound(index):.4g}"}, cumulative)
+        self.sample(f"{name}_bucket", {**labels, "le": "+Inf"}, histogram.count)
+        self.sample(f"{name}_sum", labels, histogram.sum)
+        self.sample(f"{name}_count", labels, histogram.count)
+    
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+metrics = MetricsRegistry(route_timings, sql_metrics)
@@ -0,0 +1,107 @@
+"""
+Rendered page cache with strong ETags
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response
+
+@dataclass
+class CachedPage:
+    """Rendered page bytes and their strong validator"""
+    body: bytes
+    etag: str
+    version: Hashable
+    created_at: float
+
+class PageCache:
+    """LRU cache of rendered HTML pages
+    
+    Entries are keyed on route path plus query parameters and tagged with
+    the data version they were rendered from; an entry from an older
+    version, or older than ttl seconds, is treated as a miss. The version
+    only changes with writes made by this process, so ttl bounds how long
+    other workers' writes and catalog imports go unseen. Only pages that
+    are identical for every visitor may be stored, so they must not
+    contain anything taken from request headers, such as absolute URLs
+    built from the Host header; links in them are relative.
+    """
+    
+    def __init__(self, max_entries: int = 128, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries: "OrderedDict[Tuple[Hashable, ...], CachedPage]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key_for(request: Request) -> Tuple[Hashable, ...]:
+        """Cache key for a request: path plus sorted query parameters"""
+        return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    
+    def get(self, request: Request, version: Hashable) -> Optional[CachedPage]:
+        """Return the cached page for request if rendered at version"""
+        key = self.key_for(request)
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None or page.version != version or page.created_at + self.ttl < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+    
+    def store(self, request: Request, body: bytes, version: Hashable) -> CachedPage:
+        """Cache a rendered body for request, returning the entry"""
+        page = CachedPage(body=body, etag=make_etag(body), version=version, created_at=time.monotonic())
+        key = self.key_for(request)
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return page
+    
+    def respond(self, request: Request, page: CachedPage) -> Response:
+        """Serve page, or 304 Not Modified if the client already has it"""
+        headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), page.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(page.body, headers=headers)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "size": len(self._entries),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+def make_etag(body: bytes) -> str:
+    """Strong entity tag derived from the response bytes"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against etag (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,59 @@
+"""
+Per-request SQL query counting
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+
+class QueryCounter:
+    """Number of statements executed inside a count_queries() block"""
+    
+    def __init__(self):
+        self.count = 0
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Count SQL statements executed in the current context"""
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+def install_query_counter(engine):
+    """Attach the counter to a (sync) engine"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+class QueryCountMiddleware:
+    """ASGI middleware counting each request's queries
+    
+    The count is reported in an X-Query-Count response header, so
+    pages can be checked against a query budget.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        with count_queries() as counter:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(counter.count).encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+            
+            await self.app(scope, receive, send_with_count)
@@ -0,0 +1,257 @@
+"""
+Token bucket rate limiting
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+class MemoryBackend:
+    """Buckets for the most recently seen clients of this process
+    
+    At most max_clients buckets are kept; the least recently seen client
+    is forgotten first, which only hands it a full bucket again.
+    """
+    
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        self.evictions = 0
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def take(self, client: str, cost: float, capacity: float, rate: float, now: float) -> float:
+        """Take cost tokens from client's bucket; returns seconds to wait (0 if allowed)"""
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [capacity, now]
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(client)
+            return _take(bucket, cost, capacity, rate, now)
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+def _take(bucket, cost: float, capacity: float, rate: float, now: float) -> float:
+    """Refill bucket = [tokens, updated] up to now and take cost from it"""
+    tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    if tokens >= cost:
+        bucket[0] = tokens - cost
+        return 0.0
+    bucket[0] = tokens
+    return (cost - tokens) / rate
+
+# Slot: client key hash, tokens, last update (wall clock, shared by processes)
+SLOT = struct.Struct("<Qdd")
+PROBES = 8
+
+class SharedMemoryBackend:
+    """Buckets in a memory-mapped file shared by every worker on the host
+    
+    The file is a fixed-size open-addressing table of slots, so memory
+    stays bounded whatever the number of clients. A client hashes to a
+    run of PROBES slots; when none is free or its own, the slot updated
+    longest ago is reused. Updates hold an fcntl lock on that run of
+    slots, so workers only contend when their clients share a run.
+    """
+    
+    def __init__(self, path: Optional[str] = None, slots: int = 65536):
+        if fcntl is None:
+            raise RuntimeError("The shared rate limit backend needs fcntl (POSIX)")
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(directory, "luxecloth-rate-limit")
+        self.path = path
+        self.slots = slots
+        self.evictions = 0
+        size = slots * SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # A table of another size belongs to an older configuration
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+    
+    def take(self, client: str, cost: float, capacity: float, rate: float, now: float) -> float:
+        """Take cost tokens from client's bucket; returns seconds to wait (0 if allowed)"""
+        # 0 marks an empty slot, so keys are never 0
+        key = int.from_bytes(hashlib.blake2b(client.encode(), digest_size=8).digest(), "little") or 1
+        first = key % self.slots
+        run = [(first + probe) % self.slots for probe in range(PROBES)]
+        # A run that wraps past the end locks the whole file (length 0)
+        wraps = first + PROBES > self.slots
+        start, length = (0, 0) if wraps else (first * SLOT.size, PROBES * SLOT.size)
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                slot, bucket = self._find(run, key, capacity, now)
+                wait = _take(bucket, cost, capacity, rate, now)
+                SLOT.pack_into(self._map, slot * SLOT.size, key, bucket[0], bucket[1])
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+        return wait
+    
+    def _find(self, run: Iterable[int], key: int, capacity: float, now: float) -> Tuple[int, List[float]]:
+        """The client's slot and bucket, claiming a free or stale slot if it has none"""
+        oldest, oldest_updated = None, math.inf
+        for slot in run:
+            slot_key, tokens, updated = SLOT.unpack_from(self._map, slot * SLOT.size)
+            if slot_key == key:
+                return slot, [tokens, updated]
+            if slot_key == 0:
+                return slot, [capacity, now]
+            if updated < oldest_updated:
+                oldest, oldest_updated = slot, updated
+        self.evictions += 1
+        return oldest, [capacity, now]
+    
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+class RateLimiter:
+    """Token buckets refilled at limit tokens per window seconds
+    
+    Each request costs one token unless a cost rule matches it. Rules map
+    "METHOD /path/prefix" (or just "/path/prefix") to a cost; the longest
+    matching prefix wins. A bucket holds at most burst tokens (defaults
+    to limit), so a client can spend a full window's allowance at once
+    and is then held to the refill rate. Checking a request is O(1).
+    """
+    
+    def __init__(
+        self,
+        limit: int = 100,
+        window: float = 60,
+        burst: Optional[int] = None,
+        costs: Optional[Dict[str, float]] = None,
+        backend=None
+    ):
+        self.capacity = float(burst or limit)
+        self.rate = limit / window
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.allowed = 0
+        self.limited = 0
+        rules = []
+        for rule, cost in (costs or {}).items():
+            method, _, prefix = rule.rpartition(" ")
+            rules.append((prefix, method.upper() or None, float(cost)))
+        # Longest prefix first; method-specific before any-method
+        self._rules = sorted(rules, key=lambda rule: (-len(rule[0]), rule[1] is None))
+    
+    def cost(self, method: str, path: str) -> float:
+        for prefix, rule_method, cost in self._rules:
+            if path.startswith(prefix) and (rule_method is None or rule_method == method):
+                return cost
+        return 1.0
+    
+    def check(self, client: str, method: str, path: str, now: Optional[float] = None) -> float:
+        """Charge a request to client; returns seconds until it would be allowed (0 if allowed now)"""
+        wait = self.backend.take(client, self.cost(method, path), self.capacity, self.rate, now or time.time())
+        if wait:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return wait
+    
+    def stats(self) -> Dict[str, float]:
+        """Return allowed/limited counters and backend evictions"""
+        return {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evictions": self.backend.evictions,
+        }
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 once a client's bucket is empty
+    
+    Clients are identified by an address a proxy in front of the app set,
+    never by one the client could: client_ip_header (such as Fly-Client-IP,
+    which the proxy overwrites), else the X-Forwarded-For entry added by
+    the outermost of trusted_proxies proxies (counted from the right, as
+    each proxy appends the address it received from), else the peer
+    address.
+    """
+    
+    def __init__(
+        self,
+        app,
+        limiter: RateLimiter,
+        exempt_paths: Optional[List[str]] = None,
+        client_ip_header: Optional[str] = None,
+        trusted_proxies: int = 0
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.exempt_paths = tuple(exempt_paths or ())
+        self.client_ip_header = client_ip_header.lower().encode("latin-1") if client_ip_header else None
+        self.trusted_proxies = trusted_proxies
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            return await self.app(scope, receive, send)
+        
+        wait = self.limiter.check(self._client(scope), scope["method"], scope["path"])
+        if wait:
+            return await self._too_many_requests(send, wait)
+        return await self.app(scope, receive, send)
+    
+    def _client(self, scope) -> str:
+        forwarded = []
+        for name, value in scope.get("headers", ()):
+            if name == self.client_ip_header:
+                address = value.decode("latin-1").strip()
+                if address:
+                    return address
+            elif name == b"x-forwarded-for" and self.trusted_proxies:
+                forwarded.extend(entry.strip() for entry in value.decode("latin-1").split(","))
+        # Fewer entries than proxies: the chain is not the one configured
+        if self.trusted_proxies and len(forwarded) >= self.trusted_proxies:
+            address = forwarded[-self.trusted_proxies]
+            if address:
+                return address
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+    
+    @staticmethod
+    async def _too_many_requests(send, wait: float):
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(math.ceil(wait)).encode()),
+            ],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b'{"detail":"Rate limit exceeded. Please try again later."}',
+        })
+
+def make_backend(kind: str, max_clients: int = 10000, path: Optional[str] = None):
+    """A "memory" (per process) or "shared" (per host) bucket store"""
+    if kind == "shared":
+        return SharedMemoryBackend(path or None, slots=max_clients)
+    if kind == "memory":
+        return MemoryBackend(max_clients)
+    raise ValueError(f"Unknown rate limit backend: {kind}")
@@ -0,0 +1,156 @@
+"""
+Per-request SQL profiling for development
+"""
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Deque, Dict, List, Optional, Set
+
+from sqlalchemy import event
+
+# A statement run this many times in one request is reported as repeated
+REPEAT_THRESHOLD = 3
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+    """Statement with literals as ? and IN lists collapsed, so runs that
+    differ only in their values group together
+    """
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _LITERALS.sub("?", statement)
+    return _PLACEHOLDER_LISTS.sub("(?, ...)", statement)
+
+@dataclass
+class StatementGroup:
+    """Every run of one normalized statement within a request"""
+    statement: str
+    count: int = 0
+    seconds: float = 0.0
+    # Hashes of each distinct parameter set seen
+    parameters: Set[int] = field(default_factory=set)
+    
+    @property
+    def repeated(self) -> bool:
+        return self.count >= REPEAT_THRESHOLD
+    
+    @property
+    def identical(self) -> bool:
+        """Every run had the same parameters (the result could be reused)"""
+        return len(self.parameters) == 1
+
+@dataclass
+class RequestProfile:
+    """The SQL one request ran"""
+    method: str
+    path: str
+    started_at: datetime
+    status: int = 500
+    duration: float = 0.0
+    groups: Dict[str, StatementGroup] = field(default_factory=dict)
+    
+    def add(self, statement: str, parameters, seconds: float):
+        normalized = normalize(statement)
+        group = self.groups.get(normalized)
+        if group is None:
+            group = self.groups[normalized] = StatementGroup(normalized)
+        group.count += 1
+        group.seconds += seconds
+        group.parameters.add(hash(repr(parameters)))
+    
+    @property
+    def count(self) -> int:
+        return sum(group.count for group in self.groups.values())
+    
+    @property
+    def seconds(self) -> float:
+        return sum(group.seconds for group in self.groups.values())
+    
+    def repeated(self) -> List[StatementGroup]:
+        """N+1 suspects: statements run REPEAT_THRESHOLD or more times, most runs first"""
+        return sorted((group for group in self.groups.values() if group.repeated), key=lambda group: -group.count)
+    
+    def by_time(self) -> List[StatementGroup]:
+        return sorted(self.groups.values(), key=lambda group: -group.seconds)
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_profile.get() is not None:
+        context._profile_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    started = getattr(context, "_profile_started", None)
+    if profile is not None and started is not None:
+        profile.add(statement, parameters, time.perf_counter() - started)
+
+def install_sql_profiler(engine):
+    """Attach the profiler to a (sync) engine"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class ProfileStore:
+    """The most recent request profiles"""
+    
+    def __init__(self, max_entries: int = 200):
+        self.profiles: Deque[RequestProfile] = deque(maxlen=max_entries)
+    
+    def add(self, profile: RequestProfile):
+        self.profiles.append(profile)
+    
+    def slowest(self, limit: int = 50) -> List[RequestProfile]:
+        return sorted(self.profiles, key=lambda profile: -profile.duration)[:limit]
+    
+    def clear(self):
+        self.profiles.clear()
+
+class SqlProfilerMiddleware:
+    """ASGI middleware profiling each request's SQL
+    
+    Responses get X-SQL-Count (statements), X-SQL-Time (milliseconds) and
+    X-SQL-Repeated (statements run REPEAT_THRESHOLD or more times, the
+    usual sign of a lazy load per row) headers, and the profile is kept
+    in store for the /debug/sql page. Statements run after the response
+    started, such as while streaming a body, appear in the page only.
+    """
+    
+    def __init__(self, app, store: ProfileStore, exempt_paths: Optional[List[str]] = None):
+        self.app = app
+        self.store = store
+        self.exempt_paths = tuple(exempt_paths or ())
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            return await self.app(scope, receive, send)
+        
+        path = scope["path"]
+        if scope.get("query_string"):
+            path += "?" + scope["query_string"].decode("latin-1")
+        profile = RequestProfile(scope["method"], path, datetime.now())
+        started = time.perf_counter()
+        
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-count", str(profile.count).encode()))
+                headers.append((b"x-sql-time", f"{profile.seconds * 1000:.2f}".encode()))
+                headers.append((b"x-sql-repeated", str(len(profile.repeated())).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current_profile.reset(token)
+            profile.duration = time.perf_counter() - started
+            self.store.add(profile)
@@ -0,0 +1,154 @@
+"""
+Request timing and per-route latency histograms
+"""
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Log-scale buckets: SUBBUCKETS per doubling from MIN_SECONDS, so any
+# recorded latency is within about 9% of its bucket's upper bound
+MIN_SECONDS = 0.00005
+SUBBUCKETS = 8
+BUCKETS = SUBBUCKETS * 22  # 50us .. ~200s
+
+class LatencyHistogram:
+    """Fixed-size histogram of durations in seconds
+    
+    Recording is O(1) and memory is BUCKETS counters whatever the number
+    of observations. Percentiles are read from bucket upper bounds.
+    """
+    
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def record(self, seconds: float):
+        if seconds > MIN_SECONDS:
+            index = min(int(math.log2(seconds / MIN_SECONDS) * SUBBUCKETS), BUCKETS - 1)
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+    
+    @staticmethod
+    def upper_bound(index: int) -> float:
+        return MIN_SECONDS * 2 ** ((index + 1) / SUBBUCKETS)
+    
+    def percentile(self, fraction: float) -> float:
+        """Duration below which fraction of the observations fall"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+    
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+class RouteTimings:
+    """Latency histograms keyed by method and route template
+    
+    Templates ("/api/products/{product_id}") rather than raw paths keep
+    the number of histograms bounded; requests no route matched share
+    one. Responses are also counted by status code. Both are only written
+    from the event loop.
+    """
+    
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+    
+    def record(self, method: str, route: str, seconds: float, status: Optional[int] = None):
+        histogram = self.histograms.get((method, route))
+        if histogram is None:
+            histogram = self.histograms[(method, route)] = LatencyHistogram()
+        histogram.record(seconds)
+        if status is not None:
+            key = (method, route, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+    
+    def summary(self) -> List[Dict[str, object]]:
+        """One row per route, slowest p95 first, durations in milliseconds"""
+        rows = []
+        for (method, route), histogram in list(self.histograms.items()):
+            summary = histogram.summary()
+            rows.append({
+                "method": method,
+                "route": route,
+                "count": summary["count"],
+                **{name: round(summary[name] * 1000, 3) for name in ("mean", "p50", "p95", "p99", "max")},
+            })
+        rows.sort(key=lambda row: row["p95"], reverse=True)
+        return rows
+    
+    def reset(self):
+        self.histograms = {}
+        self.responses = {}
+
+route_timings = RouteTimings()
+
+UNMATCHED_ROUTE = "<unmatched>"
+# Anything else is recorded as OTHER, so clients cannot add histograms
+METHODS = frozenset(["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+
+def route_template(scope) -> str:
+    """The matched route's path template, once the router has run"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("endpoint") is not None:
+        # A mounted app, e.g. static files
+        return scope.get("root_path", "") + "/{path}"
+    return UNMATCHED_ROUTE
+
+class TimingMiddleware:
+    """ASGI middleware timing every HTTP request
+    
+    Adds an X-Process-Time header (seconds until the response started)
+    and records the time to the end of the response in timings, by
+    method and route template, with the response status. A request that
+    raised before responding is counted as a 500, which is what the
+    server error handler outside this middleware sends.
+    """
+    
+    def __init__(self, app, timings: Optional[RouteTimings] = None):
+        self.app = app
+        self.timings = timings if timings is not None else route_timings
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        started = time.perf_counter()
+        status = 500
+        
+        async def send_with_time(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-process-time", f"{time.perf_counter() - started:.6f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_time)
+        finally:
+            method = scope["method"] if scope["method"] in METHODS else "OTHER"
+            self.timings.record(method, route_template(scope), time.perf_counter() - started, status)
@@ -2,6 +2,7 @@
 Luxury Clothing E-commerce Platform
 Entry point for the FastAPI application
 """
+import importlib.util
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -9,7 +10,13 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-from app.main import app
+def __getattr__(name):
+    # `uvicorn main:app` keeps working, while `python main.py` leaves the
+    # app import to uvicorn (and, with reload on, to its worker process)
+    if name == "app":
+        from app.main import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     import uvicorn
@@ -17,14 +24,15 @@ if __name__ == "__main__":
     # Dependency check
     def check_dependencies():
         """Verify all required dependencies are available."""
-        required_packages = ['fastapi', 'uvicorn', 'jinja2', 'sqlalchemy', 'python_dotenv']
-        missing_packages = []
-        
-        for package in required_packages:
-            try:
-                __import__(package.replace('-', '_'))
-            except ImportError:
-                missing_packages.append(package)
+        # Located without importing them, so the check costs no startup time
+        required_packages = {
+            'fastapi': 'fastapi', 'uvicorn': 'uvicorn', 'jinja2': 'jinja2',
+            'sqlalchemy': 'sqlalchemy', 'python-dotenv': 'dotenv'
+        }
+        missing_packages = [
+            package for package, module in required_packages.items()
+            if importlib.util.find_spec(module) is None
+        ]
         
         if missing_packages:
             print(f"❌ Missing packages: {', '.join(missing_packages)}")
@@ -40,7 +48,9 @@ if __name__ == "__main__":
             "app.main:app",
             host="0.0.0.0",
             port=port,
-            reload=True
+            # The reloader imports the app twice and restarts it on every
+            # file change; development only
+            reload=os.getenv("DEBUG", "False").lower() == "true"
         )
     else:
-        exit(1)
\ No newline at end of file
+        exit(1)
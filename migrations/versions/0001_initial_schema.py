@@ -0,0 +1,96 @@
+"""Initial schema
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-18
+
+Tables as originally created by Base.metadata.create_all. Databases
+created before migrations existed should be stamped at this revision:
+
+    alembic stamp 0001_initial_schema
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_initial_schema"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("full_name", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("description", sa.Text(), nullable=True),
+    )
+    op.create_index("ix_categories_id", "categories", ["id"])
+
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("image_url", sa.String(), nullable=True),
+        sa.Column("stock_quantity", sa.Integer(), nullable=True),
+        sa.Column("is_featured", sa.Boolean(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_products_id", "products", ["id"])
+
+    op.create_table(
+        "cart_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_cart_items_id", "cart_items", ["id"])
+
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("shipping_address", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_orders_id", "orders", ["id"])
+
+    op.create_table(
+        "order_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), nullable=True),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+    )
+    op.create_index("ix_order_items_id", "order_items", ["id"])
+
+
+def downgrade():
+    op.drop_table("order_items")
+    op.drop_table("orders")
+    op.drop_table("cart_items")
+    op.drop_table("products")
+    op.drop_table("categories")
+    op.drop_table("users")
@@ -0,0 +1,40 @@
+"""Product full-text search index
+
+Revision ID: 0002_product_search_index
+Revises: 0001_initial_schema
+Create Date: 2026-10-18
+
+SQLite only: FTS5 table plus the triggers that keep it in sync. Other
+backends fall back to pattern matching in ProductService.
+"""
+from alembic import op
+
+from core.database import PRODUCT_SEARCH_DDL
+
+
+revision = "0002_product_search_index"
+down_revision = "0001_initial_schema"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    exists = bind.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    ).first()
+    if exists:
+        # Already created by init_db on this database
+        return
+    for statement in PRODUCT_SEARCH_DDL:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for trigger in ("products_fts_insert", "products_fts_update", "products_fts_delete", "categories_fts_update"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS products_fts")
@@ -0,0 +1,85 @@
+"""Hot-path indexes and unique cart lines
+
+Revision ID: 0003_hot_path_indexes
+Revises: 0002_product_search_index
+Create Date: 2026-10-18
+
+Indexes follow the service queries:
+- product listings filter on is_active and sort by created_at or price,
+  optionally within a category (ProductService.get_product_page)
+- the home page reads active featured products
+- add_to_cart/get_cart_items look up cart_items by (user_id, product_id)
+- order history reads orders by user, newest first; items by order_id
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_hot_path_indexes"
+down_revision = "0002_product_search_index"
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text("is_active = true")
+FEATURED = sa.text("is_featured = true AND is_active = true")
+
+
+def upgrade():
+    bind = op.get_bind()
+    # SQLite stores booleans as 0/1 and only uses a partial index when
+    # the query's WHERE clause matches the index predicate literally
+    active, featured = ACTIVE, FEATURED
+    if bind.dialect.name == "sqlite":
+        active = sa.text("is_active = 1")
+        featured = sa.text("is_featured = 1 AND is_active = 1")
+
+    op.create_index(
+        "ix_products_active_created", "products", ["created_at", "id"],
+        sqlite_where=active, postgresql_where=active
+    )
+    op.create_index(
+        "ix_products_active_price", "products", ["price", "id"],
+        sqlite_where=active, postgresql_where=active
+    )
+    op.create_index(
+        "ix_products_active_category_created", "products", ["category_id", "created_at", "id"],
+        sqlite_where=active, postgresql_where=active
+    )
+    op.create_index(
+        "ix_products_featured", "products", ["created_at"],
+        sqlite_where=featured, postgresql_where=featured
+    )
+
+    # Merge duplicate cart lines before enforcing one row per product
+    op.execute(
+        """
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(c.quantity) FROM cart_items c
+            WHERE c.user_id = cart_items.user_id AND c.product_id = cart_items.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM cart_items WHERE id NOT IN (
+            SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id
+        )
+        """
+    )
+    op.create_index("uq_cart_items_user_product", "cart_items", ["user_id", "product_id"], unique=True)
+
+    op.create_index("ix_orders_user_created", "orders", ["user_id", "created_at"])
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+
+
+def downgrade():
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
+    op.drop_index("ix_orders_user_created", table_name="orders")
+    op.drop_index("uq_cart_items_user_product", table_name="cart_items")
+    op.drop_index("ix_products_featured", table_name="products")
+    op.drop_index("ix_products_active_category_created", table_name="products")
+    op.drop_index("ix_products_active_price", table_name="products")
+    op.drop_index("ix_products_active_created", table_name="products")
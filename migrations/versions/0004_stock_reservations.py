@@ -0,0 +1,52 @@
+"""Stock reservations for cart holds
+
+Revision ID: 0004_stock_reservations
+Revises: 0003_hot_path_indexes
+Create Date: 2026-10-18
+
+products.reserved_quantity counts units held by unexpired reservations,
+so a hold is one conditional UPDATE on the product row. Each hold is
+also recorded in stock_reservations for expiry and release.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_stock_reservations"
+down_revision = "0003_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "reserved_quantity" not in {column["name"] for column in inspector.get_columns("products")}:
+        op.add_column(
+            "products",
+            sa.Column("reserved_quantity", sa.Integer(), nullable=False, server_default="0")
+        )
+    if inspector.has_table("stock_reservations"):
+        # Already created, with its indexes, by init_db's create_all on a
+        # database that predates migrations
+        return
+    op.create_table(
+        "stock_reservations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_stock_reservations_id", "stock_reservations", ["id"])
+    op.create_index(
+        "uq_stock_reservations_user_product", "stock_reservations", ["user_id", "product_id"], unique=True
+    )
+    op.create_index("ix_stock_reservations_expires_at", "stock_reservations", ["expires_at"])
+
+
+def downgrade():
+    op.drop_table("stock_reservations")
+    # Plain ALTER TABLE DROP COLUMN (SQLite 3.35+): a batch table copy
+    # would trip over the products_fts triggers
+    op.drop_column("products", "reserved_quantity")
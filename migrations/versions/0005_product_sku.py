@@ -0,0 +1,32 @@
+"""Product SKUs for catalog imports
+
+Revision ID: 0005_product_sku
+Revises: 0004_stock_reservations
+Create Date: 2026-10-18
+
+scripts/catalog.py upserts products on sku, which needs a unique index
+to resolve conflicts against. Existing products keep a NULL sku.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005_product_sku"
+down_revision = "0004_stock_reservations"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "sku" not in {column["name"] for column in inspector.get_columns("products")}:
+        op.add_column("products", sa.Column("sku", sa.String()))
+    if "uq_products_sku" not in {index["name"] for index in inspector.get_indexes("products")}:
+        op.create_index("uq_products_sku", "products", ["sku"], unique=True)
+
+
+def downgrade():
+    op.drop_index("uq_products_sku", table_name="products")
+    # Plain ALTER TABLE DROP COLUMN (SQLite 3.35+): a batch table copy
+    # would trip over the products_fts triggers
+    op.drop_column("products", "sku")
@@ -0,0 +1,40 @@
+"""Idempotency keys for retried POSTs
+
+Revision ID: 0006_idempotency_keys
+Revises: 0005_product_sku
+Create Date: 2026-10-18
+
+Responses to cart and checkout requests sent with an Idempotency-Key
+header are kept until expires_at, so a retried request gets the same
+response instead of being applied twice.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006_idempotency_keys"
+down_revision = "0005_product_sku"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("idempotency_keys"):
+        # Already created, with its index, by init_db's create_all on a
+        # database that predates migrations
+        return
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("key", sa.String(255), primary_key=True),
+        sa.Column("request_hash", sa.LargeBinary(32), nullable=False),
+        sa.Column("status_code", sa.Integer()),
+        sa.Column("body", sa.LargeBinary()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sqlite_with_rowid=False,
+    )
+    op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+
+def downgrade():
+    op.drop_table("idempotency_keys")
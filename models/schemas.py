@@ -1,8 +1,8 @@
 """
 Pydantic models for request/response validation
 """
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Literal, Union
 from datetime import datetime
 
 # User schemas
@@ -23,6 +23,7 @@ class User(UserBase):
 
 # Product schemas
 class ProductBase(BaseModel):
+    sku: Optional[str] = None
     name: str
     description: Optional[str] = None
     price: float
@@ -42,6 +43,37 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductPage(BaseModel):
+    items: List[Product]
+    sort: str
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None
+    
+    class Config:
+        from_attributes = True
+
+class FacetValue(BaseModel):
+    value: str
+    label: str
+    count: int
+    selected: bool = False
+
+class FacetFlag(BaseModel):
+    count: int
+    selected: bool = False
+
+class ProductFacets(BaseModel):
+    total: int
+    category: List[FacetValue]
+    price: List[FacetValue]
+    in_stock: FacetFlag
+    featured: FacetFlag
+
+class ProductAvailability(BaseModel):
+    product_id: int
+    available: int
+
 # Category schemas
 class CategoryBase(BaseModel):
     name: str
@@ -67,6 +99,45 @@ class CartItem(CartItemBase):
     class Config:
         from_attributes = True
 
+class CartAdd(BaseModel):
+    product_id: int
+    quantity: int = Field(1, gt=0)
+
+class CartUpdate(BaseModel):
+    cart_item_id: int
+    quantity: int = Field(..., ge=0)
+
+class CartRemove(BaseModel):
+    cart_item_id: int
+
+class CartAddOperation(CartAdd):
+    op: Literal["add"]
+
+class CartUpdateOperation(CartUpdate):
+    op: Literal["update"]
+
+class CartRemoveOperation(CartRemove):
+    op: Literal["remove"]
+
+CartOperation = Union[CartAddOperation, CartUpdateOperation, CartRemoveOperation]
+
+class CartBatch(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
+
+class CartLine(BaseModel):
+    id: int
+    product_id: int
+    name: str
+    image_url: Optional[str] = None
+    price: float
+    quantity: int
+    line_total: float
+
+class CartSummary(BaseModel):
+    items: List[CartLine]
+    item_count: int
+    total: float
+
 # Order schemas
 class OrderItemBase(BaseModel):
     product_id: int
@@ -98,6 +169,17 @@ class Order(OrderBase):
     class Config:
         from_attributes = True
 
+class OrderSummary(BaseModel):
+    id: int
+    status: str
+    total_amount: float
+    item_count: int
+    created_at: datetime
+
+class OrderHistoryPage(BaseModel):
+    items: List[OrderSummary]
+    next_cursor: Optional[str] = None
+
 # Authentication schemas
 class Token(BaseModel):
     access_token: str
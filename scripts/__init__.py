@@ -0,0 +1,3 @@
+"""
+Operational scripts (run with python -m scripts.<name>)
+"""
@@ -0,0 +1,138 @@
+"""
+Benchmark cart writes with and without the write-behind cart store
+
+Seeds a scratch database with shoppers whose carts hold a few lines,
+then has every shopper click quantity +/- on their lines (as cart.html
+does) with a short think time between clicks, once writing every change
+through and once through the write-behind store. Counts the statements
+that write to cart_items and to any table, and checks that the database
+ends up with the same quantities either way.
+
+    python -m scripts.bench_cart_store --users 50 --clicks 40 --lines 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="shoppers clicking at once")
+    parser.add_argument("--clicks", type=int, default=40, help="quantity clicks per shopper")
+    parser.add_argument("--lines", type=int, default=4, help="cart lines per shopper")
+    parser.add_argument("--think", type=float, default=0.02, help="seconds between a shopper's clicks")
+    parser.add_argument("--flush-interval", type=float, default=0.5, help="write-behind flush interval")
+    return parser.parse_args()
+
+class WriteCounter:
+    """Counts INSERT/UPDATE/DELETE statements, and those on cart_items"""
+
+    def __init__(self):
+        self.writes = 0
+        self.cart_writes = 0
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        words = statement.split(None, 3)
+        verb = words[0].upper() if words else ""
+        if verb in ("INSERT", "UPDATE", "DELETE"):
+            self.writes += 1
+            if "cart_items" in words[1:3] or words[2:3] == ["cart_items"]:
+                self.cart_writes += 1
+
+async def seed(users, lines):
+    """Create shoppers with carts; return {user id: [cart item ids]}"""
+    from sqlalchemy import update
+    from core.database import AsyncSessionLocal, Product, User
+    from services.cart import CartService
+
+    cart_service = CartService()
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Product).values(stock_quantity=1_000_000))
+        shoppers = [User(email=f"clicker{i}@example.com", full_name="Clicker", hashed_password="x") for i in range(users)]
+        db.add_all(shoppers)
+        await db.commit()
+        carts = {}
+        for user in shoppers:
+            for product_id in range(1, lines + 1):
+                await cart_service.add_to_cart(db, user.id, product_id, 2)
+            carts[user.id] = [item.id for item in await cart_service.load_cart_items(db, user.id)]
+        return carts
+
+async def click(carts, clicks, think, seed_value):
+    """Every shopper clicks +/- on random lines; return (elapsed, expected quantities)"""
+    from core.database import AsyncSessionLocal
+    from services.cart import CartService
+
+    cart_service = CartService()
+    expected = {}
+
+    async def shopper(user_id, item_ids):
+        rng = random.Random(seed_value + user_id)
+        quantities = {item_id: 2 for item_id in item_ids}
+        for _ in range(clicks):
+            item_id = rng.choice(item_ids)
+            quantities[item_id] = max(1, quantities[item_id] + rng.choice((1, -1)))
+            async with AsyncSessionLocal() as db:
+                await cart_service.update_cart_item(db, user_id, item_id, quantities[item_id])
+            await asyncio.sleep(think)
+        expected.update(quantities)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(shopper(user_id, item_ids) for user_id, item_ids in carts.items()))
+    return time.perf_counter() - started, expected
+
+async def stored_quantities(item_ids):
+    from sqlalchemy import select
+    from core.database import AsyncSessionLocal, CartItem
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(CartItem.id, CartItem.quantity).where(CartItem.id.in_(item_ids)))
+        return dict(result.all())
+
+async def benchmark(args):
+    from sqlalchemy import event
+    from core.database import async_engine
+    from services.cart import cart_store
+
+    carts = await seed(args.users, args.lines)
+    item_ids = [item_id for ids in carts.values() for item_id in ids]
+    total_clicks = args.users * args.clicks
+    print(f"{args.users} shoppers x {args.clicks} clicks over {args.lines} lines, "
+          f"think {args.think * 1000:.0f}ms, flush every {args.flush_interval}s")
+    print(f"{'store':<13} {'clicks/s':>9} {'cart writes':>12} {'per click':>10} {'all writes':>11} {'consistent':>11}")
+
+    ok = True
+    cart_store.flush_interval = args.flush_interval
+    for name, enabled in (("database", False), ("write_behind", True)):
+        counter = WriteCounter()
+        event.listen(async_engine.sync_engine, "before_cursor_execute", counter.before_cursor_execute)
+        cart_store.enabled = enabled
+        cart_store.start()
+        elapsed, expected = await click(carts, args.clicks, args.think, seed_value=len(name))
+        await cart_store.stop()
+        for user_id in carts:
+            cart_store.discard(user_id)
+        event.remove(async_engine.sync_engine, "before_cursor_execute", counter.before_cursor_execute)
+
+        consistent = await stored_quantities(item_ids) == expected
+        ok = ok and consistent
+        print(f"{name:<13} {total_clicks / elapsed:>9.1f} {counter.cart_writes:>12} "
+              f"{counter.cart_writes / total_clicks:>10.3f} {counter.writes:>11} {'yes' if consistent else 'NO':>11}")
+    print(f"store: {cart_store.stats()}")
+    return ok
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="luxecloth-cart-store-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'cart_store.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from core.database import init_db
+    init_db()
+    return 0 if asyncio.run(benchmark(args)) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
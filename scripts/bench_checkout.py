@@ -0,0 +1,175 @@
+"""
+Benchmark checkout against the previous two-commit implementation
+
+Seeds a scratch database with products and shoppers, fills every cart
+with the requested number of lines and checks them all out with a fixed
+number of concurrent sessions, once through the original
+create_order_from_cart (commit the order, add items one by one, clear the
+cart, commit again, no stock check) and once through the current
+single-transaction version. Each cart size is run for several rounds,
+alternating which path goes first; reports the median throughput and the
+latency percentiles over all rounds per cart size, and verifies that the
+current path left stock consistent.
+
+    python -m scripts.bench_checkout --lines 1 10 50 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10, 50], help="order lines per checkout")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent checkouts")
+    parser.add_argument("--orders", type=int, default=64, help="checkouts per run")
+    parser.add_argument("--rounds", type=int, default=5, help="runs per path and cart size")
+    return parser.parse_args()
+
+async def legacy_create_order_from_cart(db, user_id, shipping_address):
+    """create_order_from_cart as it was before the single transaction"""
+    from core.database import Order, OrderItem
+    from services.cart import CartService
+
+    cart_service = CartService()
+    cart_items = await cart_service.get_cart_items(db, user_id)
+    if not cart_items:
+        raise ValueError("Cart is empty")
+    order = Order(
+        user_id=user_id,
+        total_amount=cart_service.calculate_total(cart_items),
+        shipping_address=shipping_address,
+        status="pending"
+    )
+    db.add(order)
+    await db.commit()
+    for cart_item in cart_items:
+        db.add(OrderItem(
+            order_id=order.id,
+            product_id=cart_item.product_id,
+            quantity=cart_item.quantity,
+            price=cart_item.product.price
+        ))
+    await cart_service.clear_cart(db, user_id)
+    await db.commit()
+    return order
+
+async def seed(lines, orders):
+    """Create products and shoppers; return (user ids, product ids)"""
+    from core.database import AsyncSessionLocal, Category, Product, User
+
+    async with AsyncSessionLocal() as db:
+        category = Category(name="Benchmark", description="Checkout benchmark")
+        products = [
+            Product(name=f"Bench item {i}", description="", price=10.0 + i,
+                    category=category, stock_quantity=1_000_000)
+            for i in range(max(lines))
+        ]
+        users = [
+            User(email=f"bench{i}@example.com", full_name="Bench", hashed_password="x")
+            for i in range(orders)
+        ]
+        db.add_all([category, *products, *users])
+        await db.commit()
+        return [user.id for user in users], [product.id for product in products]
+
+async def fill_carts(user_ids, product_ids, lines):
+    from sqlalchemy import insert
+    from core.database import AsyncSessionLocal, CartItem
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(CartItem), [
+            {"user_id": user_id, "product_id": product_id, "quantity": 1}
+            for user_id in user_ids
+            for product_id in product_ids[:lines]
+        ])
+        await db.commit()
+
+async def stock_sold(product_ids):
+    from sqlalchemy import select, func
+    from core.database import AsyncSessionLocal, Product
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(func.sum(1_000_000 - Product.stock_quantity)).where(Product.id.in_(product_ids))
+        )
+        return result.scalar() or 0
+
+async def run(checkout, user_ids, concurrency):
+    """Check out every user's cart; return (elapsed seconds, latencies, errors)"""
+    from core.database import AsyncSessionLocal
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(user_id):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await checkout(db, user_id, "1 Benchmark Road")
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(user_id) for user_id in user_ids))
+    return time.perf_counter() - started, latencies, errors
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def benchmark(args):
+    from services.order import OrderService
+
+    user_ids, product_ids = await seed(args.lines, args.orders)
+    paths = [("legacy", legacy_create_order_from_cart), ("current", OrderService().create_order_from_cart)]
+
+    print(f"{args.orders} checkouts per run, concurrency {args.concurrency}, median of {args.rounds} rounds")
+    print(f"{'lines':>5} {'path':<8} {'orders/s':>9} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+    consistent = True
+    for lines in args.lines:
+        results = {name: ([], [], 0) for name, _ in paths}
+        for round_number in range(args.rounds):
+            # Alternate the order so neither path always runs on a warmer database
+            for name, checkout in (paths if round_number % 2 == 0 else paths[::-1]):
+                await fill_carts(user_ids, product_ids, lines)
+                sold_before = await stock_sold(product_ids)
+                elapsed, latencies, errors = await run(checkout, user_ids, args.concurrency)
+                rates, all_latencies, all_errors = results[name]
+                rates.append(len(latencies) / elapsed)
+                all_latencies.extend(latencies)
+                results[name] = (rates, all_latencies, all_errors + errors)
+                if name == "current":
+                    sold = await stock_sold(product_ids) - sold_before
+                    if sold != len(latencies) * lines:
+                        consistent = False
+                        print(f"      stock decremented by {sold}, expected {len(latencies) * lines}")
+        for name, _ in paths:
+            rates, latencies, errors = results[name]
+            print(f"{lines:>5} {name:<8} {statistics.median(rates):>9.1f} "
+                  f"{statistics.mean(latencies) * 1000 if latencies else 0:>8.1f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} {errors:>6}")
+    return consistent
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="luxecloth-checkout-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'checkout.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from core.database import init_db
+    init_db()
+    return 0 if asyncio.run(benchmark(args)) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Benchmark login throughput and event loop stalls during a login burst
+
+Seeds a scratch database with shoppers whose password hashes use one
+bcrypt round fewer than configured, then runs the same burst of logins
+three times: through the hashing pool while the outdated hashes are
+upgraded, verifying on the event loop as authenticate_user used to, and
+through the pool again. A ticker task measures how late the event loop
+runs while each burst is in progress; that lag is what every other
+request on the storefront would wait.
+
+    python -m scripts.bench_login --logins 64 --concurrency 16 --rounds 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+PASSWORD = "correct horse battery staple"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64, help="logins per burst")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent logins")
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt rounds (BCRYPT_ROUNDS)")
+    return parser.parse_args()
+
+async def seed(logins, rounds):
+    """Create one user per login, hashed with rounds - 1"""
+    from passlib.hash import bcrypt
+    from core.database import AsyncSessionLocal, User
+
+    hashed = bcrypt.using(rounds=rounds - 1).hash(PASSWORD)
+    async with AsyncSessionLocal() as db:
+        users = [
+            User(email=f"login{i}@example.com", full_name="Login", hashed_password=hashed)
+            for i in range(logins)
+        ]
+        db.add_all(users)
+        await db.commit()
+        return [user.email for user in users]
+
+async def legacy_authenticate_user(auth_service, db, email, password):
+    """authenticate_user as it was, verifying on the event loop"""
+    user = await auth_service.get_user_by_email(db, email)
+    if not user or not auth_service.verify_password(password, user.hashed_password):
+        return None
+    return user
+
+async def measure_lag(stop, lags, interval=0.005):
+    """Record how late each short sleep wakes up until stop is set"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+async def burst(authenticate, emails, concurrency):
+    """Log every user in; return (elapsed, latencies, loop lags, failures)"""
+    from core.database import AsyncSessionLocal
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, lags = [], []
+    failures = 0
+
+    async def login(email):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                if await authenticate(db, email, PASSWORD) is None:
+                    failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(login(email) for email in emails))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return elapsed, latencies, lags, failures
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+async def benchmark(args):
+    from sqlalchemy import select
+    from core.database import AsyncSessionLocal, User
+    from services.auth import AuthService, password_hasher
+
+    auth_service = AuthService()
+    emails = await seed(args.logins, args.rounds)
+    paths = [
+        ("pool+rehash", auth_service.authenticate_user),
+        ("inline", lambda db, email, password: legacy_authenticate_user(auth_service, db, email, password)),
+        ("pool", auth_service.authenticate_user),
+    ]
+
+    print(f"{args.logins} logins, concurrency {args.concurrency}, bcrypt rounds {args.rounds}, "
+          f"{password_hasher.max_workers} hash workers")
+    print(f"{'path':<12} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'lag p95 ms':>11} {'lag max ms':>11} {'failed':>6}")
+    ok = True
+    for name, authenticate in paths:
+        elapsed, latencies, lags, failures = await burst(authenticate, emails, args.concurrency)
+        print(f"{name:<12} {len(latencies) / elapsed:>9.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(lags, 0.95) * 1000:>11.1f} "
+              f"{max(lags, default=0) * 1000:>11.1f} {failures:>6}")
+        ok = ok and not failures
+    password_hasher.shutdown()
+
+    async with AsyncSessionLocal() as db:
+        hashes = (await db.execute(select(User.hashed_password).where(User.email.in_(emails)))).scalars().all()
+    upgraded = sum(not password_hasher.context.needs_update(hashed) for hashed in hashes)
+    print(f"{upgraded}/{len(hashes)} hashes upgraded to {args.rounds} rounds; pool {password_hasher.stats()}")
+    return ok and upgraded == len(hashes)
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="luxecloth-login-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'login.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+    from core.database import init_db
+    init_db()
+    return 0 if asyncio.run(benchmark(args)) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
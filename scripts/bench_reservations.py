@@ -0,0 +1,155 @@
+"""
+Benchmark stock holds under flash-sale contention
+
+Seeds a scratch database, then has hundreds of shoppers add the same
+low-stock product (the seeded "Gold Watch", 3 in stock) to their carts at
+once, with the in-memory inventory counters disabled and then enabled.
+Reports throughput, latency and SQL statements per attempt, and checks
+that exactly the available stock was held, that the holders can check
+out, and that expired holds are released.
+
+    python -m scripts.bench_reservations --buyers 300 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PRODUCT_NAME = "Gold Watch"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=300, help="shoppers competing for the product")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent add-to-cart requests")
+    return parser.parse_args()
+
+async def seed(buyers):
+    """Create the shoppers; return (user ids, product id, stock)"""
+    from sqlalchemy import select
+    from core.database import AsyncSessionLocal, Product, User
+
+    async with AsyncSessionLocal() as db:
+        users = [
+            User(email=f"buyer{i}@example.com", full_name="Buyer", hashed_password="x")
+            for i in range(buyers)
+        ]
+        db.add_all(users)
+        await db.commit()
+        product = (await db.execute(select(Product).where(Product.name == PRODUCT_NAME))).scalar_one()
+        return [user.id for user in users], product.id, product.stock_quantity
+
+async def reset(product_id, stock):
+    """Drop every cart line and hold and restore the product's stock"""
+    from sqlalchemy import delete, update
+    from core.database import AsyncSessionLocal, CartItem, Product, StockReservation
+    from services.inventory import inventory_counters
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(CartItem))
+        await db.execute(delete(StockReservation))
+        await db.execute(
+            update(Product).where(Product.id == product_id).values(stock_quantity=stock, reserved_quantity=0)
+        )
+        await db.commit()
+    inventory_counters.invalidate()
+
+async def product_state(product_id):
+    from sqlalchemy import select
+    from core.database import AsyncSessionLocal, Product
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Product.stock_quantity, Product.reserved_quantity).where(Product.id == product_id)
+        )
+        return result.one()
+
+async def contend(user_ids, product_id, concurrency):
+    """Every user adds one unit; return (elapsed, latencies, holders, statements, errors)"""
+    from core.database import AsyncSessionLocal
+    from core.query_counter import count_queries
+    from services.cart import CartService
+    from services.inventory import OutOfStockError
+
+    cart_service = CartService()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    holders = []
+    errors = 0
+
+    async def buy(user_id):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await cart_service.add_to_cart(db, user_id, product_id)
+                holders.append(user_id)
+            except OutOfStockError:
+                pass
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    with count_queries() as counter:
+        started = time.perf_counter()
+        await asyncio.gather(*(buy(user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, holders, counter.count, errors
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+async def benchmark(args):
+    from core.database import AsyncSessionLocal
+    from services.inventory import inventory_counters, reservation_service
+    from services.order import OrderService
+
+    user_ids, product_id, stock = await seed(args.buyers)
+    print(f"{args.buyers} buyers, concurrency {args.concurrency}, {PRODUCT_NAME} stock {stock}")
+    print(f"{'counters':<9} {'tries/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'SQL/try':>8} {'held':>5} {'errors':>6}")
+
+    ok = True
+    ttl = inventory_counters.ttl
+    for label, counter_ttl in (("off", 0), ("on", ttl)):
+        await reset(product_id, stock)
+        inventory_counters.ttl = counter_ttl
+        elapsed, latencies, holders, statements, errors = await contend(user_ids, product_id, args.concurrency)
+        print(f"{label:<9} {len(latencies) / elapsed:>8.1f} {percentile(latencies, 0.5) * 1000:>7.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>7.1f} {statements / len(user_ids):>8.2f} "
+              f"{len(holders):>5} {errors:>6}")
+        _, reserved = await product_state(product_id)
+        if len(holders) != stock or reserved != stock:
+            ok = False
+            print(f"          expected {stock} holds, got {len(holders)} (reserved_quantity {reserved})")
+    inventory_counters.ttl = ttl
+
+    # Holders check out; everyone else's carts stay empty
+    for user_id in holders[:-1]:
+        async with AsyncSessionLocal() as db:
+            await OrderService().create_order_from_cart(db, user_id, "1 Drop Street")
+    # The last hold lapses and is released by a sweep
+    async with AsyncSessionLocal() as db:
+        released = await reservation_service.release_expired(db, now=datetime.utcnow() + timedelta(days=1))
+    remaining, reserved = await product_state(product_id)
+    print(f"after checkout and expiry: stock {remaining}, reserved {reserved}, released {released}")
+    if (remaining, reserved, released) != (1, 0, 1):
+        ok = False
+        print(f"          expected stock 1, reserved 0, released 1")
+    return ok
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="luxecloth-reservations-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'reservations.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from core.database import init_db
+    init_db()
+    return 0 if asyncio.run(benchmark(args)) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
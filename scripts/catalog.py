@@ -0,0 +1,423 @@
+"""
+Stream the product catalog in and out of the database
+
+Imports read CSV or JSON Lines in fixed-size batches; each batch upserts
+its categories (on name) and products (on sku) with one executemany and
+commits, so memory stays bounded however large the file is. Rows
+without a sku are always inserted. Exports stream products in id order
+without loading the result set.
+
+    python -m scripts.catalog import products.csv
+    python -m scripts.catalog import products.jsonl --batch-size 10000
+    python -m scripts.catalog export products.jsonl
+    python -m scripts.catalog export - --format csv > products.csv
+    python -m scripts.catalog sample 1000000 products.jsonl
+
+Columns: sku, name, description, price, category (a category name,
+required, created if missing), image_url, stock_quantity, is_featured,
+is_active.
+Running servers pick up imported rows once their cached catalog data,
+rendered pages and facet counts expire (CATALOG_CACHE_TTL).
+"""
+import argparse
+import csv
+import json
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+COLUMNS = [
+    "sku", "name", "description", "price", "category", "image_url",
+    "stock_quantity", "is_featured", "is_active",
+]
+
+# Product columns an import sets; everything but sku is overwritten on conflict
+PRODUCT_COLUMNS = [
+    "sku", "name", "description", "price", "category_id", "image_url",
+    "stock_quantity", "is_featured", "is_active",
+]
+
+MAX_REPORTED_ERRORS = 10
+
+# Imports larger than this drop the full-text triggers and rebuild the
+# index at the end; smaller ones keep it current row by row
+REINDEX_ABOVE = 50000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="upsert products from a CSV or JSONL file")
+    load.add_argument("path", help="file to read, or - for stdin")
+    load.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    load.add_argument("--batch-size", type=int, default=5000, help="rows per transaction")
+    load.add_argument("--reindex-above", type=int, default=REINDEX_ABOVE,
+                      help="rows after which the search index is rebuilt at the end instead of kept current")
+
+    dump = commands.add_parser("export", help="write every product to a CSV or JSONL file")
+    dump.add_argument("path", help="file to write, or - for stdout")
+    dump.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    dump.add_argument("--batch-size", type=int, default=5000, help="rows fetched at a time")
+
+    sample = commands.add_parser("sample", help="write a synthetic catalog for load testing")
+    sample.add_argument("rows", type=int, help="number of products")
+    sample.add_argument("path", help="file to write, or - for stdout")
+    sample.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    return parser.parse_args()
+
+def file_format(path: str, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith(".jsonl") or path.endswith(".ndjson"):
+        return "jsonl"
+    raise SystemExit(f"Cannot tell the format of {path!r}; pass --format csv or --format jsonl")
+
+@contextmanager
+def open_file(path: str, mode: str):
+    if path == "-":
+        yield sys.stdin if "r" in mode else sys.stdout
+    else:
+        with open(path, mode, newline="", encoding="utf-8") as handle:
+            yield handle
+
+class Progress:
+    """Single-line progress readout on stderr, redrawn at most twice a second"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._drawn = 0.0
+
+    def advance(self, rows: int):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._drawn >= 0.5:
+            self._drawn = now
+            self._draw(now)
+
+    def finish(self):
+        self._draw(time.perf_counter())
+        sys.stderr.write("\n")
+
+    def _draw(self, now: float):
+        elapsed = max(now - self.started, 1e-9)
+        sys.stderr.write(f"\r{self.label}: {self.rows:,} rows in {elapsed:.1f}s ({self.rows / elapsed:,.0f} rows/s)")
+        sys.stderr.flush()
+
+def read_rows(handle: IO[str], fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(line number, raw row) pairs from a CSV or JSONL stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(handle)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(handle, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, {"_error": f"invalid JSON ({e.msg})"}
+
+def _flag(value: Any, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "y", "t"):
+        return True
+    if text in ("0", "false", "no", "n", "f"):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+def parse_row(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a raw row into product values plus its category name"""
+    if "_error" in raw:
+        raise ValueError(raw["_error"])
+    name = (raw.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    price = float(raw.get("price"))
+    if price < 0:
+        raise ValueError("price must not be negative")
+    category = (raw.get("category") or "").strip()
+    if not category:
+        raise ValueError("category is required")
+    stock = raw.get("stock_quantity")
+    return {
+        "sku": (str(raw.get("sku") or "").strip() or None),
+        "name": name,
+        # Pages show the start of it, so a missing one is stored empty
+        "description": raw.get("description") or "",
+        "price": price,
+        "category": category,
+        "image_url": raw.get("image_url") or None,
+        "stock_quantity": int(stock) if stock not in (None, "") else 0,
+        "is_featured": _flag(raw.get("is_featured"), False),
+        "is_active": _flag(raw.get("is_active"), True),
+    }
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def dialect_insert(engine):
+    """The insert() construct with ON CONFLICT support for this database"""
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise SystemExit(f"Catalog import supports SQLite and PostgreSQL, not {engine.dialect.name}")
+    return insert
+
+class DeferredSearchIndex:
+    """Full-text triggers that are dropped once an import grows large
+
+    Maintaining products_fts row by row is most of the cost of a large
+    SQLite import; one INSERT ... SELECT at the end is far cheaper. But
+    while the triggers are gone running servers' search misses changed
+    products, so small imports keep them and index as they go. Call
+    load(rows) before each batch's transaction.
+    """
+
+    TRIGGERS = ("products_fts_insert", "products_fts_update", "products_fts_delete", "categories_fts_update")
+
+    def __init__(self, conn, threshold: int):
+        from sqlalchemy import text
+
+        self.conn = conn
+        self.threshold = threshold
+        self.rows = 0
+        self.deferred = False
+        self.enabled = conn.dialect.name == "sqlite" and conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )).first() is not None
+
+    def load(self, rows: int):
+        self.rows += rows
+        if self.enabled and not self.deferred and self.rows > self.threshold:
+            from sqlalchemy import text
+
+            for trigger in self.TRIGGERS:
+                self.conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            self.conn.commit()
+            self.deferred = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.deferred:
+            return
+        from sqlalchemy import text
+        from core.database import PRODUCT_SEARCH_DDL
+
+        # One transaction, so searches see the old index or the new one.
+        # PRODUCT_SEARCH_DDL is: table, four triggers, backfill
+        self.conn.rollback()
+        self.conn.execute(text("DELETE FROM products_fts"))
+        for statement in PRODUCT_SEARCH_DDL[1:]:
+            self.conn.execute(text(statement))
+        self.conn.commit()
+
+@contextmanager
+def bulk_load_pragmas(conn):
+    """Larger page cache and no fsync per batch for this SQLite connection
+
+    Each batch still commits, so an interrupted import keeps the batches
+    before it; only an OS crash mid-import can lose recent commits.
+    """
+    if conn.dialect.name != "sqlite":
+        yield
+        return
+    saved = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in ("synchronous", "cache_size")}
+    conn.exec_driver_sql("PRAGMA synchronous = OFF")
+    conn.exec_driver_sql("PRAGMA cache_size = -262144")
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            conn.exec_driver_sql(f"PRAGMA {name} = {value}")
+
+def import_catalog(engine, handle: IO[str], fmt: str, batch_size: int, progress: Progress,
+                   reindex_above: int = REINDEX_ABOVE) -> Dict[str, int]:
+    """Upsert every row of a catalog stream; returns counters"""
+    from sqlalchemy import bindparam, or_, select
+    from core.database import Category, Product
+
+    insert = dialect_insert(engine)
+    categories = Category.__table__
+    products = Product.__table__
+    upsert = insert(products)
+    updated = [column for column in PRODUCT_COLUMNS if column != "sku"]
+    # Rows that match what is stored are left alone, so re-running an
+    # import only rewrites (and re-indexes) the products that changed
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[products.c.sku],
+        set_={column: upsert.excluded[column] for column in updated},
+        where=or_(*(products.c[column].is_distinct_from(upsert.excluded[column]) for column in updated))
+    )
+    # Compiled once and run on the driver directly: per-row parameter
+    # processing in the ORM layer costs more than SQLite's own insert
+    columns = PRODUCT_COLUMNS + ["reserved_quantity", "created_at"]
+    compiled = upsert.compile(dialect=engine.dialect, column_keys=columns)
+    created_at = datetime.utcnow()
+    process_created_at = products.c.created_at.type.dialect_impl(engine.dialect).bind_processor(engine.dialect)
+    created_at = process_created_at(created_at) if process_created_at else created_at
+    add_categories = insert(categories).on_conflict_do_nothing(index_elements=[categories.c.name])
+
+    existing_skus = select(products.c.sku).where(products.c.sku.in_(bindparam("skus", expanding=True)))
+
+    stats = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "categories": 0}
+    with engine.connect() as conn:
+        category_ids = dict(conn.execute(select(categories.c.name, categories.c.id)).all())
+        with bulk_load_pragmas(conn), DeferredSearchIndex(conn, reindex_above) as search_index:
+            for batch in batched(read_rows(handle, fmt), batch_size):
+                search_index.load(len(batch))
+                values = []
+                for line_number, raw in batch:
+                    try:
+                        values.append(parse_row(raw))
+                    except (TypeError, ValueError) as e:
+                        stats["skipped"] += 1
+                        if stats["skipped"] <= MAX_REPORTED_ERRORS:
+                            sys.stderr.write(f"\rline {line_number}: skipped, {e}\n")
+
+                new_names = {row["category"] for row in values} - set(category_ids)
+                if new_names:
+                    conn.execute(add_categories, [{"name": name} for name in sorted(new_names)])
+                    category_ids.update(conn.execute(
+                        select(categories.c.name, categories.c.id).where(categories.c.name.in_(new_names))
+                    ).all())
+                    stats["categories"] += len(new_names)
+                # Rows whose sku is stored (or earlier in the batch) update
+                # a product; the rest insert one
+                seen = set()
+                for skus in batched({row["sku"] for row in values if row["sku"]}, 10000):
+                    seen.update(conn.execute(existing_skus, {"skus": skus}).scalars())
+                inserted = 0
+                for row in values:
+                    row["category_id"] = category_ids[row.pop("category")]
+                    row["reserved_quantity"] = 0
+                    row["created_at"] = created_at
+                    if row["sku"] is None or row["sku"] not in seen:
+                        inserted += 1
+                        seen.add(row["sku"])
+                if values:
+                    if compiled.positional:
+                        values = [tuple(row[key] for key in compiled.positiontup) for row in values]
+                    # Unchanged rows fail the upsert's WHERE and are not counted
+                    written = conn.exec_driver_sql(compiled.string, values).rowcount
+                    stats["inserted"] += inserted
+                    stats["updated"] += written - inserted
+                    stats["unchanged"] += len(values) - written
+                conn.commit()
+
+                stats["rows"] += len(batch)
+                progress.advance(len(batch))
+    return stats
+
+def export_catalog(engine, handle: IO[str], fmt: str, batch_size: int, progress: Progress) -> int:
+    """Write every product, fetching batch_size rows at a time"""
+    from sqlalchemy import select
+    from core.database import Category, Product
+
+    query = (
+        select(
+            Product.sku, Product.name, Product.description, Product.price,
+            Category.name.label("category"), Product.image_url, Product.stock_quantity,
+            Product.is_featured, Product.is_active
+        )
+        .outerjoin(Category, Category.id == Product.category_id)
+        .order_by(Product.id)
+    )
+    writer = csv.DictWriter(handle, fieldnames=COLUMNS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    count = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for rows in result.partitions():
+            for row in rows:
+                record = dict(row._mapping)
+                if writer:
+                    writer.writerow(record)
+                else:
+                    handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+            count += len(rows)
+            progress.advance(len(rows))
+    return count
+
+def write_sample(handle: IO[str], fmt: str, rows: int, progress: Progress):
+    """Write a synthetic catalog of rows products across a few categories"""
+    rng = random.Random(rows)
+    categories = ["Men's Suits", "Women's Dresses", "Accessories", "Shoes", "Outerwear", "Knitwear"]
+    materials = ["wool", "silk", "cashmere", "linen", "leather", "cotton"]
+    writer = csv.DictWriter(handle, fieldnames=COLUMNS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    for index in range(rows):
+        material = rng.choice(materials)
+        record = {
+            "sku": f"LC-{index:08d}",
+            "name": f"{material.title()} piece {index}",
+            "description": f"Sample {material} item number {index}.",
+            "price": round(rng.uniform(50, 5000), 2),
+            "category": rng.choice(categories),
+            "image_url": None,
+            "stock_quantity": rng.randint(0, 50),
+            "is_featured": rng.random() < 0.01,
+            "is_active": True,
+        }
+        if writer:
+            writer.writerow(record)
+        else:
+            handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+        if index % 10000 == 9999:
+            progress.advance(10000)
+    progress.advance(rows % 10000)
+
+def main():
+    args = parse_args()
+    fmt = file_format(args.path, args.format)
+
+    if args.command == "sample":
+        progress = Progress("sample")
+        with open_file(args.path, "w") as handle:
+            write_sample(handle, fmt, args.rows, progress)
+        progress.finish()
+        return 0
+
+    from core.database import engine, init_db
+    init_db()
+
+    if args.command == "import":
+        progress = Progress("import")
+        with open_file(args.path, "r") as handle:
+            stats = import_catalog(engine, handle, fmt, args.batch_size, progress, args.reindex_above)
+        progress.finish()
+        print(f"{stats['inserted']:,} products added, {stats['updated']:,} updated, "
+              f"{stats['unchanged']:,} unchanged, {stats['skipped']:,} rows skipped, "
+              f"{stats['categories']:,} categories added", file=sys.stderr)
+        return 1 if stats["skipped"] else 0
+
+    progress = Progress("export")
+    with open_file(args.path, "w") as handle:
+        export_catalog(engine, handle, fmt, args.batch_size, progress)
+    progress.finish()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Check that the hot service queries are served by indexes
+
+Builds a scratch SQLite database through the Alembic migrations, runs the
+catalog, cart and order service calls that back the busiest pages,
+captures every SELECT they issue and inspects its EXPLAIN QUERY PLAN.
+A full table scan, or a temporary sort on a keyset listing, fails the
+check.
+
+    python -m scripts.check_query_plans
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print every captured plan")
+    return parser.parse_args()
+
+async def run_scenarios(capture):
+    """Drive the hot service paths, tagging captured SQL per scenario"""
+    from core.database import AsyncSessionLocal, User
+    from services.cart import CartService
+    from services.idempotency import IdempotencyStore
+    from services.order import OrderService
+    from services.product import ProductService, catalog_cache
+
+    products, carts, orders = ProductService(), CartService(), OrderService()
+
+    async with AsyncSessionLocal() as db:
+        user = User(email="plans@example.com", full_name="Plan Check", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+        catalog_cache.invalidate()
+        capture.start("listing: newest")
+        page = await products.get_product_page(db, limit=3)
+        capture.start("listing: newest, next page")
+        await products.get_product_page(db, cursor=page.next_cursor, limit=3)
+        capture.start("listing: price")
+        await products.get_product_page(db, sort="price_asc", limit=3)
+        capture.start("listing: category")
+        await products.get_product_page(db, category="Shoes", limit=3)
+        capture.start("listing: count", allow_sort=True)
+        await products.count_products(db, category="Shoes")
+        capture.start("search", allow_sort=True)
+        await products.get_product_page(db, search="leather", limit=3)
+        capture.start("featured")
+        await products.get_featured_products(db)
+        capture.start("product detail")
+        product = await products.get_product(db, 1)
+        capture.start("related products")
+        await products.get_related_products(db, product.category_id, exclude_id=product.id)
+
+        capture.start("cart: add")
+        await carts.add_to_cart(db, user.id, 1)
+        await carts.add_to_cart(db, user.id, 1)
+        capture.start("cart: items")
+        await carts.get_cart_items(db, user.id)
+        capture.start(None)
+        order = await orders.create_order_from_cart(db, user.id, "1 Plan Street")
+        await carts.add_to_cart(db, user.id, 2)
+        await orders.create_order_from_cart(db, user.id, "1 Plan Street")
+        capture.start("orders: history")
+        history = await orders.get_order_history(db, user.id, limit=1)
+        capture.start("orders: history, next page")
+        await orders.get_order_history(db, user.id, cursor=history.next_cursor, limit=1)
+        capture.start("orders: detail")
+        await orders.get_order(db, order.id, user_id=user.id)
+
+        # No front cache, so the retry reads the stored response
+        idempotency = IdempotencyStore(max_entries=0)
+
+        async def respond():
+            return 200, b"{}"
+
+        capture.start(None)
+        await idempotency.run(db, user.id, "plan-check", b"0" * 32, respond)
+        capture.start("idempotency: replay")
+        await idempotency.run(db, user.id, "plan-check", b"0" * 32, respond)
+        capture.stop()
+
+class PlanCapture:
+    """Collects SELECT statements issued while a scenario is active"""
+
+    def __init__(self):
+        self.scenario = None
+        self.allow_sort = False
+        self.statements = []
+
+    def start(self, scenario, allow_sort=False):
+        self.scenario = scenario
+        self.allow_sort = allow_sort
+
+    def stop(self):
+        self.scenario = None
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.scenario and statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((self.scenario, self.allow_sort, statement, parameters))
+
+def problems_in_plan(plan, allow_sort):
+    """Return the plan steps that indicate a missing index"""
+    problems = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and " USING " not in detail and "VIRTUAL TABLE" not in detail:
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE FOR ORDER BY") and not allow_sort:
+            problems.append(detail)
+    return problems
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="luxecloth-plans-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import event
+    from core.database import async_engine, engine, init_db
+
+    config = Config(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini"))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, "head")
+    init_db()
+
+    capture = PlanCapture()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture.before_cursor_execute)
+    asyncio.run(run_scenarios(capture))
+
+    failures = 0
+    with engine.connect() as conn:
+        for scenario, allow_sort, statement, parameters in capture.statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters)).all()
+            plan = [row[-1] for row in rows]
+            problems = problems_in_plan(plan, allow_sort)
+            if problems or args.verbose:
+                print(f"{'FAIL' if problems else 'ok  '} {scenario}")
+                print("     " + " ".join(statement.split())[:200])
+                for detail in plan:
+                    print(f"       {'!' if detail in problems else '-'} {detail}")
+            failures += bool(problems)
+
+    scenarios = len({scenario for scenario, *_ in capture.statements})
+    print(f"{len(capture.statements)} queries across {scenarios} scenarios, {failures} without index support")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Create the database schema and seed sample data
+
+Does what the app otherwise does as it starts. Deployments that run this
+before the server (and set INIT_DB_ON_STARTUP=false) start serving
+without any schema checks.
+
+    python -m scripts.init_db
+"""
+import argparse
+import sys
+import time
+
+from dotenv import load_dotenv
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    return parser.parse_args()
+
+def main():
+    parse_args()
+    # The same database as `python main.py`
+    load_dotenv()
+
+    from core.database import init_db
+    started = time.perf_counter()
+    init_db()
+    print(f"Database ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Report where a cold start spends its time
+
+Imports the app in a fresh interpreter with -X importtime and lists the
+packages and first-party modules that take longest to import. Then
+starts uvicorn several times against a scratch database. Each start is
+timed from process spawn to the first answered health check and to the
+first rendered page. The first start creates and seeds the database, as
+a new machine would.
+
+    python -m scripts.startup_report --runs 3 --top 12
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_PARTY = {"api", "app", "core", "models", "services"}
+STARTUP_LOG = re.compile(r"app imported in (\d+) ms, database ready in (\d+) ms")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="server starts to time")
+    parser.add_argument("--top", type=int, default=12, help="packages and modules to list")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a server")
+    return parser.parse_args()
+
+def import_times(env):
+    """(total ms, {top-level package: self ms}, {first-party module: (self ms, cumulative ms)})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    packages = defaultdict(float)
+    modules = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name.split(".")[0] in FIRST_PARTY:
+            modules[name] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        if name == "app.main":
+            total = int(cumulative_us) / 1000
+    return total, packages, modules
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url, deadline):
+    """Poll url until it answers 200; False once deadline passes"""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    response.read()
+                    return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+def fetch_ms(url):
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=10) as response:
+        response.read()
+    return (time.perf_counter() - started) * 1000
+
+def time_start(env, timeout):
+    """Start uvicorn once; return its timings in ms, or None if it never answered"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryFile("w+") as log:
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            if not wait_for(f"{base}/health", started + timeout):
+                return None
+            timings = {"ready": (time.perf_counter() - started) * 1000}
+            timings["first page"] = fetch_ms(f"{base}/")
+            timings["second page"] = fetch_ms(f"{base}/")
+        finally:
+            server.terminate()
+            server.wait()
+        log.seek(0)
+        match = STARTUP_LOG.search(log.read())
+    if match:
+        timings["app import"], timings["database"] = (float(value) for value in match.groups())
+    return timings
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="luxecloth-startup-")
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    env.pop("ASYNC_DATABASE_URL", None)
+    env["DEBUG"] = "False"
+
+    total, packages, modules = import_times(env)
+    print(f"import app.main: {total:.0f} ms")
+    print(f"{'package':<28} {'self ms':>8}")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<28} {ms:>8.1f}")
+    print(f"\n{'first-party module':<28} {'self ms':>8} {'total ms':>9}")
+    for name, (self_ms, cumulative_ms) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{name:<28} {self_ms:>8.1f} {cumulative_ms:>9.1f}")
+
+    columns = ["ready", "app import", "database", "first page", "second page"]
+    print(f"\n{'start':<10}" + "".join(f"{column + ' ms':>15}" for column in columns))
+    ok = True
+    for run in range(args.runs):
+        timings = time_start(env, args.timeout)
+        label = "fresh db" if run == 0 else f"warm {run}"
+        if timings is None:
+            ok = False
+            print(f"{label:<10} server did not answer within {args.timeout:.0f}s")
+            continue
+        print(f"{label:<10}" + "".join(
+            f"{timings[column]:>15.0f}" if column in timings else f"{'-':>15}" for column in columns
+        ))
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
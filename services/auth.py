@@ -1,20 +1,270 @@
 """
 Authentication service
 """
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+from jose import JWTError
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from core.database import User
 from app.config import settings
 
+class HasherBusyError(RuntimeError):
+    """Raised when too many password checks are already waiting for a worker"""
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool instead of the event loop
+    
+    bcrypt releases the GIL while hashing, so worker threads hash in
+    parallel while the loop keeps serving requests. At most max_workers
+    hashes run at once; up to max_queue more wait their turn and further
+    calls raise HasherBusyError rather than queueing without bound.
+    """
+    
+    def __init__(self, context: CryptContext, max_workers: int = 4, max_queue: int = 64):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+    
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        """Run func(*args) on a worker once a slot is free"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="password-hash")
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self.running >= self.max_workers and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HasherBusyError("Too many password checks in progress")
+        
+        queued_at = time.perf_counter()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        started = time.perf_counter()
+        self.wait_seconds += started - queued_at
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.hash_seconds += time.perf_counter() - started
+            self._slots.release()
+    
+    async def hash(self, password: str) -> str:
+        """Hash a password with the current cost settings"""
+        return await self._run(self.context.hash, password)
+    
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check a password; also return a new hash if the stored one is outdated"""
+        return await self._run(self._verify_and_update, password, hashed)
+    
+    def _verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        try:
+            return self.context.verify_and_update(password, hashed)
+        except Exception:
+            return False, None
+    
+    def shutdown(self):
+        """Stop the worker threads (after in-flight hashes finish)"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage for diagnostics"""
+        return {
+            "workers": self.max_workers,
+            "running": self.running,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_hash_ms": round(self.hash_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+# Hashes made with fewer rounds than BCRYPT_ROUNDS are upgraded at the
+# owner's next login
+password_hasher = PasswordHasher(
+    CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS),
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
+class TokenCache:
+    """LRU of verified token claims, each kept until its token expires
+    
+    A hit skips the signature check; tokens are immutable, so a cached
+    entry can only become stale by expiring.
+    """
+    
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Claims of a previously verified, unexpired token"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, token: str, claims: Dict[str, Any], expires_at: float):
+        """Remember a verified token's claims until expires_at (epoch seconds)"""
+        with self._lock:
+            self._entries[token] = (expires_at, claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Forget every token"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cache statistics for diagnostics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Read-only snapshot of the user fields requests need"""
+    id: int
+    email: str
+    full_name: str
+    is_active: bool
+
+class UserCache:
+    """Short-TTL user snapshots, looked up by email
+    
+    Entries are dropped when a session commits a change to the user, so
+    the TTL only bounds staleness from writes made by other processes.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, CachedUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, email: str) -> Optional[CachedUser]:
+        """Cached snapshot for an email, or None"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[email]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, user: CachedUser):
+        """Cache a snapshot"""
+        with self._lock:
+            self._entries[user.email] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_ids=(), emails=()):
+        """Drop the snapshots of some users"""
+        user_ids = set(user_ids)
+        with self._lock:
+            for email in emails:
+                self._entries.pop(email, None)
+            if user_ids:
+                for email in [email for email, (_, user) in self._entries.items() if user.id in user_ids]:
+                    del self._entries[email]
+    
+    def clear(self):
+        """Forget every user"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cache statistics for diagnostics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+token_cache = TokenCache(max_entries=settings.TOKEN_CACHE_MAX_ENTRIES)
+user_cache = UserCache(max_entries=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL)
+
+@event.listens_for(Session, "after_flush")
+def _track_user_writes(session, flush_context):
+    """Remember users changed or deleted by a session"""
+    written = session.info.setdefault("user_writes", set())
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            written.add((obj.id, obj.email))
+            # A changed email leaves the snapshot under the old one
+            written.update((obj.id, email) for email in inspect(obj).attrs.email.history.deleted)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_users_on_commit(session):
+    """Drop snapshots of users whose changes were committed"""
+    written = session.info.pop("user_writes", None)
+    if written:
+        user_cache.invalidate(
+            user_ids=[user_id for user_id, _ in written],
+            emails=[email for _, email in written]
+        )
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_writes(session):
+    """Forget tracked user changes that were rolled back"""
+    session.info.pop("user_writes", None)
+
 class AuthService:
     """Authentication service for user management"""
     
     def __init__(self):
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.pwd_context = password_hasher.context
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify password against hash"""
@@ -27,30 +277,51 @@ class AuthService:
         """Hash password"""
         return self.pwd_context.hash(password)
     
-    def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
         """Get user by email"""
-        return db.query(User).filter(User.email == email).first()
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+    
+    async def get_cached_user(self, db: AsyncSession, email: str) -> Optional[CachedUser]:
+        """Snapshot of the user with an email, from the user cache when fresh"""
+        cached = user_cache.get(email)
+        if cached is None:
+            user = await self.get_user_by_email(db, email)
+            if user is None:
+                return None
+            cached = CachedUser(
+                id=user.id, email=user.email, full_name=user.full_name, is_active=bool(user.is_active)
+            )
+            user_cache.set(cached)
+        return cached
     
-    def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
-        """Authenticate user with email and password"""
-        user = self.get_user_by_email(db, email)
+    async def authenticate_user(self, db: AsyncSession, email: str, password: str) -> Optional[User]:
+        """Authenticate user with email and password
+        
+        A hash made with outdated cost settings is replaced on success.
+        Raises HasherBusyError when the hashing pool is saturated.
+        """
+        user = await self.get_user_by_email(db, email)
         if not user:
             return None
-        if not self.verify_password(password, user.hashed_password):
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+        if not verified:
             return None
+        if new_hash:
+            user.hashed_password = new_hash
+            await db.commit()
         return user
     
-    def create_user(self, db: Session, email: str, password: str, full_name: str) -> User:
+    async def create_user(self, db: AsyncSession, email: str, password: str, full_name: str) -> User:
         """Create new user"""
-        hashed_password = self.get_password_hash(password)
+        hashed_password = await password_hasher.hash(password)
         user = User(
             email=email,
             full_name=full_name,
             hashed_password=hashed_password
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
         return user
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
@@ -61,16 +332,30 @@ class AuthService:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update({"exp": expire})
+        # jose.jwt pulls in the cryptography backends; imported on first
+        # use rather than at startup
+        from jose import jwt
         encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
         return encoded_jwt
     
     def verify_token(self, token: str) -> dict:
-        """Verify JWT token"""
+        """Verify JWT token
+        
+        Verified claims are cached until the token's expiry, so repeat
+        requests with the same token skip the signature check.
+        """
+        claims = token_cache.get(token)
+        if claims is not None:
+            return dict(claims)
+        from jose import jwt
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
             email: str = payload.get("sub")
             if email is None:
                 raise JWTError("Invalid token")
-            return {"email": email}
         except JWTError:
-            raise JWTError("Invalid token")
\ No newline at end of file
+            raise JWTError("Invalid token")
+        claims = {"email": email}
+        if "exp" in payload:
+            token_cache.set(token, claims, float(payload["exp"]))
+        return dict(claims)
\ No newline at end of file
@@ -1,70 +1,532 @@
 """
 Shopping cart service
 """
-from sqlalchemy.orm import Session
-from typing import List
+import asyncio
+import logging
+import time
+from sqlalchemy import select, update, delete, bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
 
-from core.database import CartItem, Product
+from core.database import CartItem, Product, AsyncSessionLocal
+from services.inventory import reservation_service
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Loader profile for cart lines: the cart page renders item.product and
+# item.product.category and calculate_total reads item.product.price.
+# Both are many-to-one, so one joined query loads the whole cart.
+CART_ITEM_LOAD = (joinedload(CartItem.product).joinedload(Product.category),)
+
+_cart_items = CartItem.__table__
+CART_QUANTITY_UPDATE = (
+    update(_cart_items)
+    .where(_cart_items.c.id == bindparam("cart_item_id"))
+    .values(quantity=bindparam("quantity"))
+)
+
+class ResidentCart:
+    """A user's cart lines held in memory by WriteBehindCartStore
+    
+    Lines are detached CartItem objects; a line updated to 0 stays, hidden,
+    until its delete is flushed.
+    """
+    
+    def __init__(self, items: List[CartItem]):
+        self.lines: Dict[int, CartItem] = {item.id: item for item in items}
+        self.dirty: Set[int] = set()
+        # Units known to be held per product; raising a line above this
+        # takes a hold right away, lowering it is settled at flush
+        self.held: Dict[int, int] = {item.product_id: item.quantity for item in items}
+        self.touched = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    def items(self) -> List[CartItem]:
+        """Visible cart lines"""
+        return [item for item in self.lines.values() if item.quantity > 0]
+    
+    def line_for_product(self, product_id: int) -> Optional[CartItem]:
+        """The line for a product, including one pending removal"""
+        for item in self.lines.values():
+            if item.product_id == product_id:
+                return item
+        return None
+
+class WriteBehindCartStore:
+    """In-memory carts whose quantity changes are flushed in batches
+    
+    Once a cart is read it stays resident; quantity changes and removals
+    are applied in memory and written to cart_items by a background task
+    every flush_interval seconds, so repeated +/- clicks on a line cost one
+    UPDATE. Inserting a new line, clearing a cart and checkout write
+    through: the user's pending changes are flushed first and the cart is
+    dropped from memory. stop() flushes everything on shutdown.
+    
+    Carts live in this process only, so the store must only be enabled
+    with a single worker (or sessions pinned to a worker).
+    """
+    
+    def __init__(self, enabled: bool = False, flush_interval: float = 1, idle_seconds: float = 60):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.idle_seconds = idle_seconds
+        self.changes = 0
+        self.flushes = 0
+        self.lines_flushed = 0
+        self._carts: Dict[int, ResidentCart] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def get(self, user_id: int) -> ResidentCart:
+        """The user's resident cart, loaded on first use"""
+        cart = self._carts.get(user_id)
+        if cart is None:
+            loading = self._loading.get(user_id)
+            if loading is not None:
+                return await asyncio.shield(loading)
+            loading = self._loading[user_id] = asyncio.get_running_loop().create_future()
+            try:
+                # A separate session, so request sessions never track
+                # (and flush) the resident objects
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(
+                        select(CartItem).options(*CART_ITEM_LOAD).where(CartItem.user_id == user_id)
+                    )
+                    cart = ResidentCart(list(result.scalars().all()))
+                self._carts[user_id] = cart
+                loading.set_result(cart)
+            except Exception as e:
+                loading.set_exception(e)
+                loading.exception()
+                raise
+            finally:
+                del self._loading[user_id]
+        cart.touched = time.monotonic()
+        return cart
+    
+    async def apply(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        changes: Callable[[ResidentCart], Optional[Dict[int, int]]]
+    ) -> Optional[List[CartItem]]:
+        """Change line quantities in memory
+        
+        changes is called with the resident cart (under its lock) and
+        returns the new quantity per cart item id, or None if the change
+        cannot be made in memory (e.g. it needs a new line); apply then
+        returns None too. Raises OutOfStockError if a line cannot be held.
+        """
+        cart = await self.get(user_id)
+        async with cart.lock:
+            targets = changes(cart)
+            if targets is None:
+                return None
+            
+            increases = {}
+            for cart_item_id, quantity in targets.items():
+                product_id = cart.lines[cart_item_id].product_id
+                if quantity > cart.held.get(product_id, 0):
+                    increases[product_id] = quantity
+            if increases:
+                try:
+                    await reservation_service.hold_many(db, user_id, increases)
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+                cart.held.update(increases)
+            
+            for cart_item_id, quantity in targets.items():
+                line = cart.lines[cart_item_id]
+                if line.quantity != max(quantity, 0):
+                    line.quantity = max(quantity, 0)
+                    cart.dirty.add(cart_item_id)
+                    self.changes += 1
+            cart.touched = time.monotonic()
+            return cart.items()
+    
+    async def flush(self, user_ids: Optional[Iterable[int]] = None) -> int:
+        """Write pending changes (for some users, or all) in one transaction
+        
+        Holds are trimmed to the flushed quantities. Returns the number of
+        lines written.
+        """
+        async with self._flush_lock:
+            wanted = None if user_ids is None else set(user_ids)
+            batch = [
+                (user_id, cart, {cart_item_id: cart.lines[cart_item_id].quantity for cart_item_id in cart.dirty})
+                for user_id, cart in list(self._carts.items())
+                if cart.dirty and (wanted is None or user_id in wanted)
+            ]
+            if not batch:
+                return 0
+            
+            updates = [
+                {"cart_item_id": cart_item_id, "quantity": quantity}
+                for _, _, changes in batch for cart_item_id, quantity in changes.items() if quantity > 0
+            ]
+            deletes = [
+                cart_item_id
+                for _, _, changes in batch for cart_item_id, quantity in changes.items() if quantity <= 0
+            ]
+            async with AsyncSessionLocal() as db:
+                try:
+                    if updates:
+                        await db.execute(CART_QUANTITY_UPDATE, updates)
+                    if deletes:
+                        await db.execute(delete(CartItem).where(CartItem.id.in_(deletes)))
+                    for user_id, cart, changes in batch:
+                        await reservation_service.hold_many(db, user_id, {
+                            cart.lines[cart_item_id].product_id: quantity
+                            for cart_item_id, quantity in changes.items()
+                        }, grow=False)
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+            
+            # Changes made while the flush was running stay dirty
+            for _, cart, changes in batch:
+                for cart_item_id, quantity in changes.items():
+                    line = cart.lines[cart_item_id]
+                    cart.held[line.product_id] = min(cart.held.get(line.product_id, 0), max(quantity, 0))
+                    if line.quantity == quantity:
+                        cart.dirty.discard(cart_item_id)
+                        if quantity <= 0:
+                            del cart.lines[cart_item_id]
+            self.flushes += 1
+            self.lines_flushed += len(updates) + len(deletes)
+            return len(updates) + len(deletes)
+    
+    async def persist(self, user_id: int):
+        """Flush a user's pending changes and drop their cart from memory"""
+        if user_id in self._carts:
+            await self.flush([user_id])
+            self.discard(user_id)
+    
+    def discard(self, user_id: int):
+        """Drop a user's resident cart without flushing it"""
+        self._carts.pop(user_id, None)
+    
+    def evict_idle(self):
+        """Drop clean carts that have not been used for idle_seconds"""
+        cutoff = time.monotonic() - self.idle_seconds
+        for user_id, cart in list(self._carts.items()):
+            if not cart.dirty and cart.touched < cutoff and not cart.lock.locked():
+                del self._carts[user_id]
+    
+    def start(self):
+        """Start the background flush task on the running event loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the flush task and write everything still pending"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self.evict_idle()
+            except Exception:
+                logger.exception("Flushing resident carts failed; will retry")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Store statistics for diagnostics"""
+        return {
+            "enabled": self.enabled,
+            "carts": len(self._carts),
+            "dirty_lines": sum(len(cart.dirty) for cart in self._carts.values()),
+            "changes": self.changes,
+            "flushes": self.flushes,
+            "lines_flushed": self.lines_flushed,
+        }
+
+def _set_line(cart_item_id: int, quantity: int) -> Callable[[ResidentCart], Optional[Dict[int, int]]]:
+    """Change setting a visible line's quantity (0 removes it)"""
+    def changes(cart: ResidentCart) -> Optional[Dict[int, int]]:
+        line = cart.lines.get(cart_item_id)
+        if line is None or line.quantity <= 0:
+            return None
+        return {cart_item_id: max(quantity, 0)}
+    return changes
+
+cart_store = WriteBehindCartStore(
+    enabled=settings.CART_STORE == "write_behind",
+    flush_interval=settings.CART_FLUSH_INTERVAL,
+    idle_seconds=settings.CART_STORE_IDLE_SECONDS
+)
 
 class CartService:
-    """Service for shopping cart management"""
+    """Service for shopping cart management
     
-    def get_cart_items(self, db: Session, user_id: int) -> List[CartItem]:
+    With the write-behind cart store enabled, reads and quantity changes
+    go through cart_store; everything else writes through.
+    """
+    
+    async def get_cart_items(self, db: AsyncSession, user_id: int) -> List[CartItem]:
         """Get all cart items for user"""
-        return db.query(CartItem).filter(CartItem.user_id == user_id).all()
+        if cart_store.enabled:
+            return (await cart_store.get(user_id)).items()
+        return await self.load_cart_items(db, user_id)
+    
+    async def load_cart_items(self, db: AsyncSession, user_id: int) -> List[CartItem]:
+        """Get all cart items for user as stored in the database"""
+        result = await db.execute(
+            select(CartItem)
+            .options(*CART_ITEM_LOAD)
+            .where(CartItem.user_id == user_id)
+        )
+        return list(result.scalars().all())
+    
+    async def persist(self, user_id: int):
+        """Make the database copy of a user's cart current"""
+        if cart_store.enabled:
+            await cart_store.persist(user_id)
     
-    def add_to_cart(self, db: Session, user_id: int, product_id: int, quantity: int = 1) -> CartItem:
-        """Add item to cart or update quantity if exists"""
+    async def add_to_cart(self, db: AsyncSession, user_id: int, product_id: int, quantity: int = 1) -> CartItem:
+        """Add item to cart or update quantity if exists
+        
+        The line's stock is held for the shopper; raises OutOfStockError
+        if it cannot be.
+        """
+        reservation_service.check({product_id: quantity})
+        if cart_store.enabled:
+            def add(cart: ResidentCart) -> Optional[Dict[int, int]]:
+                line = cart.line_for_product(product_id)
+                return None if line is None else {line.id: line.quantity + quantity}
+            
+            items = await cart_store.apply(db, user_id, add)
+            if items is not None:
+                return next(item for item in items if item.product_id == product_id)
+            await cart_store.persist(user_id)
+        
         # Check if item already in cart
-        existing_item = db.query(CartItem).filter(
-            CartItem.user_id == user_id,
-            CartItem.product_id == product_id
-        ).first()
+        result = await db.execute(
+            select(CartItem).where(
+                CartItem.user_id == user_id,
+                CartItem.product_id == product_id
+            )
+        )
+        existing_item = result.scalars().first()
+        
+        try:
+            if existing_item:
+                await reservation_service.hold(db, user_id, product_id, existing_item.quantity + quantity)
+                existing_item.quantity += quantity
+                await db.commit()
+                return existing_item
+            else:
+                await reservation_service.hold(db, user_id, product_id, quantity)
+                cart_item = CartItem(
+                    user_id=user_id,
+                    product_id=product_id,
+                    quantity=quantity
+                )
+                db.add(cart_item)
+                await db.commit()
+                return cart_item
+        except Exception:
+            await db.rollback()
+            raise
+    
+    async def apply_cart_operations(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        operations: Sequence[Dict[str, Any]]
+    ) -> List[CartItem]:
+        """Apply add/update/remove operations to a cart in one transaction
+        
+        Each operation is a dict with "op" ("add", "update" or "remove") and
+        "product_id" (add) or "cart_item_id" (update/remove) plus "quantity"
+        (add/update; an update to 0 removes the line). The cart is read
+        once, changed in memory and committed once together with the stock
+        holds for the changed lines; if any operation is invalid, or stock
+        cannot be held, nothing is written and ValueError (OutOfStockError)
+        is raised.
+        
+        Returns the user's cart lines after the change.
+        """
+        for attempt in range(2):
+            try:
+                return await self._apply_cart_operations(db, user_id, operations)
+            except (IntegrityError, StaleDataError):
+                # A concurrent request inserted the same product line (or
+                # hold) first, or a sweep released a hold being renewed;
+                # re-read the cart and merge into it
+                await db.rollback()
+                if attempt:
+                    raise
+            except Exception:
+                await db.rollback()
+                raise
+    
+    async def _apply_cart_operations(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        operations: Sequence[Dict[str, Any]]
+    ) -> List[CartItem]:
+        reservation_service.check({
+            op["product_id"]: op["quantity"] for op in operations if op["op"] == "add"
+        })
+        if cart_store.enabled:
+            items = await self._apply_in_store(db, user_id, operations)
+            if items is not None:
+                return items
+            await cart_store.persist(user_id)
+        items = await self.load_cart_items(db, user_id)
+        by_id = {item.id: item for item in items}
+        by_product = {item.product_id: item for item in items}
         
-        if existing_item:
-            existing_item.quantity += quantity
-            db.commit()
-            db.refresh(existing_item)
-            return existing_item
-        else:
-            cart_item = CartItem(
-                user_id=user_id,
-                product_id=product_id,
-                quantity=quantity
+        # Fetch every product being added in one query
+        add_ids = {op["product_id"] for op in operations if op["op"] == "add"} - set(by_product)
+        products = {}
+        if add_ids:
+            result = await db.execute(
+                select(Product).options(joinedload(Product.category)).where(
+                    Product.id.in_(add_ids),
+                    Product.is_active == True
+                )
             )
-            db.add(cart_item)
-            db.commit()
-            db.refresh(cart_item)
-            return cart_item
+            products = {product.id: product for product in result.scalars()}
+        
+        changed = set()
+        for op in operations:
+            if op["op"] == "add":
+                changed.add(op["product_id"])
+                item = by_product.get(op["product_id"])
+                if item is not None:
+                    item.quantity += op["quantity"]
+                    continue
+                product = products.get(op["product_id"])
+                if product is None:
+                    raise ValueError(f"Product {op['product_id']} not found")
+                item = CartItem(user_id=user_id, product=product, quantity=op["quantity"])
+                db.add(item)
+                by_product[product.id] = item
+                items.append(item)
+            elif op["op"] in ("update", "remove"):
+                item = by_id.get(op["cart_item_id"])
+                if item is None or item not in items:
+                    raise ValueError(f"Cart item {op['cart_item_id']} not found")
+                changed.add(item.product_id)
+                if op["op"] == "update" and op["quantity"] > 0:
+                    item.quantity = op["quantity"]
+                else:
+                    await db.delete(item)
+                    items.remove(item)
+                    del by_product[item.product_id]
+            else:
+                raise ValueError(f"Unknown cart operation: {op['op']}")
+        
+        await reservation_service.hold_many(db, user_id, {
+            product_id: by_product[product_id].quantity if product_id in by_product else 0
+            for product_id in changed
+        })
+        await db.commit()
+        return items
+    
+    async def _apply_in_store(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        operations: Sequence[Dict[str, Any]]
+    ) -> Optional[List[CartItem]]:
+        """Apply operations to the resident cart, or return None if one needs a new line"""
+        def changes(cart: ResidentCart) -> Optional[Dict[int, int]]:
+            quantities: Dict[int, int] = {}
+            for op in operations:
+                if op["op"] == "add":
+                    line = cart.line_for_product(op["product_id"])
+                    if line is None:
+                        return None
+                    quantities[line.id] = quantities.get(line.id, line.quantity) + op["quantity"]
+                elif op["op"] in ("update", "remove"):
+                    line = cart.lines.get(op["cart_item_id"])
+                    if line is None or quantities.get(line.id, line.quantity) <= 0:
+                        raise ValueError(f"Cart item {op['cart_item_id']} not found")
+                    quantities[line.id] = op["quantity"] if op["op"] == "update" else 0
+                else:
+                    raise ValueError(f"Unknown cart operation: {op['op']}")
+            return quantities
+        
+        return await cart_store.apply(db, user_id, changes)
     
-    def update_cart_item(self, db: Session, cart_item_id: int, quantity: int) -> CartItem:
+    def summarize(self, cart_items: List[CartItem]) -> Dict[str, Any]:
+        """Cart lines, item count and total for API responses"""
+        lines = [
+            {
+                "id": item.id,
+                "product_id": item.product_id,
+                "name": item.product.name,
+                "image_url": item.product.image_url,
+                "price": item.product.price,
+                "quantity": item.quantity,
+                "line_total": item.product.price * item.quantity,
+            }
+            for item in cart_items
+        ]
+        return {
+            "items": lines,
+            "item_count": sum(item.quantity for item in cart_items),
+            "total": self.calculate_total(cart_items),
+        }
+    
+    async def update_cart_item(self, db: AsyncSession, user_id: int, cart_item_id: int, quantity: int) -> CartItem:
         """Update cart item quantity"""
-        cart_item = db.query(CartItem).filter(CartItem.id == cart_item_id).first()
+        if cart_store.enabled:
+            items = await cart_store.apply(db, user_id, _set_line(cart_item_id, quantity))
+            return None if items is None else (await cart_store.get(user_id)).lines.get(cart_item_id)
+        cart_item = await db.get(CartItem, cart_item_id)
+        if cart_item and cart_item.user_id != user_id:
+            cart_item = None
         if cart_item:
+            await reservation_service.hold(db, user_id, cart_item.product_id, max(quantity, 0))
             if quantity <= 0:
-                db.delete(cart_item)
+                await db.delete(cart_item)
             else:
                 cart_item.quantity = quantity
-            db.commit()
-            if quantity > 0:
-                db.refresh(cart_item)
+            await db.commit()
         return cart_item
     
-    def remove_from_cart(self, db: Session, cart_item_id: int):
+    async def remove_from_cart(self, db: AsyncSession, user_id: int, cart_item_id: int):
         """Remove item from cart"""
-        cart_item = db.query(CartItem).filter(CartItem.id == cart_item_id).first()
-        if cart_item:
-            db.delete(cart_item)
-            db.commit()
+        if cart_store.enabled:
+            await cart_store.apply(db, user_id, _set_line(cart_item_id, 0))
+            return
+        cart_item = await db.get(CartItem, cart_item_id)
+        if cart_item and cart_item.user_id == user_id:
+            await reservation_service.release(db, user_id, [cart_item.product_id])
+            await db.delete(cart_item)
+            await db.commit()
     
-    def clear_cart(self, db: Session, user_id: int):
+    async def clear_cart(self, db: AsyncSession, user_id: int):
         """Clear all items from user's cart"""
-        db.query(CartItem).filter(CartItem.user_id == user_id).delete()
-        db.commit()
+        await self.persist(user_id)
+        await reservation_service.release(db, user_id)
+        await db.execute(delete(CartItem).where(CartItem.user_id == user_id))
+        await db.commit()
     
     def calculate_total(self, cart_items: List[CartItem]) -> float:
         """Calculate total price for cart items"""
         total = 0.0
         for item in cart_items:
             total += item.product.price * item.quantity
-        return total
\ No newline at end of file
+        return total
@@ -0,0 +1,234 @@
+"""
+Facet counts for catalog filtering
+"""
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import select, event, func, case, and_, inspect
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.database import Product, Category
+from app.config import settings
+
+# Price bands as (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ("under-500", "Under $500", 0, 500),
+    ("500-1000", "$500 - $1,000", 500, 1000),
+    ("1000-2000", "$1,000 - $2,000", 1000, 2000),
+    ("2000-plus", "$2,000 & Above", 2000, None),
+]
+PRICE_BAND_KEYS = [band[0] for band in PRICE_BANDS]
+
+# A cell is one combination of facet values, in FACETS order:
+# (category_id, price band key, in stock, featured)
+FACETS = ("category", "price", "in_stock", "featured")
+Cell = Tuple[Optional[int], Optional[str], bool, bool]
+
+def price_band(price: Optional[float]) -> Optional[str]:
+    """Band key for a price"""
+    if price is None:
+        return None
+    for key, _, low, high in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+def price_band_filter(key: str):
+    """SQL condition selecting products in a price band"""
+    for band_key, _, low, high in PRICE_BANDS:
+        if band_key == key:
+            if high is None:
+                return Product.price >= low
+            return and_(Product.price >= low, Product.price < high)
+    raise ValueError(f"Unknown price band: {key}")
+
+def facet_cells_query(base_query):
+    """One aggregated query counting base_query's rows per facet cell
+    
+    base_query must select Product rows; any ordering is discarded.
+    """
+    products = base_query.order_by(None).subquery()
+    band = case(
+        *[
+            (products.c.price >= low if high is None else and_(products.c.price >= low, products.c.price < high), key)
+            for key, _, low, high in PRICE_BANDS
+        ],
+        else_=None
+    )
+    in_stock = case((products.c.stock_quantity > 0, True), else_=False)
+    featured = case((products.c.is_featured == True, True), else_=False)
+    return select(
+        products.c.category_id, band, in_stock, featured, func.count()
+    ).group_by(products.c.category_id, band, in_stock, featured)
+
+class FacetCube:
+    """Product counts per facet cell
+    
+    Counts for any selection are summed from the cells, so one aggregated
+    query serves every combination of filters. Each facet is counted
+    against the other facets' selections only, so choosing a price band
+    still shows how many products the other bands hold.
+    """
+    
+    def __init__(self, rows: Iterable[Tuple[Any, ...]]):
+        self.cells: Dict[Cell, int] = defaultdict(int)
+        for category_id, band, in_stock, featured, count in rows:
+            self.cells[(category_id, band, bool(in_stock), bool(featured))] += count
+    
+    def adjust(self, cell: Optional[Cell], delta: int):
+        """Move one product into or out of a cell"""
+        if cell is None:
+            return
+        self.cells[cell] += delta
+        if self.cells[cell] <= 0:
+            del self.cells[cell]
+    
+    def counts(
+        self,
+        category_id: Optional[int] = None,
+        price: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        featured: Optional[bool] = None
+    ) -> Dict[str, Dict[Any, int]]:
+        """Per-value counts for each facet given the other selections"""
+        selection = (category_id, price, in_stock, featured)
+        counts: Dict[str, Dict[Any, int]] = {name: defaultdict(int) for name in FACETS}
+        total = 0
+        for cell, count in self.cells.items():
+            misses = [i for i, wanted in enumerate(selection) if wanted is not None and cell[i] != wanted]
+            if not misses:
+                total += count
+                for i, name in enumerate(FACETS):
+                    counts[name][cell[i]] += count
+            elif len(misses) == 1:
+                counts[FACETS[misses[0]]][cell[misses[0]]] += count
+        result = {name: dict(values) for name, values in counts.items()}
+        result["total"] = total
+        return result
+
+class FacetIndex:
+    """Holder for the catalog-wide facet cube, kept current by writes
+    
+    Writes made by this process adjust the cube in place. Those made by
+    other workers or by scripts are not seen, so a cube older than ttl
+    seconds is rebuilt, like an expired catalog cache entry.
+    """
+    
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.cube: Optional[FacetCube] = None
+        self.loaded_at = 0.0
+        self.generation = 0
+        self._lock = threading.Lock()
+    
+    def current(self) -> Optional[FacetCube]:
+        """The cube, or None if there is none or it is older than ttl"""
+        with self._lock:
+            if self.cube is not None and self.loaded_at + self.ttl < time.monotonic():
+                self.cube = None
+            return self.cube
+    
+    def load(self, rows: Iterable[Tuple[Any, ...]], generation: int) -> FacetCube:
+        """Install a cube built from rows queried at generation
+        
+        If writes were committed while the rows were being read, the cube
+        is returned but not kept, since those writes may be missing.
+        """
+        cube = FacetCube(rows)
+        with self._lock:
+            if generation == self.generation:
+                self.cube = cube
+                self.loaded_at = time.monotonic()
+        return cube
+    
+    def apply(self, moves: List[Tuple[Optional[Cell], Optional[Cell]]]):
+        """Apply (old cell, new cell) moves from committed product writes"""
+        with self._lock:
+            self.generation += 1
+            if self.cube is None:
+                return
+            for old, new in moves:
+                self.cube.adjust(old, -1)
+                self.cube.adjust(new, +1)
+    
+    def invalidate(self):
+        """Drop the cube; the next read rebuilds it with one query"""
+        with self._lock:
+            self.generation += 1
+            self.cube = None
+
+facet_index = FacetIndex(ttl=settings.CATALOG_CACHE_TTL)
+
+_CELL_ATTRIBUTES = ("category_id", "price", "stock_quantity", "is_featured", "is_active")
+
+def _cell(values: Dict[str, Any]) -> Optional[Cell]:
+    """Cell for a product's attribute values (None if not an active product)"""
+    is_active = values["is_active"]
+    if is_active is not None and not is_active:
+        return None
+    return (
+        values["category_id"],
+        price_band(values["price"]),
+        (values["stock_quantity"] or 0) > 0,
+        bool(values["is_featured"]),
+    )
+
+def _cell_move(product: Product, status: str):
+    """(old cell, new cell) for a flushed product, or _UNKNOWN"""
+    state = inspect(product)
+    if any(name not in state.dict for name in _CELL_ATTRIBUTES):
+        # Unloaded attributes; the cube cannot be adjusted reliably
+        return _UNKNOWN
+    current = {name: state.dict[name] for name in _CELL_ATTRIBUTES}
+    if status == "new":
+        return None, _cell(current)
+    
+    previous = dict(current)
+    for name in _CELL_ATTRIBUTES:
+        history = state.attrs[name].history
+        if history.deleted:
+            previous[name] = history.deleted[0]
+        elif history.added:
+            # Assigned without the old value ever being loaded
+            return _UNKNOWN
+    if status == "deleted":
+        return _cell(previous), None
+    return _cell(previous), _cell(current)
+
+_UNKNOWN = object()
+
+def record_facet_moves(session: Session, moves: Iterable[Tuple[Optional[Cell], Optional[Cell]]]):
+    """Record (old cell, new cell) moves made by SQL the flush hook cannot see
+    
+    The moves are applied to the cube when the session commits and
+    dropped if it rolls back, like tracked ORM writes.
+    """
+    session.info.setdefault("facet_moves", []).extend(moves)
+
+@event.listens_for(Session, "after_flush")
+def _track_facet_moves(session, flush_context):
+    """Record how flushed product writes move products between cells"""
+    moves = session.info.setdefault("facet_moves", [])
+    for status, objects in (("new", session.new), ("dirty", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            if isinstance(obj, Category) and status != "dirty":
+                moves.append(_UNKNOWN)
+            elif isinstance(obj, Product):
+                moves.append(_cell_move(obj, status))
+
+@event.listens_for(Session, "after_commit")
+def _apply_facet_moves(session):
+    """Apply committed moves to the facet cube"""
+    moves = session.info.pop("facet_moves", None)
+    if not moves:
+        return
+    if any(move is _UNKNOWN for move in moves):
+        facet_index.invalidate()
+    else:
+        facet_index.apply(moves)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_facet_moves(session):
+    """Forget tracked moves that were rolled back"""
+    session.info.pop("facet_moves", None)
@@ -0,0 +1,319 @@
+"""
+Idempotency keys for retried requests
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.database import IdempotencyKey, AsyncSessionLocal
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 500
+
+# Client errors the same request always gets again. Others, such as a 409
+# for stock that runs out, can pass on retry and are not stored.
+STORED_CLIENT_ERRORS = frozenset({400, 422})
+
+class IdempotencyConflict(ValueError):
+    """Raised when a key is reused for another request, or its first request is still running"""
+    
+    def __init__(self, message: str, in_progress: bool = False):
+        self.in_progress = in_progress
+        super().__init__(message)
+
+@dataclass(frozen=True)
+class StoredResponse:
+    request_hash: bytes
+    status_code: int
+    body: bytes
+    expires_at: datetime
+
+class IdempotencyStore:
+    """Responses to requests sent with an Idempotency-Key
+    
+    The first request with a key claims it by inserting an in-progress row
+    (committed before the handler runs) and stores its response on that
+    row. A retry with the same key and request gets the stored response
+    without running the handler again; a retry that arrives while the
+    first request is still running waits for it in this process and gets
+    a conflict from any other. Stored responses never change, so the most
+    recent ones are also kept in memory in front of the table.
+    
+    Completed keys expire after ttl seconds. A claim whose request never
+    finished (the process died) can be taken over after claim_seconds.
+    Expired rows are deleted by the sweep task in batches.
+    """
+    
+    def __init__(
+        self,
+        ttl: float = 86400,
+        claim_seconds: float = 60,
+        max_entries: int = 1024,
+        sweep_interval: float = 60
+    ):
+        self.ttl = ttl
+        self.claim_seconds = claim_seconds
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.replays = 0
+        self.swept = 0
+        self._entries: "OrderedDict[Tuple[int, str], StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._running: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def fingerprint(method: str, path: str, body: bytes) -> bytes:
+        """SHA-256 of a request, to tell a retry from a new request reusing its key"""
+        digest = hashlib.sha256(f"{method} {path}\n".encode())
+        digest.update(body)
+        return digest.digest()
+    
+    def get(self, user_id: int, key: str) -> Optional[StoredResponse]:
+        """A cached, unexpired response, or None"""
+        with self._lock:
+            stored = self._entries.get((user_id, key))
+            if stored is None or stored.expires_at <= datetime.utcnow():
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, key))
+            self.hits += 1
+            return stored
+    
+    def set(self, user_id: int, key: str, stored: StoredResponse):
+        """Cache a stored response, evicting the least recently used beyond max_entries"""
+        with self._lock:
+            self._entries[(user_id, key)] = stored
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self):
+        """Drop every cached response (the table is unaffected)"""
+        with self._lock:
+            self._entries.clear()
+    
+    async def run(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        key: str,
+        request_hash: bytes,
+        handler: Callable[[], Awaitable[Tuple[int, bytes]]]
+    ) -> Tuple[int, bytes, bool]:
+        """Handle a request once per key; returns (status code, body, replayed)
+        
+        handler runs at most once per key and a 2xx response, or one of
+        STORED_CLIENT_ERRORS, is stored. Otherwise (a conflict, a 5xx
+        status, an exception) the claim is released so the client can
+        retry. Raises
+        IdempotencyConflict if the key belongs to a different request or
+        its first request is still running in another process.
+        """
+        scope = (user_id, key)
+        while True:
+            stored = self.get(user_id, key)
+            if stored is None and scope in self._running:
+                # Same key already being handled here: wait for its outcome
+                stored = await asyncio.shield(self._running[scope])
+                if stored is None:
+                    continue
+            if stored is not None:
+                return self._replay(stored, request_hash)
+            break
+        
+        running = self._running[scope] = asyncio.get_running_loop().create_future()
+        stored = None
+        try:
+            stored = await self._claim(db, user_id, key, request_hash)
+            if stored is not None:
+                return self._replay(stored, request_hash)
+            try:
+                status_code, body = await handler()
+            except BaseException:
+                await self._release(db, user_id, key)
+                raise
+            if status_code >= 300 and status_code not in STORED_CLIENT_ERRORS:
+                await self._release(db, user_id, key)
+                return status_code, body, False
+            stored = await self._complete(db, user_id, key, request_hash, status_code, body)
+            return status_code, body, False
+        finally:
+            del self._running[scope]
+            running.set_result(stored)
+    
+    def _replay(self, stored: StoredResponse, request_hash: bytes) -> Tuple[int, bytes, bool]:
+        if stored.request_hash != request_hash:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        self.replays += 1
+        return stored.status_code, stored.body, True
+    
+    async def _claim(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        key: str,
+        request_hash: bytes
+    ) -> Optional[StoredResponse]:
+        """Insert an in-progress row for the key and commit
+        
+        Returns None once the key is claimed, or the response stored by an
+        earlier request with the key.
+        """
+        for _ in range(2):
+            now = datetime.utcnow()
+            try:
+                await db.execute(insert(IdempotencyKey).values(
+                    user_id=user_id, key=key, request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=self.claim_seconds)
+                ))
+                await db.commit()
+                return None
+            except IntegrityError:
+                await db.rollback()
+            
+            row = (await db.execute(
+                select(IdempotencyKey.request_hash, IdempotencyKey.status_code, IdempotencyKey.body, IdempotencyKey.expires_at)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            )).one_or_none()
+            if row is not None and row.expires_at > now:
+                if row.status_code is None:
+                    raise IdempotencyConflict("A request with this Idempotency-Key is still being processed", in_progress=True)
+                stored = StoredResponse(row.request_hash, row.status_code, row.body, row.expires_at)
+                self.set(user_id, key, stored)
+                return stored
+            # Expired (or just swept): take the key over
+            await db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.expires_at <= now)
+            )
+            await db.commit()
+        raise IdempotencyConflict("A request with this Idempotency-Key is still being processed", in_progress=True)
+    
+    async def _complete(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        key: str,
+        request_hash: bytes,
+        status_code: int,
+        body: bytes
+    ) -> StoredResponse:
+        """Store the response on the claimed row and commit"""
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        try:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                .values(status_code=status_code, body=body, expires_at=expires_at)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        stored = StoredResponse(request_hash, status_code, body, expires_at)
+        self.set(user_id, key, stored)
+        return stored
+    
+    async def _release(self, db: AsyncSession, user_id: int, key: str):
+        """Drop an unfinished claim so the request can be retried"""
+        try:
+            await db.rollback()
+            await db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None))
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception("Releasing idempotency key %r failed; it frees up in %ss", key, self.claim_seconds)
+    
+    async def delete_expired(
+        self,
+        db: AsyncSession,
+        now: Optional[datetime] = None,
+        limit: int = SWEEP_BATCH_SIZE
+    ) -> int:
+        """Delete up to limit expired keys and commit; returns the number deleted"""
+        expired = (
+            select(IdempotencyKey.user_id, IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at <= (now or datetime.utcnow()))
+            .order_by(IdempotencyKey.expires_at)
+            .limit(limit)
+        )
+        try:
+            result = await db.execute(
+                delete(IdempotencyKey).where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        return result.rowcount
+    
+    async def sweep(self) -> int:
+        """Delete every expired key, in batches"""
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                count = await self.delete_expired(db)
+            total += count
+            if count < SWEEP_BATCH_SIZE:
+                break
+        self.swept += total
+        return total
+    
+    def start(self):
+        """Start sweeping on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the sweep task and wait for it to finish"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Deleting expired idempotency keys failed")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters, replays and keys swept"""
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "replays": self.replays,
+            "in_flight": len(self._running),
+            "swept": self.swept,
+        }
+
+idempotency_store = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL,
+    claim_seconds=settings.IDEMPOTENCY_CLAIM_SECONDS,
+    max_entries=settings.IDEMPOTENCY_CACHE_MAX_ENTRIES,
+    sweep_interval=settings.IDEMPOTENCY_SWEEP_INTERVAL
+)
@@ -0,0 +1,363 @@
+"""
+Inventory reservations for carts
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, event, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.database import Product, StockReservation, AsyncSessionLocal
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class OutOfStockError(ValueError):
+    """Raised when a hold or checkout asks for more than the remaining stock"""
+    
+    def __init__(self, product_ids: List[int]):
+        self.product_ids = product_ids
+        super().__init__(f"Insufficient stock for products: {', '.join(map(str, product_ids))}")
+
+class InventoryCounters:
+    """In-memory available stock for recently requested products
+    
+    A counter is stock_quantity - reserved_quantity as last read from the
+    database, adjusted by holds and checkouts committed in this process.
+    Counters expire after ttl seconds so changes made by other processes
+    are picked up. They only short-circuit requests that cannot succeed;
+    the conditional UPDATE on the product row decides every hold.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, product_id: int) -> Optional[int]:
+        """Available units for a product, or None if not counted"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[product_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(product_id)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, product_id: int, available: int):
+        """Start counting a product from a database read"""
+        with self._lock:
+            self._entries[product_id] = (time.monotonic() + self.ttl, available)
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def adjust(self, deltas: Dict[int, int]):
+        """Apply committed changes to the counted products"""
+        with self._lock:
+            for product_id, delta in deltas.items():
+                entry = self._entries.get(product_id)
+                if entry is not None:
+                    self._entries[product_id] = (entry[0], entry[1] + delta)
+    
+    def invalidate(self, *product_ids: int):
+        """Forget some products (or all) so the next read goes to the database"""
+        with self._lock:
+            if not product_ids:
+                self._entries.clear()
+            for product_id in product_ids:
+                self._entries.pop(product_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counter statistics for diagnostics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+inventory_counters = InventoryCounters(
+    max_entries=settings.INVENTORY_COUNTER_MAX_ENTRIES,
+    ttl=settings.INVENTORY_COUNTER_TTL
+)
+
+def record_inventory_deltas(session: Session, deltas: Dict[int, int]):
+    """Record changes to available stock, applied to the counters on commit"""
+    pending = session.info.setdefault("inventory_deltas", {})
+    for product_id, delta in deltas.items():
+        pending[product_id] = pending.get(product_id, 0) + delta
+
+@event.listens_for(Session, "after_flush")
+def _track_product_writes(session, flush_context):
+    """Remember products written through the ORM (e.g. a restock)"""
+    written = session.info.setdefault("inventory_products", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Product) and obj.id is not None:
+            written.add(obj.id)
+
+@event.listens_for(Session, "after_commit")
+def _apply_inventory_changes(session):
+    """Apply committed holds and checkouts to the counters"""
+    deltas = session.info.pop("inventory_deltas", None)
+    if deltas:
+        inventory_counters.adjust(deltas)
+    written = session.info.pop("inventory_products", None)
+    if written:
+        inventory_counters.invalidate(*written)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_inventory_changes(session):
+    """Forget changes that were rolled back"""
+    session.info.pop("inventory_deltas", None)
+    session.info.pop("inventory_products", None)
+
+# Conditional hold: a row only matches while enough unreserved stock is left
+_products = Product.__table__
+RESERVE = (
+    update(_products)
+    .where(
+        _products.c.id == bindparam("product_id"),
+        _products.c.stock_quantity - _products.c.reserved_quantity >= bindparam("quantity")
+    )
+    .values(reserved_quantity=_products.c.reserved_quantity + bindparam("quantity"))
+)
+RELEASE = (
+    update(_products)
+    .where(_products.c.id == bindparam("product_id"))
+    .values(reserved_quantity=_products.c.reserved_quantity - bindparam("quantity"))
+)
+
+# Expired holds released per sweep transaction
+SWEEP_BATCH_SIZE = 500
+
+class ReservationService:
+    """Time-limited stock holds for cart lines
+    
+    A user's hold on a product follows the quantity of their cart line.
+    Holds are written in the caller's transaction and take effect when it
+    commits; expired holds are released by ReservationSweeper.
+    """
+    
+    async def available(self, db: AsyncSession, product_id: int) -> int:
+        """Units of a product not held by anyone"""
+        available = inventory_counters.get(product_id)
+        if available is None:
+            result = await db.execute(
+                select(Product.stock_quantity - Product.reserved_quantity)
+                .where(Product.id == product_id, Product.is_active == True)
+            )
+            available = max(result.scalar() or 0, 0)
+            inventory_counters.set(product_id, available)
+        return available
+    
+    def check(self, quantities: Dict[int, int]):
+        """Raise OutOfStockError if the counters show fewer units than requested
+        
+        Costs no database access, so hot products that have sold out turn
+        requests away before the cart is even read.
+        """
+        short = []
+        for product_id, quantity in quantities.items():
+            available = inventory_counters.get(product_id)
+            if available is not None and available < quantity:
+                short.append(product_id)
+        if short:
+            raise OutOfStockError(sorted(short))
+    
+    async def hold(self, db: AsyncSession, user_id: int, product_id: int, quantity: int):
+        """Set a user's hold on a product to quantity units (0 releases it)"""
+        await self.hold_many(db, user_id, {product_id: quantity})
+    
+    async def hold_many(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        quantities: Dict[int, int],
+        hold_seconds: Optional[int] = None,
+        grow: bool = True
+    ):
+        """Set a user's holds to the given quantity per product
+        
+        Existing holds are renewed. Raises OutOfStockError, before
+        touching the database when the counters already show too little
+        stock, if any product cannot cover its increase; the caller should
+        roll back. With grow=False holds are only ever reduced.
+        """
+        if not quantities:
+            return
+        expires_at = datetime.utcnow() + timedelta(
+            seconds=settings.RESERVATION_HOLD_SECONDS if hold_seconds is None else hold_seconds
+        )
+        result = await db.execute(
+            select(StockReservation).where(
+                StockReservation.user_id == user_id,
+                StockReservation.product_id.in_(quantities)
+            )
+        )
+        holds = {hold.product_id: hold for hold in result.scalars()}
+        if not grow:
+            quantities = {
+                product_id: min(quantity, holds[product_id].quantity if product_id in holds else 0)
+                for product_id, quantity in quantities.items()
+            }
+        
+        deltas = {
+            product_id: quantity - (holds[product_id].quantity if product_id in holds else 0)
+            for product_id, quantity in quantities.items()
+        }
+        increases = sorted((product_id, delta) for product_id, delta in deltas.items() if delta > 0)
+        self.check(dict(increases))
+        short = []
+        for product_id, delta in increases:
+            reserved = await db.execute(RESERVE, {"product_id": product_id, "quantity": delta})
+            if reserved.rowcount != 1:
+                short.append(product_id)
+        if short:
+            # Count the contended products so further requests for them
+            # are turned away without touching the database
+            for product_id in short:
+                inventory_counters.invalidate(product_id)
+                await self.available(db, product_id)
+            raise OutOfStockError(short)
+        releases = [
+            {"product_id": product_id, "quantity": -delta}
+            for product_id, delta in deltas.items() if delta < 0
+        ]
+        if releases:
+            await db.execute(RELEASE, releases)
+        
+        for product_id, quantity in quantities.items():
+            hold = holds.get(product_id)
+            if quantity <= 0:
+                if hold is not None:
+                    await db.delete(hold)
+            elif hold is not None:
+                hold.quantity = quantity
+                hold.expires_at = expires_at
+            else:
+                db.add(StockReservation(
+                    user_id=user_id, product_id=product_id, quantity=quantity, expires_at=expires_at
+                ))
+        record_inventory_deltas(db.sync_session, {
+            product_id: -delta for product_id, delta in deltas.items() if delta
+        })
+    
+    async def release(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        product_ids: Optional[Iterable[int]] = None
+    ) -> Dict[int, int]:
+        """Release a user's holds (all of them, or on some products)
+        
+        Returns the units released per product. The hold rows are deleted
+        first, so a concurrent sweep cannot release the same hold twice.
+        """
+        statement = delete(StockReservation).where(StockReservation.user_id == user_id)
+        if product_ids is not None:
+            statement = statement.where(StockReservation.product_id.in_(list(product_ids)))
+        result = await db.execute(
+            statement.returning(StockReservation.product_id, StockReservation.quantity)
+        )
+        released = dict(result.all())
+        if released:
+            await db.execute(RELEASE, [
+                {"product_id": product_id, "quantity": quantity} for product_id, quantity in released.items()
+            ])
+            record_inventory_deltas(db.sync_session, released)
+        return released
+    
+    async def release_expired(
+        self,
+        db: AsyncSession,
+        now: Optional[datetime] = None,
+        limit: int = SWEEP_BATCH_SIZE
+    ) -> int:
+        """Release up to limit expired holds and commit; returns the number released"""
+        expired = (
+            select(StockReservation.id)
+            .where(StockReservation.expires_at <= (now or datetime.utcnow()))
+            .order_by(StockReservation.expires_at)
+            .limit(limit)
+        )
+        try:
+            result = await db.execute(
+                delete(StockReservation)
+                .where(StockReservation.id.in_(expired))
+                .returning(StockReservation.product_id, StockReservation.quantity)
+            )
+            released: Dict[int, int] = {}
+            count = 0
+            for product_id, quantity in result:
+                released[product_id] = released.get(product_id, 0) + quantity
+                count += 1
+            if released:
+                await db.execute(RELEASE, [
+                    {"product_id": product_id, "quantity": quantity} for product_id, quantity in released.items()
+                ])
+                record_inventory_deltas(db.sync_session, released)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        return count
+
+class ReservationSweeper:
+    """Background task releasing expired holds every interval seconds"""
+    
+    def __init__(self, service: ReservationService, interval: float = 5):
+        self.service = service
+        self.interval = interval
+        self.released = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start sweeping on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the sweep task and wait for it to finish"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def sweep(self) -> int:
+        """Release every expired hold, in batches"""
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                count = await self.service.release_expired(db)
+            total += count
+            if count < SWEEP_BATCH_SIZE:
+                break
+        self.released += total
+        return total
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Releasing expired stock reservations failed")
+
+reservation_service = ReservationService()
+reservation_sweeper = ReservationSweeper(reservation_service, interval=settings.RESERVATION_SWEEP_INTERVAL)
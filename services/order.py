@@ -1,11 +1,85 @@
 """
 Order management service
 """
-from sqlalchemy.orm import Session
-from typing import List
+import asyncio
+import base64
+import json
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select, insert, update, delete, case, literal, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload
+from typing import Any, Dict, List, Optional, Tuple
 
-from core.database import Order, OrderItem, CartItem
-from services.cart import CartService
+from core.database import Order, OrderItem, CartItem, Product, StockReservation
+from services.cart import CartService, cart_store
+from services.facets import price_band, record_facet_moves
+from services.inventory import OutOfStockError, record_inventory_deltas
+from services.product import record_catalog_writes
+
+# Loader profile for rendering orders: items in one extra query for all
+# orders, each item's product joined into it.
+ORDER_DETAIL_LOAD = (selectinload(Order.items).joinedload(OrderItem.product),)
+
+_products = Product.__table__
+
+# SQLite has one writer at a time, and a connection waiting for the lock
+# polls in sleeps of up to 100ms, so the database sits idle while
+# waiters sleep. This process's checkouts queue for their writes here
+# instead; other backends lock rows and need nothing.
+_sqlite_checkout_lock = asyncio.Lock()
+
+def checkout_lock(db: AsyncSession):
+    """Context manager serializing checkout writes on SQLite"""
+    return _sqlite_checkout_lock if db.bind.dialect.name == "sqlite" else nullcontext()
+
+def stock_decrement(quantities: Dict[int, int], held: Dict[int, int]):
+    """One conditional UPDATE taking stock for every order line
+    
+    held is the shopper's own holds, released by the same statement. A
+    row only matches while enough unreserved stock is left, and matched
+    rows are returned with their new stock, so a short line is a
+    missing row and sold-out products need no second query.
+    """
+    product_ids = sorted(set(quantities) | set(held))
+    quantity = case(quantities, value=_products.c.id, else_=0) if quantities else literal(0)
+    released = case(held, value=_products.c.id, else_=0) if held else literal(0)
+    return (
+        update(_products)
+        .where(
+            _products.c.id.in_(product_ids),
+            _products.c.stock_quantity - _products.c.reserved_quantity + released >= quantity
+        )
+        .values(
+            stock_quantity=_products.c.stock_quantity - quantity,
+            reserved_quantity=_products.c.reserved_quantity - released
+        )
+        .returning(
+            _products.c.id, _products.c.stock_quantity, _products.c.category_id,
+            _products.c.price, _products.c.is_featured, _products.c.is_active
+        )
+    )
+
+@dataclass
+class OrderHistoryPage:
+    """One page of order summaries plus the cursor for the next page"""
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+def encode_order_cursor(created_at: datetime, order_id: int) -> str:
+    """Encode the last order on a page as an opaque URL-safe token"""
+    raw = json.dumps([created_at.isoformat(), order_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_order_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor into (created_at, order id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor")
 
 class OrderService:
     """Service for order management"""
@@ -13,61 +87,150 @@ class OrderService:
     def __init__(self):
         self.cart_service = CartService()
     
-    def create_order_from_cart(
+    async def create_order_from_cart(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         user_id: int, 
         shipping_address: str
     ) -> Order:
-        """Create order from user's cart"""
-        # Get cart items
-        cart_items = self.cart_service.get_cart_items(db, user_id)
-        if not cart_items:
-            raise ValueError("Cart is empty")
+        """Create order from user's cart
         
-        # Calculate total
-        total_amount = self.cart_service.calculate_total(cart_items)
+        Stock is decremented, the order and its items inserted and the cart
+        cleared in one transaction. The shopper's holds are consumed and each
+        decrement is conditional on enough unreserved stock remaining, so
+        concurrent checkouts cannot oversell or take stock held for other
+        carts; if any line falls short nothing is written and
+        OutOfStockError is raised.
+        """
+        # Pending write-behind cart changes are written first
+        await self.cart_service.persist(user_id)
+        try:
+            cart_items = await self.cart_service.load_cart_items(db, user_id)
+            if not cart_items:
+                raise ValueError("Cart is empty")
+            async with checkout_lock(db):
+                try:
+                    order = await self._write_order(db, user_id, shipping_address, cart_items)
+                    await db.commit()
+                except Exception:
+                    # Still holding the lock, so the next checkout never
+                    # waits on this transaction
+                    await db.rollback()
+                    raise
+        finally:
+            cart_store.discard(user_id)
+        return order
+    
+    async def _write_order(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        shipping_address: str,
+        cart_items: List[CartItem]
+    ) -> Order:
+        """Take the stock and write the order (five statements, no reads)"""
+        quantities = {}
+        for item in cart_items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        # The shopper's holds are consumed: their rows deleted here, their
+        # units released by the statement that takes the stock
+        result = await db.execute(
+            delete(StockReservation)
+            .where(StockReservation.user_id == user_id)
+            .returning(StockReservation.product_id, StockReservation.quantity)
+        )
+        held = {}
+        for product_id, quantity in result:
+            held[product_id] = held.get(product_id, 0) + quantity
+        taken = (await db.execute(stock_decrement(quantities, held))).all()
+        if len(taken) != len(set(quantities) | set(held)):
+            matched = {row.id for row in taken}
+            raise OutOfStockError(sorted(product_id for product_id in quantities if product_id not in matched))
+        record_inventory_deltas(db.sync_session, {
+            product_id: held.get(product_id, 0) - quantities.get(product_id, 0)
+            for product_id in set(quantities) | set(held)
+        })
         
-        # Create order
         order = Order(
             user_id=user_id,
-            total_amount=total_amount,
+            total_amount=self.cart_service.calculate_total(cart_items),
             shipping_address=shipping_address,
             status="pending"
         )
         db.add(order)
-        db.commit()
-        db.refresh(order)
-        
-        # Create order items
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-            db.add(order_item)
+        await db.flush()
         
-        # Clear cart
-        self.cart_service.clear_cart(db, user_id)
+        await db.execute(insert(OrderItem), [
+            {
+                "order_id": order.id,
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "price": item.product.price,
+            }
+            for item in cart_items
+        ])
+        await db.execute(delete(CartItem).where(CartItem.user_id == user_id))
         
-        db.commit()
+        # The statements above bypass the ORM, so tell the catalog cache
+        # and facet counts what changed; both act on commit
+        record_catalog_writes(db.sync_session, "products")
+        record_facet_moves(db.sync_session, [
+            ((row.category_id, price_band(row.price), True, bool(row.is_featured)),
+             (row.category_id, price_band(row.price), False, bool(row.is_featured)))
+            for row in taken
+            if row.stock_quantity <= 0 and row.stock_quantity + quantities.get(row.id, 0) > 0
+            and (row.is_active is None or row.is_active)
+        ])
         return order
     
-    def get_user_orders(self, db: Session, user_id: int) -> List[Order]:
-        """Get all orders for user"""
-        return db.query(Order).filter(Order.user_id == user_id).all()
+    async def get_order_history(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> OrderHistoryPage:
+        """One page of a user's orders as summary rows, newest first
+        
+        A single query walks the (user_id, created_at) index; item counts
+        come from a correlated aggregate over each order's items, so no
+        order or item objects are loaded. Raises ValueError for a bad
+        cursor.
+        """
+        item_count = (
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .where(OrderItem.order_id == Order.id)
+            .scalar_subquery()
+        )
+        query = (
+            select(Order.id, Order.status, Order.total_amount, item_count.label("item_count"), Order.created_at)
+            .where(Order.user_id == user_id)
+            .order_by(Order.created_at.desc(), Order.id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            created_at, order_id = decode_order_cursor(cursor)
+            query = query.where(tuple_(Order.created_at, Order.id) < (created_at, order_id))
+        
+        rows = (await db.execute(query)).all()
+        items = [dict(row._mapping) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_order_cursor(items[-1]["created_at"], items[-1]["id"])
+        return OrderHistoryPage(items=items, next_cursor=next_cursor)
     
-    def get_order(self, db: Session, order_id: int) -> Order:
-        """Get single order by ID"""
-        return db.query(Order).filter(Order.id == order_id).first()
+    async def get_order(self, db: AsyncSession, order_id: int, user_id: Optional[int] = None) -> Order:
+        """Get single order by ID, with its items (optionally only if owned by user_id)"""
+        query = select(Order).options(*ORDER_DETAIL_LOAD).where(Order.id == order_id)
+        if user_id is not None:
+            query = query.where(Order.user_id == user_id)
+        result = await db.execute(query)
+        return result.scalars().first()
     
-    def update_order_status(self, db: Session, order_id: int, status: str) -> Order:
+    async def update_order_status(self, db: AsyncSession, order_id: int, status: str) -> Order:
         """Update order status"""
-        order = self.get_order(db, order_id)
+        order = await self.get_order(db, order_id)
         if order:
             order.status = status
-            db.commit()
-            db.refresh(order)
-        return order
\ No newline at end of file
+            await db.commit()
+        return order
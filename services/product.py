@@ -1,70 +1,462 @@
 """
 Product service for managing products and categories
 """
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import base64
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select, event, text, or_, func, tuple_, bindparam, Integer, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from typing import Any, Dict, Hashable, List, Optional, Tuple
 
 from core.database import Product, Category
+from services.facets import PRICE_BANDS, PRICE_BAND_KEYS, facet_index, facet_cells_query, price_band_filter, FacetCube
+from app.config import settings
+
+_MISSING = object()
+
+# Loader profile for the product detail page, which shows the category
+PRODUCT_DETAIL_LOAD = (joinedload(Product.category),)
+
+class CatalogCache:
+    """Read-through cache for catalog queries with TTL and LRU eviction
+    
+    Keys are tuples whose first element is a namespace ("products" or
+    "categories") so writes can drop only the entries they affect.
+    Cached ORM objects are detached once their session closes and must be
+    treated as read-only.
+    """
+    
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple[Hashable, ...]) -> Any:
+        """Return the cached value for key, or _MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: Tuple[Hashable, ...], value: Any):
+        """Store value under key, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, *namespaces: str):
+        """Drop entries in the given namespaces (all entries if none given)"""
+        with self._lock:
+            if namespaces:
+                for key in [k for k in self._entries if k[0] in namespaces]:
+                    del self._entries[key]
+            else:
+                self._entries.clear()
+            self.version += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "version": self.version,
+        }
+
+catalog_cache = CatalogCache(
+    max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    ttl=settings.CATALOG_CACHE_TTL
+)
+
+def record_catalog_writes(session: Session, *namespaces: str):
+    """Mark namespaces as written by SQL the flush hook cannot see
+    
+    For bulk UPDATE/INSERT statements run through session.execute(); the
+    namespaces are invalidated when the session commits, like tracked
+    ORM writes.
+    """
+    session.info.setdefault("catalog_namespaces", set()).update(namespaces)
+
+@event.listens_for(Session, "after_flush")
+def _track_catalog_writes(session, flush_context):
+    """Remember which catalog namespaces a session has written to"""
+    touched = session.info.setdefault("catalog_namespaces", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Category):
+            # Listings filter and display by category, so drop both
+            touched.update(("categories", "products"))
+        elif isinstance(obj, Product):
+            touched.add("products")
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_catalog_on_commit(session):
+    """Invalidate cached catalog reads once written data is committed"""
+    touched = session.info.pop("catalog_namespaces", None)
+    if touched:
+        catalog_cache.invalidate(*touched)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_writes(session):
+    """Forget tracked writes that were rolled back"""
+    session.info.pop("catalog_namespaces", None)
+
+_SEARCH_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def _fts_query(search: str) -> Optional[str]:
+    """Turn free text into an FTS5 query of ANDed prefix terms"""
+    tokens = _SEARCH_TOKEN.findall(search)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+# Keyset sort orders: name -> (sort column, descending). Product.id is
+# always appended as the tie-breaker so every position is unique.
+PRODUCT_SORTS = {
+    "newest": (Product.created_at, True),
+    "price_asc": (Product.price, False),
+    "price_desc": (Product.price, True),
+    "relevance": (None, False),  # bm25 rank, only when searching
+}
+
+@dataclass
+class ProductPage:
+    """One keyset page of products"""
+    items: List[Product]
+    sort: str
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+def encode_cursor(sort: str, direction: str, value: Any, product_id: int) -> str:
+    """Encode a page boundary as an opaque URL-safe token"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, direction, value, product_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[str, Any, int]:
+    """Decode a cursor into (direction, sort value, product id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, direction, value, product_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort or direction not in ("next", "prev"):
+            raise ValueError
+        if sort == "newest":
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, (int, float)):
+            raise ValueError
+        return direction, value, int(product_id)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor")
 
 class ProductService:
     """Service for product management"""
     
-    def get_products(
+    async def get_products(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         category: Optional[str] = None,
         search: Optional[str] = None,
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        price: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        featured: Optional[bool] = None
     ) -> List[Product]:
         """Get products with optional filtering"""
-        query = db.query(Product).filter(Product.is_active == True)
+        query, rank = self._filtered_query(db, category, search, price, in_stock, featured)
+        if rank is not None:
+            query = query.order_by(rank)
+        
+        result = await db.execute(query.offset(skip).limit(limit))
+        return list(result.scalars().all())
+    
+    async def get_product_page(
+        self,
+        db: AsyncSession,
+        category: Optional[str] = None,
+        search: Optional[str] = None,
+        sort: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 24,
+        with_total: bool = False,
+        price: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        featured: Optional[bool] = None
+    ) -> ProductPage:
+        """Get one page of products using keyset (cursor) pagination
+        
+        Raises ValueError for an unknown sort, price band or a malformed
+        cursor.
+        """
+        query, rank = self._filtered_query(db, category, search, price, in_stock, featured)
+        
+        sort = sort or ("relevance" if rank is not None else "newest")
+        if sort not in PRODUCT_SORTS:
+            raise ValueError(f"Unknown sort: {sort}")
+        if sort == "relevance" and rank is None:
+            sort = "newest"
+        key, descending = PRODUCT_SORTS[sort]
+        if key is None:
+            key = rank
+        
+        backwards = False
+        if cursor:
+            direction, value, last_id = decode_cursor(cursor, sort)
+            backwards = direction == "prev"
+            boundary = tuple_(key, Product.id)
+            position = tuple_(bindparam(None, value, type_=key.type), bindparam(None, last_id, type_=Integer))
+            query = query.where(boundary < position if descending != backwards else boundary > position)
+        
+        reverse = descending != backwards
+        query = query.add_columns(key).order_by(
+            key.desc() if reverse else key.asc(),
+            Product.id.desc() if reverse else Product.id.asc()
+        )
+        rows = (await db.execute(query.limit(limit + 1))).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+        
+        page = ProductPage(items=[product for product, _ in rows], sort=sort)
+        if rows:
+            first, last = rows[0], rows[-1]
+            if has_more or backwards:
+                page.next_cursor = encode_cursor(sort, "next", last[1], last[0].id)
+            if cursor and (has_more or not backwards):
+                page.prev_cursor = encode_cursor(sort, "prev", first[1], first[0].id)
+        
+        if with_total:
+            page.total = await self.count_products(
+                db,
+                category=category,
+                search=search,
+                price=price,
+                in_stock=in_stock,
+                featured=featured
+            )
+        return page
+    
+    async def count_products(
+        self,
+        db: AsyncSession,
+        category: Optional[str] = None,
+        search: Optional[str] = None,
+        price: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        featured: Optional[bool] = None
+    ) -> int:
+        """Count products matching the filters (cached per catalog version)"""
+        key = ("products", "count", category, search, price, in_stock, featured)
+        total = catalog_cache.get(key)
+        if total is _MISSING:
+            query, _ = self._filtered_query(db, category, search, price, in_stock, featured)
+            result = await db.execute(select(func.count()).select_from(query.subquery()))
+            total = result.scalar_one()
+            catalog_cache.set(key, total)
+        return total
+    
+    async def get_facets(
+        self,
+        db: AsyncSession,
+        category: Optional[str] = None,
+        search: Optional[str] = None,
+        price: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        featured: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """Facet values with product counts for the current selection
+        
+        Counts come from a facet cube built with one aggregated query. The
+        catalog-wide cube is kept current by product writes and rebuilt
+        after CATALOG_CACHE_TTL; a cube for a search is cached until the
+        next product write.
+        """
+        if price and price not in PRICE_BAND_KEYS:
+            raise ValueError(f"Unknown price band: {price}")
+        
+        if search:
+            key = ("products", "facets", search)
+            cube = catalog_cache.get(key)
+            if cube is _MISSING:
+                query, _ = self._filtered_query(db, None, search)
+                cube = FacetCube((await db.execute(facet_cells_query(query))).all())
+                catalog_cache.set(key, cube)
+        else:
+            cube = facet_index.current()
+            if cube is None:
+                generation = facet_index.generation
+                query = select(Product).where(Product.is_active == True)
+                rows = (await db.execute(facet_cells_query(query))).all()
+                cube = facet_index.load(rows, generation)
+        
+        categories = await self.get_categories(db)
+        category_id = None
+        if category:
+            # An unknown category matches nothing
+            category_id = next((c.id for c in categories if c.name == category), -1)
+        counts = cube.counts(category_id=category_id, price=price, in_stock=in_stock, featured=featured)
+        
+        return {
+            "total": counts["total"],
+            "category": [
+                {"value": c.name, "label": c.name, "count": counts["category"].get(c.id, 0), "selected": c.name == category}
+                for c in categories
+            ],
+            "price": [
+                {"value": key, "label": label, "count": counts["price"].get(key, 0), "selected": key == price}
+                for key, label, _, _ in PRICE_BANDS
+            ],
+            "in_stock": {"count": counts["in_stock"].get(True, 0), "selected": in_stock is True},
+            "featured": {"count": counts["featured"].get(True, 0), "selected": featured is True},
+        }
+    
+    def _filtered_query(
+        self,
+        db: AsyncSession,
+        category: Optional[str],
+        search: Optional[str],
+        price: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        featured: Optional[bool] = None
+    ):
+        """Build the active-product query for the filters
+        
+        Returns the query and the search rank column (None when not ranking).
+        """
+        query = select(Product).where(Product.is_active == True)
         
         if category:
-            query = query.join(Category).filter(Category.name == category)
+            query = query.join(Category).where(Category.name == category)
+        
+        if price:
+            query = query.where(price_band_filter(price))
+        
+        # Unset stock/featured values count as out of stock/not featured,
+        # matching the facet cells
+        if in_stock:
+            query = query.where(Product.stock_quantity > 0)
+        elif in_stock is not None:
+            query = query.where(or_(Product.stock_quantity <= 0, Product.stock_quantity.is_(None)))
+        
+        if featured:
+            query = query.where(Product.is_featured == True)
+        elif featured is not None:
+            query = query.where(or_(Product.is_featured == False, Product.is_featured.is_(None)))
         
         if search:
-            query = query.filter(Product.name.contains(search))
+            return self._apply_search(db, query, search)
+        return query, None
+    
+    def _apply_search(self, db: AsyncSession, query, search: str):
+        """Restrict query to products matching search
+        
+        Returns the query and its relevance column (lower is better), or
+        None when the backend has no ranking.
+        """
+        if db.bind.dialect.name != "sqlite":
+            pattern = f"%{search}%"
+            return query.where(or_(
+                Product.name.ilike(pattern),
+                Product.description.ilike(pattern)
+            )), None
+        
+        fts_query = _fts_query(search)
+        if fts_query is None:
+            return query.where(False), None
         
-        return query.offset(skip).limit(limit).all()
+        # bm25 ranks lower-is-better; weight name over category over description
+        matches = text(
+            "SELECT rowid AS product_id, bm25(products_fts, 10.0, 1.0, 3.0) AS rank "
+            "FROM products_fts WHERE products_fts MATCH :fts_query"
+        ).bindparams(fts_query=fts_query).columns(
+            product_id=Integer, rank=Float
+        ).subquery("matches")
+        return query.join(matches, matches.c.product_id == Product.id), matches.c.rank
     
-    def get_product(self, db: Session, product_id: int) -> Optional[Product]:
+    async def get_product(self, db: AsyncSession, product_id: int) -> Optional[Product]:
         """Get single product by ID"""
-        return db.query(Product).filter(
-            Product.id == product_id,
-            Product.is_active == True
-        ).first()
+        result = await db.execute(
+            select(Product)
+            .options(*PRODUCT_DETAIL_LOAD)
+            .where(
+                Product.id == product_id,
+                Product.is_active == True
+            )
+        )
+        return result.scalars().first()
     
-    def get_featured_products(self, db: Session, limit: int = 8) -> List[Product]:
+    async def get_featured_products(self, db: AsyncSession, limit: int = 8) -> List[Product]:
         """Get featured products"""
-        return db.query(Product).filter(
-            Product.is_featured == True,
-            Product.is_active == True
-        ).limit(limit).all()
+        key = ("products", "featured", limit)
+        products = catalog_cache.get(key)
+        if products is _MISSING:
+            result = await db.execute(
+                select(Product).where(
+                    Product.is_featured == True,
+                    Product.is_active == True
+                ).limit(limit)
+            )
+            products = list(result.scalars().all())
+            catalog_cache.set(key, products)
+        return products
     
-    def get_related_products(
+    async def get_related_products(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         category_id: int, 
         exclude_id: int,
         limit: int = 4
     ) -> List[Product]:
         """Get related products from same category"""
-        return db.query(Product).filter(
-            Product.category_id == category_id,
-            Product.id != exclude_id,
-            Product.is_active == True
-        ).limit(limit).all()
+        result = await db.execute(
+            select(Product).where(
+                Product.category_id == category_id,
+                Product.id != exclude_id,
+                Product.is_active == True
+            ).limit(limit)
+        )
+        return list(result.scalars().all())
     
-    def get_categories(self, db: Session) -> List[Category]:
+    async def get_categories(self, db: AsyncSession) -> List[Category]:
         """Get all categories"""
-        return db.query(Category).all()
+        key = ("categories", "all")
+        categories = catalog_cache.get(key)
+        if categories is _MISSING:
+            result = await db.execute(select(Category))
+            categories = list(result.scalars().all())
+            catalog_cache.set(key, categories)
+        return categories
     
-    def update_stock(self, db: Session, product_id: int, quantity_change: int):
+    async def update_stock(self, db: AsyncSession, product_id: int, quantity_change: int):
         """Update product stock quantity"""
-        product = self.get_product(db, product_id)
+        product = await self.get_product(db, product_id)
         if product:
             product.stock_quantity += quantity_change
-            db.commit()
-            db.refresh(product)
-        return product
\ No newline at end of file
+            # The commit hook invalidates the "products" namespace
+            await db.commit()
+        return product
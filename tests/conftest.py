@@ -0,0 +1,80 @@
+"""
+Shared fixtures: the app against a scratch SQLite database
+"""
+import os
+import tempfile
+import uuid
+
+# Settings are read at import, so the environment is set before the app loads
+_workdir = tempfile.mkdtemp(prefix="luxecloth-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'tests.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+# Per-request X-Query-Count headers for the query budgets
+os.environ["DEBUG"] = "True"
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RATE_LIMIT_ENABLED"] = "False"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.database import SessionLocal, Category, Product, User
+
+@pytest.fixture(scope="session")
+def client():
+    """The app with its lifespan running (database created and seeded)"""
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def run(client):
+    """Run an async function on the app's event loop: run(fn, *args)"""
+    return client.portal.call
+
+def _make_user() -> int:
+    """A user row (no usable password); returns its id"""
+    db = SessionLocal()
+    try:
+        user = User(email=f"{uuid.uuid4().hex}@example.com", full_name="Test Shopper", hashed_password="-")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def _make_category(products) -> str:
+    """A category holding products given as dicts of Product fields; returns its name"""
+    db = SessionLocal()
+    try:
+        category = Category(name=f"Test {uuid.uuid4().hex[:8]}")
+        db.add(category)
+        db.flush()
+        for fields in products:
+            db.add(Product(name="Test product", description="", category_id=category.id, **fields))
+        db.commit()
+        return category.name
+    finally:
+        db.close()
+
+def _make_product(stock_quantity: int, price: float = 100.0) -> int:
+    """A product in a category of its own; returns its id"""
+    name = _make_category([{"price": price, "stock_quantity": stock_quantity}])
+    db = SessionLocal()
+    try:
+        return db.query(Product.id).join(Category).filter(Category.name == name).scalar()
+    finally:
+        db.close()
+
+@pytest.fixture
+def make_user(client):
+    return _make_user
+
+@pytest.fixture
+def make_category(client):
+    return _make_category
+
+@pytest.fixture
+def make_product(client):
+    return _make_product
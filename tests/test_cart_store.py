@@ -0,0 +1,95 @@
+"""
+Write-behind cart store: changes reach the database, holds follow them
+"""
+import pytest
+
+from core.database import AsyncSessionLocal, SessionLocal, CartItem, Product, StockReservation
+from services import cart as cart_module
+from services.cart import WriteBehindCartStore, _set_line
+from services.inventory import OutOfStockError, reservation_service
+
+@pytest.fixture
+def store(client):
+    # Not started: tests flush explicitly
+    return WriteBehindCartStore(enabled=True, flush_interval=3600)
+
+@pytest.fixture
+def line(run, make_user, make_product):
+    """(user id, product id, cart item id) for a one-unit line with its hold"""
+    user_id, product_id = make_user(), make_product(stock_quantity=5)
+
+    async def add():
+        async with AsyncSessionLocal() as db:
+            await reservation_service.hold(db, user_id, product_id, 1)
+            item = CartItem(user_id=user_id, product_id=product_id, quantity=1)
+            db.add(item)
+            await db.commit()
+            return item.id
+
+    return user_id, product_id, run(add)
+
+async def _set(store, user_id, cart_item_id, quantity):
+    async with AsyncSessionLocal() as db:
+        return await store.apply(db, user_id, _set_line(cart_item_id, quantity))
+
+def _stored(user_id, product_id):
+    """(cart quantity, held quantity, reserved on the product) in the database"""
+    db = SessionLocal()
+    try:
+        quantity = db.query(CartItem.quantity).filter(CartItem.user_id == user_id).scalar()
+        held = db.query(StockReservation.quantity).filter(
+            StockReservation.user_id == user_id, StockReservation.product_id == product_id
+        ).scalar()
+        reserved = db.query(Product.reserved_quantity).filter(Product.id == product_id).scalar()
+        return quantity, held, reserved
+    finally:
+        db.close()
+
+def test_changes_are_written_on_flush(run, store, line):
+    user_id, product_id, cart_item_id = line
+    run(_set, store, user_id, cart_item_id, 2)
+    run(_set, store, user_id, cart_item_id, 4)
+    # Increases are held right away; the line itself waits for the flush
+    assert _stored(user_id, product_id) == (1, 4, 4)
+
+    assert run(store.flush) == 1
+    assert _stored(user_id, product_id) == (4, 4, 4)
+    assert store.stats()["dirty_lines"] == 0
+
+def test_decrease_releases_hold_on_flush(run, store, line):
+    user_id, product_id, cart_item_id = line
+    run(_set, store, user_id, cart_item_id, 3)
+    run(_set, store, user_id, cart_item_id, 2)
+    run(store.flush)
+    assert _stored(user_id, product_id) == (2, 2, 2)
+
+def test_stop_writes_pending_removal(run, store, line):
+    user_id, product_id, cart_item_id = line
+    assert run(_set, store, user_id, cart_item_id, 0) == []
+    run(store.stop)
+    assert _stored(user_id, product_id) == (None, None, 0)
+
+def test_failed_flush_keeps_changes_for_the_next(run, store, line, monkeypatch):
+    user_id, product_id, cart_item_id = line
+    run(_set, store, user_id, cart_item_id, 3)
+
+    hold_many = reservation_service.hold_many
+    async def failing(*args, **kwargs):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(cart_module.reservation_service, "hold_many", failing)
+    with pytest.raises(RuntimeError):
+        run(store.flush)
+    # Rolled back as a whole: nothing half written, nothing forgotten
+    assert _stored(user_id, product_id) == (1, 3, 3)
+    assert store.stats()["dirty_lines"] == 1
+
+    monkeypatch.setattr(cart_module.reservation_service, "hold_many", hold_many)
+    assert run(store.flush) == 1
+    assert _stored(user_id, product_id) == (3, 3, 3)
+
+def test_increase_beyond_stock_changes_nothing(run, store, line):
+    user_id, product_id, cart_item_id = line
+    with pytest.raises(OutOfStockError):
+        run(_set, store, user_id, cart_item_id, 6)
+    assert run(store.flush) == 0
+    assert _stored(user_id, product_id) == (1, 1, 1)
@@ -0,0 +1,60 @@
+"""
+Catalog imports: counts, rejected rows and the search index
+"""
+import io
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from core.database import engine
+from scripts.catalog import DeferredSearchIndex, Progress, import_catalog
+
+HEADER = "sku,name,description,price,category,stock_quantity\n"
+
+@pytest.fixture
+def prefix(client):
+    """A sku prefix and search word unique to the test"""
+    return f"imp{uuid.uuid4().hex[:8]}"
+
+def _import(csv_text: str, reindex_above: int = 50000):
+    return import_catalog(engine, io.StringIO(HEADER + csv_text), "csv", 2, Progress("import"), reindex_above)
+
+def _search(word: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT count(*) FROM products_fts WHERE products_fts MATCH :word"), {"word": word}).scalar()
+
+def _triggers() -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN "
+            + str(DeferredSearchIndex.TRIGGERS)
+        )).scalar()
+
+def test_rows_without_category_are_skipped(prefix):
+    stats = _import(
+        f"{prefix}-1,{prefix} scarf,,120,Accessories,3\n"
+        f"{prefix}-2,{prefix} tie,,80,,3\n"
+    )
+    assert stats["inserted"] == 1
+    assert stats["skipped"] == 1
+
+def test_rerun_counts_updated_and_unchanged(prefix):
+    rows = "".join(f"{prefix}-{index},{prefix} coat {index},,500,Outerwear,2\n" for index in range(3))
+    first = _import(rows)
+    assert (first["inserted"], first["updated"], first["unchanged"]) == (3, 0, 0)
+
+    second = _import(rows.replace(f"{prefix} coat 1,,500", f"{prefix} coat 1,,450"))
+    assert (second["inserted"], second["updated"], second["unchanged"]) == (0, 1, 2)
+
+def test_small_import_keeps_search_current(prefix):
+    _import(f"{prefix}-1,{prefix} gloves,,90,Accessories,4\n")
+    assert _search(prefix) == 1
+    assert _triggers() == len(DeferredSearchIndex.TRIGGERS)
+
+def test_large_import_rebuilds_search_at_the_end(prefix):
+    rows = "".join(f"{prefix}-{index},{prefix} belt {index},,60,Accessories,1\n" for index in range(5))
+    assert _import(rows, reindex_above=2)["inserted"] == 5
+    assert _search(prefix) == 5
+    # Triggers are back, so later writes are indexed again
+    assert _triggers() == len(DeferredSearchIndex.TRIGGERS)
@@ -0,0 +1,92 @@
+"""
+Checkout takes stock all or nothing and consumes the shopper's holds
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import func
+
+from core.database import AsyncSessionLocal, SessionLocal, CartItem, OrderItem, Product, StockReservation
+from services.inventory import OutOfStockError, reservation_service
+from services.order import OrderService
+
+order_service = OrderService()
+
+async def _add(user_id: int, product_id: int, quantity: int):
+    async with AsyncSessionLocal() as db:
+        await reservation_service.hold(db, user_id, product_id, quantity)
+        db.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+        await db.commit()
+
+async def _checkout(user_id: int):
+    async with AsyncSessionLocal() as db:
+        order = await order_service.create_order_from_cart(db, user_id, "1 Test Street")
+        return order.id
+
+def _product(product_id: int):
+    """(stock, reserved) for a product"""
+    db = SessionLocal()
+    try:
+        return tuple(db.query(Product.stock_quantity, Product.reserved_quantity).filter(Product.id == product_id).one())
+    finally:
+        db.close()
+
+def _count(model, **filters) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count()).select_from(model).filter_by(**filters).scalar()
+    finally:
+        db.close()
+
+def test_checkout_consumes_holds(run, make_user, make_product):
+    first, second = make_product(stock_quantity=5), make_product(stock_quantity=2, price=20.0)
+    user_id = make_user()
+    run(_add, user_id, first, 3)
+    run(_add, user_id, second, 2)
+    assert _product(first) == (5, 3)
+
+    order_id = run(_checkout, user_id)
+    assert _product(first) == (2, 0)
+    assert _product(second) == (0, 0)
+    assert _count(OrderItem, order_id=order_id) == 2
+    assert _count(CartItem, user_id=user_id) == 0
+    assert _count(StockReservation, user_id=user_id) == 0
+
+def test_short_line_writes_nothing(run, make_user, make_product):
+    plenty, scarce = make_product(stock_quantity=5), make_product(stock_quantity=1)
+    user_id = make_user()
+    run(_add, user_id, plenty, 1)
+    run(_add, user_id, scarce, 1)
+    # The held unit is written off before checkout
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.id == scarce).update({"stock_quantity": 0})
+        db.commit()
+    finally:
+        db.close()
+
+    with pytest.raises(OutOfStockError) as raised:
+        run(_checkout, user_id)
+    assert raised.value.product_ids == [scarce]
+    assert _product(plenty) == (5, 1)
+    assert _count(CartItem, user_id=user_id) == 2
+    assert _count(StockReservation, user_id=user_id) == 2
+
+def test_concurrent_checkouts_never_oversell(run, make_user, make_product):
+    product_id = make_product(stock_quantity=3)
+    users = [make_user() for _ in range(6)]
+    db = SessionLocal()
+    try:
+        # Cart lines without holds, as left by expired reservations
+        db.add_all([CartItem(user_id=user_id, product_id=product_id, quantity=1) for user_id in users])
+        db.commit()
+    finally:
+        db.close()
+
+    async def rush():
+        return await asyncio.gather(*(_checkout(user_id) for user_id in users), return_exceptions=True)
+
+    outcomes = run(rush)
+    assert sum(isinstance(outcome, int) for outcome in outcomes) == 3
+    assert all(isinstance(outcome, (int, OutOfStockError)) for outcome in outcomes)
+    assert _product(product_id) == (0, 0)
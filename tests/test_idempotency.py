@@ -0,0 +1,139 @@
+"""
+Idempotency-Key claims, replays and conflicts
+"""
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from core.database import AsyncSessionLocal, IdempotencyKey
+from services.idempotency import IdempotencyConflict, IdempotencyStore
+
+REQUEST = IdempotencyStore.fingerprint("POST", "/api/orders", b'{"shipping_address": "1 Main St"}')
+OTHER_REQUEST = IdempotencyStore.fingerprint("POST", "/api/orders", b'{"shipping_address": "2 Main St"}')
+
+@pytest.fixture
+def store(client):
+    return IdempotencyStore(ttl=3600, claim_seconds=60)
+
+@pytest.fixture
+def key():
+    return uuid.uuid4().hex
+
+class Handler:
+    """Request handler counting its calls"""
+
+    def __init__(self, status_code: int = 201, body: bytes = b'{"id": 1}', delay: float = 0):
+        self.status_code = status_code
+        self.body = body
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.status_code, self.body
+
+async def _run(store, user_id, key, request_hash, handler):
+    async with AsyncSessionLocal() as db:
+        return await store.run(db, user_id, key, request_hash, handler)
+
+async def _row(user_id, key):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(IdempotencyKey.status_code, IdempotencyKey.body)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        )).one_or_none()
+
+def test_retry_replays_stored_response(run, store, key, make_user):
+    user_id = make_user()
+    handler = Handler()
+
+    assert run(_run, store, user_id, key, REQUEST, handler) == (201, b'{"id": 1}', False)
+    assert run(_run, store, user_id, key, REQUEST, handler) == (201, b'{"id": 1}', True)
+    assert handler.calls == 1
+    assert tuple(run(_row, user_id, key)) == (201, b'{"id": 1}')
+
+    # Replayed from the table once the in-memory copy is gone
+    store.invalidate()
+    assert run(_run, store, user_id, key, REQUEST, handler) == (201, b'{"id": 1}', True)
+    assert handler.calls == 1
+
+def test_key_reused_for_another_request_conflicts(run, store, key, make_user):
+    user_id = make_user()
+    run(_run, store, user_id, key, REQUEST, Handler())
+
+    with pytest.raises(IdempotencyConflict) as raised:
+        run(_run, store, user_id, key, OTHER_REQUEST, Handler())
+    assert not raised.value.in_progress
+    store.invalidate()
+    with pytest.raises(IdempotencyConflict):
+        run(_run, store, user_id, key, OTHER_REQUEST, Handler())
+
+def test_keys_are_scoped_per_user(run, store, key, make_user):
+    first, second = make_user(), make_user()
+    handler = Handler()
+    run(_run, store, first, key, REQUEST, handler)
+    assert run(_run, store, second, key, REQUEST, handler)[2] is False
+    assert handler.calls == 2
+
+def test_concurrent_retries_run_the_handler_once(run, store, key, make_user):
+    user_id = make_user()
+    handler = Handler(delay=0.05)
+
+    async def race():
+        return await asyncio.gather(*(_run(store, user_id, key, REQUEST, handler) for _ in range(5)))
+
+    outcomes = run(race)
+    assert handler.calls == 1
+    assert sorted(replayed for _, _, replayed in outcomes) == [False, True, True, True, True]
+    assert {(status_code, body) for status_code, body, _ in outcomes} == {(201, b'{"id": 1}')}
+
+def test_claim_held_by_another_process_conflicts(run, store, key, make_user):
+    user_id = make_user()
+    # A second store stands in for another worker mid-request
+    other_worker = IdempotencyStore(ttl=3600, claim_seconds=60)
+
+    async def claim():
+        async with AsyncSessionLocal() as db:
+            return await other_worker._claim(db, user_id, key, REQUEST)
+
+    assert run(claim) is None
+    with pytest.raises(IdempotencyConflict) as raised:
+        run(_run, store, user_id, key, REQUEST, Handler())
+    assert raised.value.in_progress
+
+def test_server_error_releases_the_key(run, store, key, make_user):
+    user_id = make_user()
+    failing = Handler(status_code=503, body=b"unavailable")
+    assert run(_run, store, user_id, key, REQUEST, failing) == (503, b"unavailable", False)
+    assert run(_row, user_id, key) is None
+
+    handler = Handler()
+    assert run(_run, store, user_id, key, REQUEST, handler) == (201, b'{"id": 1}', False)
+    assert handler.calls == 1
+
+@pytest.mark.parametrize("status_code,stored", [(409, False), (404, False), (400, True), (422, True)])
+def test_only_repeatable_client_errors_are_stored(run, store, key, make_user, status_code, stored):
+    user_id = make_user()
+    rejected = Handler(status_code=status_code, body=b'{"detail": "no"}')
+    run(_run, store, user_id, key, REQUEST, rejected)
+    assert (run(_row, user_id, key) is not None) == stored
+
+    # An out-of-stock 409 is not replayed once the stock is back
+    handler = Handler()
+    outcome = run(_run, store, user_id, key, REQUEST, handler)
+    assert outcome[2] == stored
+    assert handler.calls == (0 if stored else 1)
+
+def test_handler_exception_releases_the_key(run, store, key, make_user):
+    user_id = make_user()
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        run(_run, store, user_id, key, REQUEST, broken)
+    assert run(_row, user_id, key) is None
+    assert run(_run, store, user_id, key, REQUEST, Handler())[2] is False
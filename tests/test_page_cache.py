@@ -0,0 +1,18 @@
+"""
+Cached pages are the same for every visitor
+"""
+import pytest
+
+from services.product import catalog_cache
+
+@pytest.mark.parametrize("path", ["/", "/products?sort=newest", "/products?category=Shoes&price=500-1000"])
+def test_forged_host_does_not_reach_cached_page(client, path):
+    catalog_cache.invalidate()
+    forged = client.get(path, headers={"Host": "evil.example"})
+    assert forged.status_code == 200
+    assert "evil.example" not in forged.text
+
+    # Served from the entry the forged request stored
+    response = client.get(path)
+    assert response.headers["etag"] == forged.headers["etag"]
+    assert "evil.example" not in response.text
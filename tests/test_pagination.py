@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination of product listings
+"""
+from datetime import datetime
+
+import pytest
+
+from core.database import AsyncSessionLocal, SessionLocal, Category, Product
+from services.product import ProductService, encode_cursor
+
+product_service = ProductService()
+
+# Ties on price and created_at, so pages must break them on id
+PRICES = [50.0, 75.0, 75.0, 75.0, 120.0, 120.0, 300.0, 40.0, 75.0]
+CREATED = datetime(2026, 1, 1)
+
+@pytest.fixture
+def category(make_category):
+    return make_category([
+        {"price": price, "stock_quantity": 1, "created_at": CREATED if index % 2 else datetime(2026, 1, index + 1)}
+        for index, price in enumerate(PRICES)
+    ])
+
+async def _page(category, sort, cursor=None, limit=2):
+    async with AsyncSessionLocal() as db:
+        return await product_service.get_product_page(db, category=category, sort=sort, cursor=cursor, limit=limit)
+
+def _walk(run, category, sort):
+    """Pages front to back, then back to front"""
+    forward = [run(_page, category, sort)]
+    while forward[-1].next_cursor:
+        forward.append(run(_page, category, sort, forward[-1].next_cursor))
+    backward = [forward[-1]]
+    while backward[-1].prev_cursor:
+        backward.append(run(_page, category, sort, backward[-1].prev_cursor))
+    return forward, backward
+
+def _ids(pages):
+    return [[product.id for product in page.items] for page in pages]
+
+@pytest.mark.parametrize("sort,key,descending", [
+    ("newest", lambda product: (product.created_at, product.id), True),
+    ("price_asc", lambda product: (product.price, product.id), False),
+    ("price_desc", lambda product: (product.price, product.id), True),
+])
+def test_pages_cover_every_product_once_in_order(run, category, sort, key, descending):
+    everything = run(_page, category, sort, None, 100).items
+    expected = [product.id for product in sorted(everything, key=key, reverse=descending)]
+    assert len(expected) == len(PRICES)
+
+    forward, backward = _walk(run, category, sort)
+    assert sum(_ids(forward), []) == expected
+    # Previous links lead back through the same pages
+    assert _ids(backward) == _ids(forward)[::-1]
+    assert forward[0].prev_cursor is None
+    assert forward[-1].next_cursor is None
+
+def test_pages_stay_put_when_products_are_added(run, category):
+    first = run(_page, category, "price_asc")
+    second = run(_page, category, "price_asc", first.next_cursor)
+    # A product sorting before the cursor does not shift later pages
+    db = SessionLocal()
+    try:
+        category_id = db.query(Category.id).filter(Category.name == category).scalar()
+        db.add(Product(name="Cheaper", description="", price=1.0, stock_quantity=1, category_id=category_id))
+        db.commit()
+    finally:
+        db.close()
+    assert run(_page, category, "price_asc").items[0].price == 1.0
+    assert _ids([run(_page, category, "price_asc", first.next_cursor)]) == _ids([second])
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    encode_cursor("price_asc", "sideways", 10.0, 1),
+    encode_cursor("price_asc", "next", "ten", 1),
+])
+def test_malformed_cursor_is_rejected(run, category, cursor):
+    with pytest.raises(ValueError):
+        run(_page, category, "price_asc", cursor)
+
+def test_cursor_from_another_sort_is_rejected(run, category):
+    page = run(_page, category, "price_asc")
+    with pytest.raises(ValueError):
+        run(_page, category, "newest", page.next_cursor)
@@ -0,0 +1,53 @@
+"""
+Storefront pages stay within their SQL query budgets
+
+Each page is rendered for a signed-in shopper whose cart spans every
+category, with a cold catalog cache, and the X-Query-Count header is
+compared against the page's budget. A page that lazy loads per row (an
+N+1) blows its budget.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from core.database import SessionLocal, CartItem, Product, User
+from services.facets import facet_index
+from services.product import catalog_cache
+
+# Page -> maximum statements for one cold-cache render
+QUERY_BUDGETS = {
+    "/": 2,                     # featured products, categories
+    "/products": 3,             # page, facet counts, categories
+    "/products?category=Shoes": 3,
+    "/products?search=leather": 3,
+    "/product/1": 2,            # product with category, related products
+    "/cart": 1,                 # cart lines with products and categories
+}
+
+CART_LINES = 6
+
+@pytest.fixture(scope="module")
+def shopper(client):
+    """A client signed in as a shopper with CART_LINES cart lines"""
+    shopper = TestClient(client.app)
+    shopper.post("/register", data={
+        "email": "budget@example.com", "password": "budget-check", "full_name": "Budget Check"
+    })
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == "budget@example.com").one()
+        for product in db.query(Product).order_by(Product.id).limit(CART_LINES):
+            db.add(CartItem(user_id=user.id, product_id=product.id, quantity=1))
+        db.commit()
+    finally:
+        db.close()
+    return shopper
+
+@pytest.mark.parametrize("path,budget", QUERY_BUDGETS.items())
+def test_page_within_query_budget(shopper, path, budget):
+    catalog_cache.invalidate()
+    facet_index.invalidate()
+    response = shopper.get(path)
+    assert response.status_code == 200
+    assert "Something went wrong" not in response.text
+    count = int(response.headers["x-query-count"])
+    assert count <= budget, f"{path} ran {count} statements (budget {budget}); see /debug/sql"
@@ -0,0 +1,46 @@
+"""
+Rate limiting keys clients on addresses they cannot forge
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.rate_limit import MemoryBackend, RateLimiter, RateLimitMiddleware
+
+def _client(**options) -> TestClient:
+    """An app allowing each client 2 requests, behind RateLimitMiddleware"""
+    app = FastAPI()
+
+    @app.get("/")
+    async def index():
+        return {}
+
+    limiter = RateLimiter(limit=2, window=3600, backend=MemoryBackend())
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, **options)
+    return TestClient(app)
+
+def _statuses(client: TestClient, headers_per_request):
+    return [client.get("/", headers=headers).status_code for headers in headers_per_request]
+
+def test_forged_forwarded_for_is_ignored_without_trusted_proxies():
+    client = _client()
+    forged = [{"X-Forwarded-For": f"10.0.0.{index}"} for index in range(4)]
+    assert _statuses(client, forged) == [200, 200, 429, 429]
+
+def test_forwarded_for_entry_added_by_trusted_proxy():
+    client = _client(trusted_proxies=1)
+    # The client's own entries come first; the proxy appends the real address
+    requests = [{"X-Forwarded-For": f"10.0.0.{index}, 203.0.113.7"} for index in range(3)]
+    assert _statuses(client, requests) == [200, 200, 429]
+    assert _statuses(client, [{"X-Forwarded-For": "203.0.113.8"}]) == [200]
+
+@pytest.mark.parametrize("forwarded", ["", "203.0.113.7"])
+def test_short_forwarded_chain_falls_back_to_peer(forwarded):
+    client = _client(trusted_proxies=2)
+    assert _statuses(client, [{"X-Forwarded-For": forwarded}, {}, {}]) == [200, 200, 429]
+
+def test_client_ip_header_wins():
+    client = _client(client_ip_header="Fly-Client-IP", trusted_proxies=1)
+    requests = [{"Fly-Client-IP": "198.51.100.4", "X-Forwarded-For": f"10.0.0.{index}"} for index in range(3)]
+    assert _statuses(client, requests) == [200, 200, 429]
+    assert _statuses(client, [{"Fly-Client-IP": "198.51.100.5"}]) == [200]
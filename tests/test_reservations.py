@@ -0,0 +1,100 @@
+"""
+Stock holds and the sweeper that releases expired ones
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from core.database import AsyncSessionLocal, Product, StockReservation
+from services.inventory import OutOfStockError, inventory_counters, reservation_service, reservation_sweeper
+
+async def _hold(user_id: int, product_id: int, quantity: int, hold_seconds=None):
+    async with AsyncSessionLocal() as db:
+        try:
+            await reservation_service.hold_many(db, user_id, {product_id: quantity}, hold_seconds=hold_seconds)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+async def _reserved(product_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Product.reserved_quantity).where(Product.id == product_id))).scalar()
+
+async def _holds(product_id: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(StockReservation.user_id, StockReservation.quantity).where(StockReservation.product_id == product_id)
+        )
+        return dict(result.all())
+
+def test_hold_never_exceeds_stock(run, make_user, make_product):
+    product_id = make_product(stock_quantity=3)
+    first, second = make_user(), make_user()
+
+    run(_hold, first, product_id, 2)
+    with pytest.raises(OutOfStockError) as raised:
+        run(_hold, second, product_id, 2)
+    assert raised.value.product_ids == [product_id]
+    run(_hold, second, product_id, 1)
+
+    assert run(_reserved, product_id) == 3
+    assert run(_holds, product_id) == {first: 2, second: 1}
+
+def test_hold_follows_cart_quantity(run, make_user, make_product):
+    product_id = make_product(stock_quantity=5)
+    user_id = make_user()
+
+    run(_hold, user_id, product_id, 4)
+    run(_hold, user_id, product_id, 1)
+    assert run(_reserved, product_id) == 1
+    run(_hold, user_id, product_id, 0)
+    assert run(_reserved, product_id) == 0
+    assert run(_holds, product_id) == {}
+
+def test_concurrent_holds_share_the_stock(run, make_user, make_product):
+    product_id = make_product(stock_quantity=3)
+    users = [make_user() for _ in range(8)]
+
+    async def race():
+        return await asyncio.gather(*(_hold(user_id, product_id, 1) for user_id in users), return_exceptions=True)
+
+    outcomes = run(race)
+    assert sum(outcome is None for outcome in outcomes) == 3
+    assert all(isinstance(outcome, OutOfStockError) for outcome in outcomes if outcome is not None)
+    assert run(_reserved, product_id) == 3
+    assert len(run(_holds, product_id)) == 3
+
+def test_sweeper_releases_expired_holds_only(run, make_user, make_product):
+    product_id = make_product(stock_quantity=5)
+    expired, current = make_user(), make_user()
+    run(_hold, expired, product_id, 2, -1)
+    run(_hold, current, product_id, 1)
+    assert run(_reserved, product_id) == 3
+
+    assert run(reservation_sweeper.sweep) >= 1
+    assert run(_holds, product_id) == {current: 1}
+    assert run(_reserved, product_id) == 1
+    # Released stock can be held again right away
+    inventory_counters.invalidate(product_id)
+    run(_hold, make_user(), product_id, 4)
+
+def test_release_expired_ignores_holds_released_first(run, make_user, make_product):
+    product_id = make_product(stock_quantity=2)
+    user_id = make_user()
+    run(_hold, user_id, product_id, 2, -1)
+
+    async def release_then_sweep():
+        async with AsyncSessionLocal() as db:
+            released = await reservation_service.release(db, user_id)
+            await db.commit()
+        async with AsyncSessionLocal() as db:
+            swept = await reservation_service.release_expired(db, now=datetime.utcnow() + timedelta(seconds=1))
+        return released, swept
+
+    released, _ = run(release_then_sweep)
+    assert released == {product_id: 2}
+    # Released once, not again by the sweep
+    assert run(_reserved, product_id) == 0